@@ -234,6 +234,32 @@ def create_app():
     with app.app_context():
         init_db(app)
     
+    # Preload the shared embedding model (copy-on-write across forked workers)
+    if app.config.get('PRELOAD_EMBEDDINGS'):
+        from app.utils.embeddings import preload_embeddings
+        preload_embeddings()
+    
+    # Build or load the support chatbot's FAQ index once, before workers fork
+    if app.config.get('PRELOAD_FAQ_INDEX'):
+        try:
+            from app.services.chatbot_service import load_faq_index
+            load_faq_index()
+        except Exception as e:
+            print(f"FAQ index preload failed, will load on first request: {str(e)}")
+    
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+    
+    # Fast 429s when the LLM backend is saturated
+    from flask import jsonify
+    from app.utils.ollama_limiter import OllamaQueueFull
+    
+    @app.errorhandler(OllamaQueueFull)
+    def handle_ollama_queue_full(e):
+        retry_after = int(e.retry_after) + 1
+        return jsonify({'error': str(e), 'retry_after': retry_after}), 429, {'Retry-After': str(retry_after)}
+    
     # Register blueprints (import here to avoid circular imports)
     from app.routes.auth import bp as auth_bp
     from app.routes.chat import bp as chat_bp
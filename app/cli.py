@@ -0,0 +1,69 @@
+"""
+Flask CLI commands (run with `flask <command>`)
+"""
+import click
+
+
+def register_commands(app):
+    """Attach maintenance commands to the app"""
+
+    @app.cli.command('build-faq-index')
+    @click.option('--path', 'document_path', default=None, help='FAQ PDF or directory of PDFs')
+    @click.option('--force', is_flag=True, help='Rebuild even if an index for this PDF exists')
+    def build_faq_index_command(document_path, force):
+        """Build the support chatbot's FAQ index ahead of time."""
+        from app.services.chatbot_service import build_faq_index
+        index_dir = build_faq_index(document_path, force=force)
+        click.echo(f"FAQ index ready at {index_dir}")
+
+    @app.cli.command('migrate-vector-store')
+    @click.option('--path', default=None, help='Legacy pickled store (default: shared_vector_store.pkl)')
+    def migrate_vector_store_command(path):
+        """Convert the legacy pickled vector store into per-user partitions."""
+        from app.models.models import VectorStoreModel
+        counts = VectorStoreModel.migrate_legacy_store(path)
+        click.echo(f"Migrated {sum(counts.values())} documents into {len(counts)} user partitions")
+
+    @app.cli.command('compact-vector-store')
+    def compact_vector_store_command():
+        """Fold segments and drop tombstoned documents in every user partition."""
+        from app.models.models import VectorStoreModel
+        compacted = VectorStoreModel.compact()
+        click.echo(f"Compacted {compacted} partitions")
+
+    @app.cli.command('index-lessons')
+    def index_lessons_command():
+        """Build or refresh the cross-lesson chunk index over all published lessons."""
+        from app.services.lesson.global_index import sync_all
+        checked = sync_all()
+        click.echo(f"Cross-lesson index up to date ({checked} lessons checked)")
+
+    @app.cli.command('backfill-faq-clusters')
+    def backfill_faq_clusters_command():
+        """Fold FAQ questions logged before clustering into their lessons' clusters."""
+        from app.models.models import LessonFAQ
+        folded = LessonFAQ.backfill_centroids()
+        click.echo(f"Folded {folded} FAQ rows into clusters")
+
+    @app.cli.command('db-version')
+    def db_version_command():
+        """Show the applied and latest schema migration versions."""
+        from app.utils.db import db_connection
+        from app.utils.migrations import LATEST_VERSION, get_schema_version
+        with db_connection(app.config['DATABASE']) as conn:
+            current = get_schema_version(conn)
+        click.echo(f"Schema version {current} (latest {LATEST_VERSION})")
+
+    @app.cli.command('prune-conversations')
+    @click.option('--days', type=float, default=None, help='Delete conversations idle longer than this (default: CONVERSATION_RETENTION_DAYS)')
+    @click.option('--max-per-user', type=int, default=None, help='Keep only this many conversations per user (default: CONVERSATION_MAX_PER_USER)')
+    def prune_conversations_command(days, max_per_user):
+        """Apply the conversation retention policy now."""
+        from app.config import Config
+        from app.utils.retention import prune_conversations
+        result = prune_conversations(
+            max_age_days=Config.CONVERSATION_RETENTION_DAYS if days is None else days,
+            max_per_user=Config.CONVERSATION_MAX_PER_USER if max_per_user is None else max_per_user,
+            database=app.config['DATABASE']
+        )
+        click.echo(f"Deleted {result['expired']} expired and {result['over_limit']} over-limit conversations")
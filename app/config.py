@@ -27,5 +27,87 @@ class Config:
     # Database configuration
     DATABASE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'chatbot.db')
     
+    # Per-lesson FAISS indexes (instance/indexes/<lesson_id>/) and their in-memory cache budget
+    INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'indexes')
+    INDEX_CACHE_MB = int(os.getenv('INDEX_CACHE_MB', '256'))
+    
+    # Chunk indexes over each lesson's own content, used to give student Q&A
+    # only the relevant parts: token budget and chunks retrieved per question
+    LESSON_CONTENT_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'content_indexes')
+    LESSON_CONTEXT_TOKENS = int(os.getenv('LESSON_CONTEXT_TOKENS', '1500'))
+    LESSON_CONTEXT_K = int(os.getenv('LESSON_CONTEXT_K', '6'))
+    # Cross-lesson chunk index over the latest public version of every lesson
+    LESSON_GLOBAL_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'lesson_chunks')
+    # Generate summary, key points and FAQs in the background when a lesson
+    # version is finalized (otherwise on first request). Off by default: no
+    # endpoint serves these yet, so precomputing only adds Ollama load.
+    LESSON_ARTIFACTS_PRECOMPUTE = os.getenv('LESSON_ARTIFACTS_PRECOMPUTE', 'false').lower() == 'true'
+    
+    # Semantic answer cache for student questions: on/off, cosine similarity
+    # a new question needs to reuse a cached answer, and entries per lesson
+    ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+    ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.92'))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '500'))
+    
+    # Cosine similarity a student question needs to count toward an existing
+    # FAQ cluster rather than start a new one
+    FAQ_CLUSTER_THRESHOLD = float(os.getenv('FAQ_CLUSTER_THRESHOLD', '0.85'))
+    
+    # Per-user document vectors, one partition directory per user
+    USER_VECTOR_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'vector_store')
+    
+    # Writable directory shared by every worker and replica for cross-process
+    # coordination state (rate limit buckets, Ollama slot locks, chat sessions)
+    COORDINATION_DIR = os.getenv('COORDINATION_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance'))
+    
+    # Shared LLM request rate limits (bucket state kept in its own SQLite file)
+    RATE_LIMIT_DATABASE = os.path.join(COORDINATION_DIR, 'rate_limits.db')
+    USER_REQUESTS_PER_MINUTE = float(os.getenv('USER_REQUESTS_PER_MINUTE', '10'))
+    USER_REQUEST_BURST = float(os.getenv('USER_REQUEST_BURST', '10'))
+    GLOBAL_REQUESTS_PER_MINUTE = float(os.getenv('GLOBAL_REQUESTS_PER_MINUTE', '240'))
+    GLOBAL_REQUEST_BURST = float(os.getenv('GLOBAL_REQUEST_BURST', '40'))
+    # Requests that would wait longer than this get a 429 instead of sleeping
+    RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '5'))
+    
+    # Ollama admission control: concurrent generations across all workers
+    # (match the server's OLLAMA_NUM_PARALLEL), local queue bound and wait limit
+    OLLAMA_SLOT_DIR = os.path.join(COORDINATION_DIR, 'ollama_slots')
+    OLLAMA_MAX_CONCURRENT = int(os.getenv('OLLAMA_NUM_PARALLEL', '2'))
+    OLLAMA_MAX_QUEUE = int(os.getenv('OLLAMA_MAX_QUEUE', '16'))
+    OLLAMA_QUEUE_TIMEOUT = float(os.getenv('OLLAMA_QUEUE_TIMEOUT', '120'))
+    
+    # Teacher chat sessions: messages kept per session, in-memory LRU size,
+    # idle seconds before leaving memory, and days before rows are pruned.
+    # Read replicas serve the chat stream and append to sessions, so they
+    # live in the coordination directory rather than the main database.
+    CHAT_SESSION_DATABASE = os.path.join(COORDINATION_DIR, 'chat_sessions.db')
+    CHAT_SESSION_MAX_MESSAGES = int(os.getenv('CHAT_SESSION_MAX_MESSAGES', '20'))
+    CHAT_SESSION_CACHE_SIZE = int(os.getenv('CHAT_SESSION_CACHE_SIZE', '256'))
+    CHAT_SESSION_IDLE_TTL = float(os.getenv('CHAT_SESSION_IDLE_TTL', '1800'))
+    CHAT_SESSION_RETENTION_DAYS = float(os.getenv('CHAT_SESSION_RETENTION_DAYS', '30'))
+    
+    # LLM prompt budgeting: window override (0 = by model name) and tokens
+    # kept free for the response
+    LLM_CONTEXT_WINDOW = int(os.getenv('LLM_CONTEXT_WINDOW', '0'))
+    LLM_RESPONSE_RESERVE = int(os.getenv('LLM_RESPONSE_RESERVE', '1024'))
+    
+    # Conversation retention (0 disables each rule): days idle before a
+    # conversation is deleted, conversations kept per user, seconds between
+    # runs, and conversations deleted per transaction
+    CONVERSATION_RETENTION_DAYS = float(os.getenv('CONVERSATION_RETENTION_DAYS', '0'))
+    CONVERSATION_MAX_PER_USER = int(os.getenv('CONVERSATION_MAX_PER_USER', '0'))
+    CONVERSATION_RETENTION_INTERVAL = float(os.getenv('CONVERSATION_RETENTION_INTERVAL', '3600'))
+    CONVERSATION_RETENTION_BATCH = int(os.getenv('CONVERSATION_RETENTION_BATCH', '200'))
+    
+    # Threads per worker for off-request work (e.g. conversation summaries)
+    BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', '2'))
+    
     # Nomic API configuration
     NOMIC_API_KEY = os.getenv('NOMIC_API_KEY', 'nk-7Em9YdxJJI09E4vXTxJ9VOC2zygDGWD9eGBYxDLuG0E')  # Replace with your Nomic API key 
+
+    # Load the shared embedding model at app creation so gunicorn --preload
+    # workers inherit the weights instead of loading their own copy
+    PRELOAD_EMBEDDINGS = os.getenv('PRELOAD_EMBEDDINGS', 'true').lower() == 'true'
+    
+    # Load (building if needed) the support chatbot's FAQ index at app creation
+    PRELOAD_FAQ_INDEX = os.getenv('PRELOAD_FAQ_INDEX', 'true').lower() == 'true'
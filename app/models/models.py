@@ -5,17 +5,23 @@ from langchain_nomic import NomicEmbeddings
 from langchain_community.embeddings import HuggingFaceEmbeddings
 
 from langchain_community.vectorstores import FAISS
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import sqlite3
 from datetime import datetime
 import logging
 from app.utils.db import get_db
+from app.utils.embeddings import get_embeddings
+from app.utils.question_clusters import embed_question, to_blob, from_blobs, nearest, merge_centroid
+from app.utils.vector_partitions import PartitionedVectorStore, import_faiss_store
+from app.utils.rate_limiter import llm_rate_limiter, RateLimitError
+from app.utils.ollama_limiter import LimitedChatOllama, OllamaQueueFull
 from app.config import Config
 import pickle
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import httpx
 from httpx import Timeout
 from threading import Lock
+from filelock import FileLock
 import time
 from collections import deque
 import random
@@ -134,12 +140,60 @@ class UserModel:
         return self.get_role() == 'student'
 
 
+# Lesson metadata for list views. The body columns (content, original_content,
+# draft_content, detailed_answer) can each run to hundreds of KB, so listings
+# leave them out and the full row is only loaded for a single lesson.
+LESSON_SUMMARY_COLUMNS = '''l.id, l.teacher_id, l.title, l.summary, l.learning_objectives,
+    l.focus_area, l.grade_level, l.file_name, l.created_at, l.updated_at,
+    l.is_public, l.is_latest, l.has_child_version, l.parent_lesson_id, l.version,
+    l.lesson_id, l.version_number, l.parent_version_id, l.status,
+    COALESCE(l.draft_content, '') != '' AS has_draft'''
+
+
+def _lesson_columns(full: bool) -> str:
+    return 'l.*' if full else LESSON_SUMMARY_COLUMNS
+
+
+# Column weights for bm25(): title, summary, content, focus_area
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+
+
+def _fts_match_query(search_term: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r'\w+', search_term.lower())
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'  # Search-as-you-type
+    return ' '.join(terms)
+
+
 class LessonModel:
     """Lesson model for handling lesson-related database operations"""
     
+    _fts_available = None  # Whether lessons_fts exists, checked once per process
+    
     def __init__(self, lesson_id: Optional[int] = None):
         self.lesson_id = lesson_id
     
+    @staticmethod
+    def _refresh_latest(db, lesson_key: Optional[str], row_id: Optional[int] = None) -> None:
+        """Recompute is_latest for one logical lesson (caller commits)"""
+        if lesson_key:
+            db.execute(
+                '''UPDATE lessons SET is_latest = (id IS (
+                       SELECT id FROM lessons
+                       WHERE lesson_id = ? AND is_public = TRUE
+                       ORDER BY COALESCE(version_number, 1) DESC, id DESC
+                       LIMIT 1
+                   ))
+                   WHERE lesson_id = ?''',
+                (lesson_key, lesson_key)
+            )
+        elif row_id is not None:
+            # Standalone lessons are their own latest version
+            db.execute('UPDATE lessons SET is_latest = is_public WHERE id = ?', (row_id,))
+    
     @staticmethod
     def create_lesson(teacher_id: int, title: str, summary: str, learning_objectives: str,
                      focus_area: str, grade_level: str, content: str, file_name: str = None,
@@ -198,6 +252,7 @@ class LessonModel:
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                         (teacher_id, title, summary, learning_objectives, focus_area, grade_level, content, file_name, is_public, parent_lesson_id, 1, draft_content, lesson_id, version_number, parent_version_id, original_content, status)
                     )
+                    LessonModel._refresh_latest(db, lesson_id, cursor.lastrowid)
                     db.commit()
                     return cursor.lastrowid
                 except sqlite3.IntegrityError as e:
@@ -274,13 +329,16 @@ class LessonModel:
             return None
 
     @staticmethod
-    def get_lessons_by_teacher(teacher_id: int) -> List[Dict[str, Any]]:
-        """Get all lessons created by a specific teacher (including all versions)"""
+    def get_lessons_by_teacher(teacher_id: int, full: bool = False) -> List[Dict[str, Any]]:
+        """Get all lessons created by a specific teacher (including all versions).
+
+        Returns metadata only unless full is set.
+        """
         try:
             db = get_db()
             # Get all lessons for this teacher (originals and all versions)
-            lessons = db.execute('''
-                SELECT l.* FROM lessons l
+            lessons = db.execute(f'''
+                SELECT {_lesson_columns(full)} FROM lessons l
                 WHERE l.teacher_id = ?
                 ORDER BY l.created_at DESC
             ''', (teacher_id,)).fetchall()
@@ -290,11 +348,15 @@ class LessonModel:
             raise
 
     @staticmethod
-    def get_public_lessons(grade_level: str = None, focus_area: str = None) -> List[Dict[str, Any]]:
-        """Get all public lessons with optional filtering (including all versions)"""
+    def get_public_lessons(grade_level: str = None, focus_area: str = None,
+                           full: bool = False) -> List[Dict[str, Any]]:
+        """Get all public lessons with optional filtering (including all versions).
+
+        Returns metadata only unless full is set.
+        """
         try:
             db = get_db()
-            query = '''SELECT l.*, u.username as teacher_name 
+            query = f'''SELECT {_lesson_columns(full)}, u.username as teacher_name 
                       FROM lessons l 
                       JOIN users u ON l.teacher_id = u.id 
                       WHERE l.is_public = TRUE'''
@@ -317,34 +379,21 @@ class LessonModel:
             raise
 
     @staticmethod
-    def get_public_latest_lessons(grade_level: str = None, focus_area: str = None) -> List[Dict[str, Any]]:
-        """Get only the latest public version per logical lesson (grouped by lesson_id)"""
+    def get_public_latest_lessons(grade_level: str = None, focus_area: str = None,
+                                  limit: Optional[int] = None, offset: int = 0,
+                                  full: bool = False) -> List[Dict[str, Any]]:
+        """Get only the latest public version per logical lesson (grouped by lesson_id).
+
+        Returns metadata only unless full is set.
+        """
         try:
             db = get_db()
-            # Handle both old lessons (without lesson_id/version_number) and new lessons (with versioning)
-            # For lessons with lesson_id: get latest version per lesson_id
-            # For lessons without lesson_id: include them as-is (they're standalone)
-            query = '''
-                SELECT l.*, u.username as teacher_name
+            # is_latest is maintained on write, so this is a range scan of idx_lessons_browse
+            query = f'''
+                SELECT {_lesson_columns(full)}, u.username as teacher_name
                 FROM lessons l
                 JOIN users u ON l.teacher_id = u.id
-                WHERE l.is_public = TRUE
-                AND (
-                    -- Lessons with lesson_id: only include if it's the latest version
-                    -- Treat NULL version_number as version 1 for comparison
-                    (l.lesson_id IS NOT NULL AND l.lesson_id != '' 
-                     AND COALESCE(l.version_number, 1) = (
-                         SELECT MAX(COALESCE(version_number, 1))
-                         FROM lessons l2
-                         WHERE l2.lesson_id = l.lesson_id 
-                         AND l2.is_public = TRUE
-                         AND l2.lesson_id IS NOT NULL 
-                         AND l2.lesson_id != ''
-                     ))
-                    OR
-                    -- Lessons without lesson_id or with empty lesson_id: include all (they're standalone, not versioned)
-                    (l.lesson_id IS NULL OR l.lesson_id = '')
-                )
+                WHERE l.is_public = TRUE AND l.is_latest = TRUE
             '''
             params = []
 
@@ -357,6 +406,10 @@ class LessonModel:
                 params.append(focus_area)
 
             query += ' ORDER BY l.created_at DESC'
+            
+            if limit is not None:
+                query += ' LIMIT ? OFFSET ?'
+                params += [limit, offset]
 
             lessons = db.execute(query, params).fetchall()
             return [dict(lesson) for lesson in lessons]
@@ -365,22 +418,51 @@ class LessonModel:
             raise
 
     @staticmethod
-    def search_lessons(search_term: str, grade_level: str = None) -> List[Dict[str, Any]]:
-        """Search lessons by title, content, or focus area (including all versions)"""
+    def search_lessons(search_term: str, grade_level: str = None,
+                       limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Search the latest public version of each lesson by title, summary, content or focus area.
+
+        Ranked by BM25 over the lessons_fts index; falls back to LIKE (newest
+        first) when SQLite has no FTS5.
+        """
         try:
             db = get_db()
-            query = '''SELECT l.*, u.username as teacher_name 
-                      FROM lessons l 
-                      JOIN users u ON l.teacher_id = u.id 
-                      WHERE l.is_public = TRUE 
-                      AND (l.title LIKE ? OR l.content LIKE ? OR l.focus_area LIKE ?)'''
-            params = [f'%{search_term}%', f'%{search_term}%', f'%{search_term}%']
+            if LessonModel._fts_available is None:
+                LessonModel._fts_available = db.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lessons_fts'"
+                ).fetchone() is not None
+            
+            if LessonModel._fts_available:
+                match_query = _fts_match_query(search_term)
+                if not match_query:
+                    return []
+                query = f'''SELECT {LESSON_SUMMARY_COLUMNS}, u.username as teacher_name
+                           FROM lessons_fts
+                           JOIN lessons l ON l.id = lessons_fts.rowid
+                           JOIN users u ON l.teacher_id = u.id
+                           WHERE lessons_fts MATCH ?
+                           AND l.is_public = TRUE
+                           AND l.is_latest = TRUE'''
+                params = [match_query]
+                order_by = ' ORDER BY bm25(lessons_fts, ?, ?, ?, ?)'
+                order_params = list(SEARCH_WEIGHTS)
+            else:
+                query = f'''SELECT {LESSON_SUMMARY_COLUMNS}, u.username as teacher_name 
+                           FROM lessons l 
+                           JOIN users u ON l.teacher_id = u.id 
+                           WHERE l.is_public = TRUE 
+                           AND (l.title LIKE ? OR l.summary LIKE ? OR l.content LIKE ? OR l.focus_area LIKE ?)
+                           AND l.is_latest = TRUE'''
+                params = [f'%{search_term}%'] * 4
+                order_by = ' ORDER BY l.created_at DESC'
+                order_params = []
             
             if grade_level:
                 query += ' AND l.grade_level = ?'
                 params.append(grade_level)
             
-            query += ' ORDER BY l.created_at DESC'
+            query += order_by + ' LIMIT ? OFFSET ?'
+            params += order_params + [limit, offset]
             
             lessons = db.execute(query, params).fetchall()
             return [dict(lesson) for lesson in lessons]
@@ -430,6 +512,14 @@ class LessonModel:
             
             query = f'UPDATE lessons SET {", ".join(updates)} WHERE id = ?'
             db.execute(query, params)
+            if content is not None:
+                # Summaries, key points, FAQs and cached answers came from the old content
+                db.execute('DELETE FROM lesson_artifacts WHERE lesson_id = ?', (self.lesson_id,))
+                db.execute('DELETE FROM lesson_answer_cache WHERE lesson_id = ?', (self.lesson_id,))
+            if is_public is not None:
+                row = db.execute('SELECT lesson_id FROM lessons WHERE id = ?', (self.lesson_id,)).fetchone()
+                if row:
+                    LessonModel._refresh_latest(db, row['lesson_id'], self.lesson_id)
             db.commit()
             return True
         except Exception as e:
@@ -440,7 +530,11 @@ class LessonModel:
         """Delete a lesson"""
         try:
             db = get_db()
+            row = db.execute('SELECT lesson_id FROM lessons WHERE id = ?', (self.lesson_id,)).fetchone()
             db.execute('DELETE FROM lessons WHERE id = ?', (self.lesson_id,))
+            if row and row['lesson_id']:
+                # An older public version may now be the latest
+                LessonModel._refresh_latest(db, row['lesson_id'])
             db.commit()
             return True
         except Exception as e:
@@ -601,6 +695,41 @@ class LessonModel:
             logger.error(f"Error getting draft content: {str(e)}")
             return ''
 
+    @staticmethod
+    def get_artifact(lesson_id: int, artifact_type: str, content_hash: str) -> Optional[str]:
+        """Get a cached artifact payload for this version of the lesson content"""
+        try:
+            db = get_db()
+            row = db.execute(
+                '''SELECT payload FROM lesson_artifacts
+                   WHERE lesson_id = ? AND artifact_type = ? AND content_hash = ?''',
+                (lesson_id, artifact_type, content_hash)
+            ).fetchone()
+            return row['payload'] if row else None
+        except Exception as e:
+            logger.error(f"Error retrieving lesson artifact: {str(e)}")
+            raise
+
+    @staticmethod
+    def save_artifact(lesson_id: int, artifact_type: str, content_hash: str, payload: str) -> None:
+        """Cache an artifact, replacing any copy made from older content"""
+        try:
+            db = get_db()
+            db.execute(
+                '''DELETE FROM lesson_artifacts
+                   WHERE lesson_id = ? AND artifact_type = ? AND content_hash != ?''',
+                (lesson_id, artifact_type, content_hash)
+            )
+            db.execute(
+                '''INSERT OR REPLACE INTO lesson_artifacts (lesson_id, artifact_type, content_hash, payload)
+                   VALUES (?, ?, ?, ?)''',
+                (lesson_id, artifact_type, content_hash, payload)
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error saving lesson artifact: {str(e)}")
+            raise
+
     @staticmethod
     def clear_draft_content(lesson_id: int) -> bool:
         """Clear draft content for a lesson"""
@@ -998,9 +1127,9 @@ class ChatModel:
             read=10.0,
             write=3.0
         )
+        # Local bucket only tracks upstream errors; admission uses the shared llm_rate_limiter
         self.rate_limiter = TokenBucket(rate=10/60, capacity=10)
         self.last_request_time = 0
-        self.min_request_interval = 0.5
     
     @property
     def chat_model(self):
@@ -1009,7 +1138,7 @@ class ChatModel:
             try:
                 ollama_base_url = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
                 ollama_model = os.getenv('OLLAMA_MODEL', 'qwen2.5:3b')
-                self._chat_model = ChatOllama(
+                self._chat_model = LimitedChatOllama(
                     model=ollama_model,
                     base_url=ollama_base_url
                 )
@@ -1025,14 +1154,16 @@ class ChatModel:
         return self._chat_model
 
     def _wait_for_token(self):
-        """Wait for a token to become available with jitter"""
-        while not self.rate_limiter.acquire():
-            jitter = random.uniform(0.1, 0.5)
-            time.sleep(jitter)
-            
-            now = time.time()
-            if now - self.last_request_time < self.min_request_interval:
-                time.sleep(self.min_request_interval - (now - self.last_request_time))
+        """Take a request token from the shared per-user and global buckets.
+
+        Sleeps once for short waits; raises RateLimitError when the wait is too long.
+        """
+        if self.rate_limiter.daily_limit_hit and time.time() < self.rate_limiter.daily_limit_reset_time:
+            raise DailyLimitError({
+                'retry_after': self.rate_limiter.daily_limit_reset_time - time.time(),
+                'is_daily_limit': True
+            })
+        llm_rate_limiter.acquire(self.user_id)
 
     def _handle_error(self, error: Exception) -> Dict:
         """Handle errors and update rate limiter state"""
@@ -1110,7 +1241,7 @@ class ChatModel:
             
         except Exception as e:
             logger.error(f"Error in generate_response: {str(e)}")
-            if isinstance(e, DailyLimitError):
+            if isinstance(e, (DailyLimitError, RateLimitError, OllamaQueueFull)):
                 raise
             error_info = self._handle_error(e)
             if error_info['is_daily_limit']:
@@ -1198,129 +1329,117 @@ import pickle
 logger = logging.getLogger(__name__)
 
 class VectorStoreModel:
-    """Model for handling vector store operations with multi-user support"""
+    """Model for handling vector store operations with one on-disk partition per user"""
     
-    _instance = None
+    # Legacy single-file store, converted to per-user partitions on first use
     VECTOR_STORE_PATH = "shared_vector_store.pkl"
-    
-    def __new__(cls, user_id: int = None):
-        if cls._instance is None:
-            instance = super(VectorStoreModel, cls).__new__(cls)
-            instance._initialized = False
-            cls._instance = instance
-        return cls._instance
+    _store = PartitionedVectorStore(Config.USER_VECTOR_DIR)
+    _migration_checked = False
+    _migration_lock = Lock()
     
     def __init__(self, user_id: int = None):
-        if not hasattr(self, '_initialized') or not self._initialized:
-            self._embeddings = None
-            self._vectorstore = None
-            self._initialized = True
-            self._load_existing_store()
         self.user_id = user_id
+        if not VectorStoreModel._migration_checked:
+            VectorStoreModel.migrate_legacy_store()
     
-    def _load_existing_store(self):
-        """Load existing vector store if available"""
-        try:
-            if os.path.exists(self.VECTOR_STORE_PATH):
-                with open(self.VECTOR_STORE_PATH, 'rb') as f:
-                    self._vectorstore = pickle.load(f)
-                logger.info("Loaded shared vector store")
-        except Exception as e:
-            logger.error(f"Error loading shared vector store: {str(e)}")
+    @classmethod
+    def migrate_legacy_store(cls, path: str = None) -> Dict[str, int]:
+        """Convert the pickled shared store into per-user partitions (runs once)"""
+        path = path or cls.VECTOR_STORE_PATH
+        with cls._migration_lock:
+            cls._migration_checked = True
+            if not os.path.exists(path):
+                return {}
+            try:
+                with FileLock(f"{path}.lock", timeout=600):
+                    # Another worker may have finished while we waited
+                    if not os.path.exists(path):
+                        return {}
+                    with open(path, 'rb') as f:
+                        legacy_store = pickle.load(f)
+                    counts = import_faiss_store(
+                        cls._store,
+                        legacy_store,
+                        lambda metadata: cls._partition_name(metadata.get('user_id'))
+                    )
+                    os.replace(path, f"{path}.migrated")
+                logger.info(f"Migrated legacy vector store into {len(counts)} user partitions")
+                return counts
+            except Exception as e:
+                logger.error(f"Error migrating legacy vector store: {str(e)}")
+                return {}
     
-    def _save_store(self):
-        """Save vector store to disk"""
-        try:
-            if self._vectorstore:
-                with open(self.VECTOR_STORE_PATH, 'wb') as f:
-                    pickle.dump(self._vectorstore, f)
-                logger.info("Saved shared vector store to disk")
-        except Exception as e:
-            logger.error(f"Error saving shared vector store: {str(e)}")
+    @staticmethod
+    def _partition_name(user_id) -> Optional[str]:
+        return f"user_{user_id}" if user_id else None
+    
+    @property
+    def partition(self) -> str:
+        if not self.user_id:
+            raise ValueError("User ID is required for vector store operations")
+        return self._partition_name(self.user_id)
     
     @property
     def embeddings(self):
-        """Lazy initialization of embeddings"""
-        if not self._embeddings:
-            try:
-                nomic_api_key = Config.NOMIC_API_KEY
-                if nomic_api_key == 'your_nomic_api_key_here':
-                    raise ValueError("Please configure your Nomic API key in the config file")
-                
-                # self._embeddings = NomicEmbeddings(
-                #     model="nomic-embed-text-v1.5",
-                #     nomic_api_key=nomic_api_key
-                # )
-                self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        """Shared embeddings instance"""
+        return get_embeddings()
 
-            except Exception as e:
-                logger.error(f"Failed to create embeddings: {str(e)}")
-                raise
-        return self._embeddings
+    def has_documents(self) -> bool:
+        """Check whether the user has any indexed documents"""
+        return self._store.has_documents(self.partition)
 
-    def create_vectorstore(self, documents: List) -> None:
-        """Create or update vector store with documents"""
-        if not self.user_id:
-            raise ValueError("User ID is required for vector store operations")
-            
+    def create_vectorstore(self, documents: List) -> List[str]:
+        """Append documents to the user's partition and return their doc ids"""
+        partition = self.partition
         try:
-            # Add user_id to metadata of each document
+            # Keep user_id in metadata for traceability
             for doc in documents:
                 doc.metadata['user_id'] = self.user_id
             
-            if not self._vectorstore:
-                self._vectorstore = FAISS.from_documents(
-                    documents, 
-                    self.embeddings
-                )
-            else:
-                self._vectorstore.add_documents(documents)
-            
-            # Save the updated store
-            self._save_store()
-            logger.info(f"Successfully processed {len(documents)} documents into shared vector store for user {self.user_id}")
+            doc_ids = self._store.add_documents(partition, documents)
+            logger.info(f"Successfully processed {len(documents)} documents into vector store for user {self.user_id}")
+            return doc_ids
         except Exception as e:
             logger.error(f"Error creating/updating vector store for user {self.user_id}: {str(e)}")
             raise
 
     def search_similar(self, query: str, k: int = 3) -> List:
-        """Search for similar documents in the vector store with user isolation"""
-        if not self.user_id:
-            raise ValueError("User ID is required for vector store operations")
-            
+        """Search for similar documents in the user's partition only"""
+        partition = self.partition
         try:
-            if not self._vectorstore:
-                logger.warning(f"Vector store not initialized or empty")
-                return []
-            
-            # Search with metadata filter for user_id
-            results = self._vectorstore.similarity_search(
-                query,
-                k=k,
-                filter={"user_id": self.user_id}  # Only return documents belonging to this user
-            )
-            
+            results = self._store.search(partition, query, k=k)
             logger.info(f"Found {len(results)} relevant documents for query from user {self.user_id}")
             return results
         except Exception as e:
             logger.error(f"Error searching vector store for user {self.user_id}: {str(e)}")
             return []
 
+    def delete_documents(self, doc_ids: List[str]) -> None:
+        """Tombstone specific documents in the user's partition"""
+        partition = self.partition
+        try:
+            self._store.delete_documents(partition, doc_ids)
+            logger.info(f"Deleted {len(doc_ids)} documents for user {self.user_id}")
+        except Exception as e:
+            logger.error(f"Error deleting documents for user {self.user_id}: {str(e)}")
+            raise
+
     def delete_user_documents(self) -> None:
         """Delete all documents for a specific user"""
-        if not self.user_id:
-            raise ValueError("User ID is required for vector store operations")
-            
+        partition = self.partition
         try:
-            if self._vectorstore and hasattr(self._vectorstore, 'delete'):
-                # Delete documents with matching user_id
-                self._vectorstore.delete(filter={"user_id": self.user_id})
-                self._save_store()
+            if self._store.has_documents(partition):
+                self._store.drop_partition(partition)
                 logger.info(f"Deleted all documents for user {self.user_id}")
         except Exception as e:
             logger.error(f"Error deleting documents for user {self.user_id}: {str(e)}")
             raise
 
+    @classmethod
+    def compact(cls) -> int:
+        """Compact all user partitions; returns how many were rewritten"""
+        return cls._store.compact_all()
+
 # class ConversationModel:
 #     """Model for handling conversation-related database operations"""
     
@@ -1438,12 +1557,10 @@ class ConversationModel:
         try:
             db = get_db()
             conversations = db.execute(
-                '''SELECT c.id, c.title, MAX(ch.created_at) as last_message
-                   FROM conversations c
-                   LEFT JOIN chat_history ch ON c.id = ch.conversation_id
-                   WHERE c.user_id = ?
-                   GROUP BY c.id
-                   ORDER BY last_message DESC
+                '''SELECT id, title, last_message_at as last_message
+                   FROM conversations
+                   WHERE user_id = ?
+                   ORDER BY last_message_at DESC
                    LIMIT ?''',
                 (self.user_id, limit)
             ).fetchall()
@@ -1509,7 +1626,8 @@ class ConversationModel:
             # Update conversation's last activity
             from datetime import datetime
             db.execute(
-                'UPDATE conversations SET updated_at = ? WHERE id = ? AND user_id = ?',
+                '''UPDATE conversations SET updated_at = ?, last_message_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND user_id = ?''',
                 (datetime.now().isoformat(), conversation_id, self.user_id)
             )
             
@@ -1519,6 +1637,62 @@ class ConversationModel:
             logger.error(f"Error saving message: {str(e)}")
             raise
     
+    def load_turn(self, conversation_id: int, limit: int = 20) -> Optional[List[Dict]]:
+        """Get the newest messages of a conversation, oldest first, in one statement.
+
+        Returns None if the conversation doesn't belong to this user.
+        """
+        try:
+            db = get_db()
+            rows = db.execute(
+                '''SELECT ch.id, ch.message, ch.role, ch.created_at
+                   FROM conversations c
+                   LEFT JOIN (
+                       SELECT id, message, role, created_at FROM chat_history
+                       WHERE conversation_id = ? ORDER BY id DESC LIMIT ?
+                   ) ch ON 1
+                   WHERE c.id = ? AND c.user_id = ?''',
+                (conversation_id, limit, conversation_id, self.user_id)
+            ).fetchall()
+            if not rows:
+                return None
+            messages = [dict(row) for row in rows if row['id'] is not None]
+            messages.sort(key=lambda msg: msg['id'])
+            return messages
+        except Exception as e:
+            logger.error(f"Error loading conversation turn: {str(e)}")
+            raise
+
+    def save_turn(self, conversation_id: int, user_message: str, bot_message: str) -> Tuple[int, int]:
+        """Save a user message and its reply in one transaction - verifies user ownership"""
+        db = get_db()
+        try:
+            # Touching updated_at first checks ownership and takes the write lock
+            cursor = db.execute(
+                '''UPDATE conversations SET updated_at = ?, last_message_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND user_id = ?''',
+                (datetime.now().isoformat(), conversation_id, self.user_id)
+            )
+            if cursor.rowcount == 0:
+                logger.warning(f"User {self.user_id} attempted to save messages to conversation {conversation_id} without ownership")
+                raise ValueError(f"Conversation {conversation_id} does not belong to user {self.user_id}")
+            
+            user_message_id = db.execute(
+                'INSERT INTO chat_history (conversation_id, message, role) VALUES (?, ?, ?)',
+                (conversation_id, user_message, 'user')
+            ).lastrowid
+            bot_message_id = db.execute(
+                'INSERT INTO chat_history (conversation_id, message, role) VALUES (?, ?, ?)',
+                (conversation_id, bot_message, 'bot')
+            ).lastrowid
+            db.commit()
+            return user_message_id, bot_message_id
+        except Exception as e:
+            if db.in_transaction:
+                db.rollback()
+            logger.error(f"Error saving conversation turn: {str(e)}")
+            raise
+
     def get_chat_history(self, conversation_id: int) -> List[Dict]:
         """Get chat history for a conversation - verifies user ownership"""
         try:
@@ -1537,11 +1711,11 @@ class ConversationModel:
             
             # Now safely retrieve messages for this conversation
             messages = db.execute(
-                '''SELECT ch.message, ch.role, ch.created_at
+                '''SELECT ch.id, ch.message, ch.role, ch.created_at
                    FROM chat_history ch
                    INNER JOIN conversations c ON ch.conversation_id = c.id
                    WHERE ch.conversation_id = ? AND c.user_id = ?
-                   ORDER BY ch.created_at''',
+                   ORDER BY ch.created_at, ch.id''',
                 (conversation_id, self.user_id)
             ).fetchall()
             return [dict(msg) for msg in messages]
@@ -1549,6 +1723,83 @@ class ConversationModel:
             logger.error(f"Error retrieving chat history: {str(e)}")
             raise
 
+    def get_recent_messages(self, conversation_id: int, limit: int = 20,
+                            before_id: Optional[int] = None) -> List[Dict]:
+        """Get the newest messages (older than before_id, if given), oldest first - verifies user ownership"""
+        try:
+            db = get_db()
+            query = '''SELECT ch.id, ch.message, ch.role, ch.created_at
+                       FROM chat_history ch
+                       INNER JOIN conversations c ON ch.conversation_id = c.id
+                       WHERE ch.conversation_id = ? AND c.user_id = ?'''
+            params = [conversation_id, self.user_id]
+            if before_id is not None:
+                query += ' AND ch.id < ?'
+                params.append(before_id)
+            # Walks idx_chat_history_conversation_message backwards, no sort
+            query += ' ORDER BY ch.id DESC LIMIT ?'
+            params.append(limit)
+            messages = db.execute(query, params).fetchall()
+            return [dict(msg) for msg in reversed(messages)]
+        except Exception as e:
+            logger.error(f"Error retrieving recent messages: {str(e)}")
+            raise
+
+    def get_messages_after(self, conversation_id: int, after_id: int, limit: int = 200,
+                           through_id: Optional[int] = None) -> List[Dict]:
+        """Get the oldest messages newer than after_id (up to through_id, if given), oldest first - verifies user ownership"""
+        try:
+            db = get_db()
+            query = '''SELECT ch.id, ch.message, ch.role, ch.created_at
+                       FROM chat_history ch
+                       INNER JOIN conversations c ON ch.conversation_id = c.id
+                       WHERE ch.conversation_id = ? AND c.user_id = ? AND ch.id > ?'''
+            params = [conversation_id, self.user_id, after_id]
+            if through_id is not None:
+                query += ' AND ch.id <= ?'
+                params.append(through_id)
+            query += ' ORDER BY ch.id LIMIT ?'
+            params.append(limit)
+            messages = db.execute(query, params).fetchall()
+            return [dict(msg) for msg in messages]
+        except Exception as e:
+            logger.error(f"Error retrieving messages: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_summary(conversation_id: int) -> Optional[Dict]:
+        """Get the stored rolling summary and the last message id it covers"""
+        try:
+            db = get_db()
+            row = db.execute(
+                'SELECT summary, covered_message_id FROM conversation_summaries WHERE conversation_id = ?',
+                (conversation_id,)
+            ).fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error retrieving conversation summary: {str(e)}")
+            raise
+
+    @staticmethod
+    def save_summary(conversation_id: int, summary: str, covered_message_id: int) -> None:
+        """Store a rolling summary unless a newer one has already been saved"""
+        try:
+            db = get_db()
+            db.execute(
+                '''INSERT INTO conversation_summaries (conversation_id, summary, covered_message_id)
+                   VALUES (?, ?, ?)
+                   ON CONFLICT(conversation_id) DO UPDATE SET
+                       summary = excluded.summary,
+                       covered_message_id = excluded.covered_message_id,
+                       updated_at = CURRENT_TIMESTAMP
+                   WHERE excluded.covered_message_id > conversation_summaries.covered_message_id''',
+                (conversation_id, summary, covered_message_id)
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error saving conversation summary: {str(e)}")
+            raise
+
     def delete_conversation(self, conversation_id: int) -> None:
         """Delete a conversation and its associated messages"""
         try:
@@ -1563,6 +1814,23 @@ class ConversationModel:
             logger.error(f"Error deleting conversation: {str(e)}")
             raise
 
+    def delete_conversations(self, conversation_ids: List[int]) -> int:
+        """Delete several of the user's conversations in one statement; returns how many were deleted"""
+        if not conversation_ids:
+            return 0
+        try:
+            db = get_db()
+            placeholders = ','.join('?' * len(conversation_ids))
+            cursor = db.execute(
+                f'DELETE FROM conversations WHERE user_id = ? AND id IN ({placeholders})',
+                [self.user_id, *conversation_ids]
+            )
+            db.commit()
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error deleting conversations: {str(e)}")
+            raise
+
     def reset_all_chats(self) -> None:
         """Delete all conversations and chat history for the user"""
         try:
@@ -1647,115 +1915,256 @@ class SurveyModel:
 import sqlite3
 
 class LessonFAQ:
+    """Student questions per lesson, grouped into clusters of equivalent questions"""
+
     @staticmethod
-    def log_question(lesson_id, question):
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS lesson_faq (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lesson_id INTEGER,
-            question TEXT,
-            count INTEGER DEFAULT 1,
-            canonical_question TEXT
-        )''')
-
-        # Ensure schema has canonical_question even if table existed
+    def _nearest_cluster(db, lesson_id, vector):
+        """The lesson's cluster closest to vector, or None if none is within FAQ_CLUSTER_THRESHOLD"""
+        rows = db.execute(
+            'SELECT id, count, centroid FROM lesson_faq WHERE lesson_id=? AND centroid IS NOT NULL',
+            (lesson_id,)
+        ).fetchall()
+        best, score = nearest(from_blobs([row['centroid'] for row in rows]), vector)
+        if best is None or score < Config.FAQ_CLUSTER_THRESHOLD:
+            return None
+        return rows[best]
+
+    @staticmethod
+    def _merge_into(db, cluster, vector, count, answer=None, asked=False):
+        """Add count questions embedded as vector to a cluster"""
+        centroid = merge_centroid(from_blobs([cluster['centroid']])[0], cluster['count'], vector, count)
+        db.execute(
+            'UPDATE lesson_faq SET count = count + ?, centroid = ?, latest_answer = COALESCE(?, latest_answer)'
+            + (', last_asked_at = CURRENT_TIMESTAMP' if asked else '') + ' WHERE id=?',
+            (count, to_blob(centroid), answer, cluster['id'])
+        )
+
+    @staticmethod
+    def log_question(lesson_id, question, answer=None):
+        """Count a question under the lesson's nearest FAQ cluster, or start a new cluster"""
+        try:
+            canonical = question.strip()
+            # Embedding happens before the write lock is taken
+            vector = embed_question(canonical)
+            db = get_db()
+
+            # Rows from before clustering are folded in by a background job, not here
+            if db.execute(
+                'SELECT 1 FROM lesson_faq WHERE lesson_id=? AND centroid IS NULL LIMIT 1', (lesson_id,)
+            ).fetchone():
+                LessonFAQ.schedule_backfill(lesson_id)
+
+            db.execute('BEGIN IMMEDIATE TRANSACTION')
+            try:
+                cluster = LessonFAQ._nearest_cluster(db, lesson_id, vector)
+                if cluster is not None:
+                    LessonFAQ._merge_into(db, cluster, vector, 1, answer=answer, asked=True)
+                else:
+                    db.execute(
+                        '''INSERT INTO lesson_faq
+                           (lesson_id, question, count, canonical_question, centroid, latest_answer, last_asked_at)
+                           VALUES (?, ?, 1, ?, ?, ?, CURRENT_TIMESTAMP)''',
+                        (lesson_id, canonical, canonical, to_blob(vector), answer)
+                    )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        except Exception as e:
+            logger.error(f"Error logging FAQ question: {str(e)}")
+            raise
+
+    @staticmethod
+    def backfill_centroids(lesson_id=None):
+        """Fold FAQ rows logged before clustering into their lesson's clusters. Returns rows folded.
+
+        The most asked rows go first, so they become the clusters the rest merge into.
+        """
         try:
-            c.execute('ALTER TABLE lesson_faq ADD COLUMN canonical_question TEXT')
-        except Exception:
-            pass
-
-        # Treat provided question as already canonicalized by service
-        canonical = question.strip()
-
-        # Check if a record with this canonical already exists for this lesson
-        c.execute('SELECT id, count FROM lesson_faq WHERE lesson_id=? AND COALESCE(canonical_question, question)=?', (lesson_id, canonical))
-        row = c.fetchone()
-        if row:
-            c.execute('UPDATE lesson_faq SET count = count + 1 WHERE id=?', (row[0],))
-        else:
-            c.execute('INSERT INTO lesson_faq (lesson_id, question, count, canonical_question) VALUES (?, ?, 1, ?)', (lesson_id, canonical, canonical))
-        conn.commit()
-        conn.close()
+            db = get_db()
+            query = 'SELECT id, lesson_id, COALESCE(canonical_question, question) AS q FROM lesson_faq WHERE centroid IS NULL'
+            params = ()
+            if lesson_id is not None:
+                query += ' AND lesson_id=?'
+                params = (lesson_id,)
+            legacy = db.execute(query + ' ORDER BY count DESC, id', params).fetchall()
+
+            folded = 0
+            for row in legacy:
+                vector = embed_question(row['q'])
+                db.execute('BEGIN IMMEDIATE TRANSACTION')
+                try:
+                    # A concurrent backfill may have got here first
+                    current = db.execute(
+                        'SELECT count FROM lesson_faq WHERE id=? AND centroid IS NULL', (row['id'],)
+                    ).fetchone()
+                    if current is not None:
+                        cluster = LessonFAQ._nearest_cluster(db, row['lesson_id'], vector)
+                        if cluster is not None:
+                            LessonFAQ._merge_into(db, cluster, vector, current['count'])
+                            db.execute('DELETE FROM lesson_faq WHERE id=?', (row['id'],))
+                        else:
+                            db.execute('UPDATE lesson_faq SET centroid=? WHERE id=?', (to_blob(vector), row['id']))
+                        folded += 1
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+            if folded:
+                logger.info(f"Folded {folded} legacy FAQ rows into clusters"
+                            + (f" for lesson {lesson_id}" if lesson_id is not None else ""))
+            return folded
+        except Exception as e:
+            logger.error(f"Error backfilling FAQ clusters: {str(e)}")
+            raise
+
+    @staticmethod
+    def schedule_backfill(lesson_id):
+        """Run backfill_centroids for one lesson in the background"""
+        from app.utils.background import submit_background
+        try:
+            submit_background(LessonFAQ.backfill_centroids, lesson_id, key=f"lesson_faq_backfill:{lesson_id}")
+        except Exception as e:
+            logger.warning(f"Could not schedule FAQ backfill for lesson {lesson_id}: {str(e)}")
 
     @staticmethod
     def get_top_faqs(lesson_id, limit=5):
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS lesson_faq (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lesson_id INTEGER,
-            question TEXT,
-            count INTEGER DEFAULT 1,
-            canonical_question TEXT
-        )''')
-        c.execute('SELECT COALESCE(canonical_question, question) as q, count FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC LIMIT ?', (lesson_id, limit))
-        faqs = [{'question': row[0], 'count': row[1]} for row in c.fetchall()]
-        conn.close()
-        return faqs
+        try:
+            db = get_db()
+            rows = db.execute(
+                'SELECT COALESCE(canonical_question, question) as q, count FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC LIMIT ?',
+                (lesson_id, limit)
+            ).fetchall()
+            return [{'question': row['q'], 'count': row['count']} for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting top FAQs: {str(e)}")
+            raise
+
+class LessonAnswerCache:
+    """Cached answers to student questions, keyed by lesson version and content hash"""
+
+    @staticmethod
+    def get_entries(lesson_id: int, content_hash: str) -> List[Dict]:
+        """Get the cached questions (with embeddings) for this version of the lesson"""
+        try:
+            db = get_db()
+            rows = db.execute(
+                '''SELECT id, question, embedding, answer FROM lesson_answer_cache
+                   WHERE lesson_id = ? AND content_hash = ?''',
+                (lesson_id, content_hash)
+            ).fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error retrieving cached answers: {str(e)}")
+            raise
 
-class LessonChatHistory:
-    """Model for handling lesson-specific chat history"""
-    
     @staticmethod
-    def create_table():
-        """Create the lesson_chat_history table if it doesn't exist"""
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS lesson_chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lesson_id INTEGER,
-            user_id INTEGER,
-            question TEXT,
-            answer TEXT,
-            canonical_question TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-        # Ensure canonical_question exists for older tables
+    def add_entry(lesson_id: int, content_hash: str, question: str, embedding: bytes,
+                  answer: str, max_entries: int) -> int:
+        """Cache an answer, keeping the max_entries most recently used per lesson version"""
         try:
-            c.execute('ALTER TABLE lesson_chat_history ADD COLUMN canonical_question TEXT')
-        except Exception:
-            pass
-        conn.commit()
-        conn.close()
+            db = get_db()
+            # Entries for older content can never match again
+            db.execute(
+                'DELETE FROM lesson_answer_cache WHERE lesson_id = ? AND content_hash != ?',
+                (lesson_id, content_hash)
+            )
+            cursor = db.execute(
+                '''INSERT INTO lesson_answer_cache (lesson_id, content_hash, question, embedding, answer)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (lesson_id, content_hash, question, embedding, answer)
+            )
+            db.execute(
+                '''DELETE FROM lesson_answer_cache
+                   WHERE lesson_id = ? AND id NOT IN (
+                       SELECT id FROM lesson_answer_cache WHERE lesson_id = ?
+                       ORDER BY COALESCE(last_hit_at, created_at) DESC, id DESC LIMIT ?
+                   )''',
+                (lesson_id, lesson_id, max_entries)
+            )
+            db.commit()
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Error caching answer: {str(e)}")
+            raise
+
+    @staticmethod
+    def record_hit(entry_id: int) -> None:
+        try:
+            db = get_db()
+            db.execute(
+                'UPDATE lesson_answer_cache SET hits = hits + 1, last_hit_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (entry_id,)
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error recording answer cache hit: {str(e)}")
+            raise
+
+    @staticmethod
+    def get_stats() -> Dict[str, int]:
+        """Entries and hits across all workers"""
+        try:
+            db = get_db()
+            row = db.execute(
+                'SELECT COUNT(*) AS entries, COALESCE(SUM(hits), 0) AS hits FROM lesson_answer_cache'
+            ).fetchone()
+            return {'entries': row['entries'], 'hits': row['hits']}
+        except Exception as e:
+            logger.error(f"Error getting answer cache stats: {str(e)}")
+            raise
+
+class LessonChatHistory:
+    """Model for handling lesson-specific chat history"""
     
     @staticmethod
     def save_qa(lesson_id: int, user_id: int, question: str, answer: str, canonical_question: str | None = None) -> int:
         """Save a Q&A pair for a specific lesson and user"""
-        LessonChatHistory.create_table()
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO lesson_chat_history 
-                     (lesson_id, user_id, question, answer, canonical_question) 
-                     VALUES (?, ?, ?, ?, ?)''', 
-                  (lesson_id, user_id, question, answer, canonical_question))
-        conn.commit()
-        chat_id = c.lastrowid
-        conn.close()
-        return chat_id
+        try:
+            db = get_db()
+            cursor = db.execute(
+                '''INSERT INTO lesson_chat_history 
+                   (lesson_id, user_id, question, answer, canonical_question) 
+                   VALUES (?, ?, ?, ?, ?)''',
+                (lesson_id, user_id, question, answer, canonical_question)
+            )
+            db.commit()
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Error saving lesson Q&A: {str(e)}")
+            raise
     
     @staticmethod
     def get_lesson_chat_history(lesson_id: int, user_id: int) -> List[Dict]:
         """Get chat history for a specific lesson and user"""
-        LessonChatHistory.create_table()
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
-        c.execute('''SELECT question, answer, created_at 
-                     FROM lesson_chat_history 
-                     WHERE lesson_id = ? AND user_id = ?
-                     ORDER BY created_at ASC''', (lesson_id, user_id))
-        history = [{'question': row[0], 'answer': row[1], 'created_at': row[2]} 
-                  for row in c.fetchall()]
-        conn.close()
-        return history
+        try:
+            db = get_db()
+            rows = db.execute(
+                '''SELECT question, answer, created_at 
+                   FROM lesson_chat_history 
+                   WHERE lesson_id = ? AND user_id = ?
+                   ORDER BY created_at ASC''',
+                (lesson_id, user_id)
+            ).fetchall()
+            # created_at is declared TIMESTAMP, so the pooled connection parses it; keep the text form
+            return [{'question': row['question'], 'answer': row['answer'],
+                     'created_at': str(row['created_at']) if row['created_at'] is not None else None}
+                    for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting lesson chat history: {str(e)}")
+            raise
     
     @staticmethod
     def clear_lesson_chat_history(lesson_id: int, user_id: int) -> None:
         """Clear chat history for a specific lesson and user"""
-        LessonChatHistory.create_table()
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
-        c.execute('''DELETE FROM lesson_chat_history 
-                     WHERE lesson_id = ? AND user_id = ?''', (lesson_id, user_id))
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        try:
+            db = get_db()
+            db.execute(
+                '''DELETE FROM lesson_chat_history 
+                   WHERE lesson_id = ? AND user_id = ?''',
+                (lesson_id, user_id)
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error clearing lesson chat history: {str(e)}")
+            raise
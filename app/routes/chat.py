@@ -7,6 +7,8 @@ from app.utils.auth import login_required
 from app.utils.decorators import teacher_required
 import logging
 from app.utils.db import get_db
+from app.utils.rate_limiter import RateLimitError
+from app.utils.ollama_limiter import OllamaQueueFull
 import time
 from functools import lru_cache
 
@@ -16,12 +18,25 @@ bp = Blueprint('chat', __name__)
 # Simple cache for token status (user_id -> (timestamp, data))
 _token_status_cache = {}
 CACHE_TTL = 2  # Cache for 2 seconds
+MAX_MESSAGES_PAGE_SIZE = 100
 
 @bp.route('/health')
 def health_check():
     """Health check endpoint for container orchestration"""
     return jsonify({'status': 'healthy'}), 200
 
+@bp.route('/health/ollama')
+def ollama_queue_status():
+    """Ollama admission queue metrics for this worker"""
+    from app.utils.ollama_limiter import ollama_limiter
+    return jsonify(ollama_limiter.stats()), 200
+
+@bp.route('/health/answer_cache')
+def answer_cache_status():
+    """Student answer cache hit rate for this worker, and shared cache size"""
+    from app.services.lesson import answer_cache
+    return jsonify(answer_cache.stats()), 200
+
 @bp.route('/')
 @login_required
 def index():
@@ -104,6 +119,10 @@ def chat():
                 conversation_id=conversation_id
             )
             return jsonify(result)
+        except (RateLimitError, OllamaQueueFull) as e:
+            # Per-user limit or a saturated LLM backend: tell the client when to retry
+            retry_after = int(e.retry_after) + 1
+            return jsonify({'error': str(e), 'retry_after': retry_after}), 429, {'Retry-After': str(retry_after)}
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
             return jsonify({
@@ -150,11 +169,23 @@ def get_conversations():
 @bp.route('/get_messages/<int:conversation_id>')
 @login_required
 def get_messages(conversation_id):
-    """Get messages for a specific conversation"""
+    """Get messages for a specific conversation.
+
+    Without ?limit the whole conversation is returned. With ?limit (and
+    optionally ?before_id from a previous page's next_before_id) the newest
+    page of messages is returned along with has_more.
+    """
     try:
         chat_service = ChatService(session['user_id'], session['groq_api_key'])
-        messages = chat_service.get_conversation_messages(conversation_id)
-        return jsonify({'messages': messages})  # <-- wrap in dict for frontend
+        limit = request.args.get('limit', type=int)
+        if limit is None:
+            messages = chat_service.get_conversation_messages(conversation_id)
+            return jsonify({'messages': messages})  # <-- wrap in dict for frontend
+        
+        limit = max(1, min(limit, MAX_MESSAGES_PAGE_SIZE))
+        before_id = request.args.get('before_id', type=int)
+        page = chat_service.get_conversation_messages_page(conversation_id, limit, before_id)
+        return jsonify(page)
     except Exception as e:
         logger.error(f"Error retrieving messages: {str(e)}")
         return jsonify({'error': 'Failed to retrieve messages'}), 500
@@ -198,6 +229,23 @@ def delete_all_conversations():
         logger.error(f"Error deleting all conversations: {str(e)}")
         return jsonify({'error': 'Failed to delete conversations'}), 500
 
+@bp.route('/delete_conversations', methods=['DELETE'])
+@login_required
+def delete_conversations():
+    """Delete several conversations at once"""
+    try:
+        data = request.get_json(silent=True) or {}
+        conversation_ids = data.get('conversation_ids', [])
+        if not isinstance(conversation_ids, list) or not all(isinstance(i, int) for i in conversation_ids):
+            return jsonify({'error': 'conversation_ids must be a list of ids'}), 400
+        
+        chat_service = ChatService(session['user_id'], session['groq_api_key'])
+        deleted = chat_service.delete_conversations(conversation_ids)
+        return jsonify({'message': f'{deleted} conversations deleted', 'deleted': deleted})
+    except Exception as e:
+        logger.error(f"Error deleting conversations: {str(e)}")
+        return jsonify({'error': 'Failed to delete conversations'}), 500
+
 @bp.route('/update_conversation_title/<int:conversation_id>', methods=['PUT'])
 @login_required
 def update_conversation_title(conversation_id):
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, session
-from app.services.chatbot_service import DocumentChatBot
+from app.services.chatbot_service import get_support_chatbot
 from app.utils.auth import login_required
+from app.utils.ollama_limiter import OllamaQueueFull
 import os
 
 bp = Blueprint('chatbot', __name__)
@@ -17,17 +18,19 @@ def chat():
     print(f"User ID from session: {user_id}")  # Debug log
 
     try:
-        # Create chatbot instance with user_id to get API key from database
-        chatbot = DocumentChatBot(user_id=user_id)
-        print(f"Chatbot created successfully with API key: {chatbot.groq_api_key[:10]}...")  # Debug log (show first 10 chars)
-        chatbot_response = chatbot.get_response(user_message)
+        # Shared chatbot with a prebuilt index; the handoff state is kept in the user's session
+        chatbot = get_support_chatbot()
+        chatbot_response = chatbot.get_response(user_message, state=session)
         print(f"Chatbot response: {chatbot_response}")  # Debug log
         return jsonify(chatbot_response)
+    except OllamaQueueFull:
+        # Handled app-wide as a 429 with Retry-After
+        raise
     except ValueError as e:
         print(f"ValueError in chat route: {str(e)}")  # Debug log
         return jsonify({
             "redirect": True,
-            "message": "Please set up your API key in your account settings.",
+            "message": "Our knowledge base is unavailable right now. Please try again later.",
             "whatsapp_url": ""
         }), 400
     except Exception as e:
@@ -37,4 +40,3 @@ def chat():
             "message": "Sorry, I'm having trouble connecting. Please try again later.",
             "whatsapp_url": ""
         }), 500
-    
@@ -1,8 +1,12 @@
 from flask import Blueprint, request, jsonify, session, send_file, after_this_request, render_template
 from app.models.models import UserModel, LessonModel
 from app.services.lesson_service import LessonService
+from app.services.lesson.content_index import schedule_content_index
+from app.services.lesson.student_service import schedule_lesson_artifacts, is_not_found
+from app.services.lesson import answer_cache
 from app.utils.decorators import login_required, teacher_required, student_required
 from app.utils.db import get_db
+from app.utils.ollama_limiter import OllamaQueueFull
 from werkzeug.datastructures import FileStorage
 import logging
 import os
@@ -104,6 +108,11 @@ def create_lesson():
             if not lesson_id:
                 return jsonify({'error': 'Failed to save lesson to database'}), 500
             
+            # Persist the document index under this lesson so chat turns can load it.
+            # The lesson is already saved, so a failure here must not fail the upload.
+            if not lesson_service.save_lesson_index(lesson_id):
+                logger.warning(f"Lesson {lesson_id} saved without a document index")
+            
             # Get the greeting message from process_result (no LLM call was made)
             greeting_message = process_result.get('lesson', 'Your file has been uploaded successfully.')
             
@@ -260,11 +269,28 @@ def browse_lessons():
     try:
         grade_level = request.args.get('grade_level')
         focus_area = request.args.get('focus_area')
+        # Without ?limit every lesson is returned, as the current UI expects
+        limit = request.args.get('limit', type=int)
+        offset = max(0, request.args.get('offset', 0, type=int))
+        
+        if limit is None:
+            lessons = LessonModel.get_public_latest_lessons(grade_level=grade_level, focus_area=focus_area)
+            return jsonify({
+                'success': True,
+                'lessons': lessons
+            })
         
-        lessons = LessonModel.get_public_latest_lessons(grade_level=grade_level, focus_area=focus_area)
+        limit = max(1, min(limit, 100))
+        # One extra row tells us whether there is another page
+        lessons = LessonModel.get_public_latest_lessons(
+            grade_level=grade_level, focus_area=focus_area, limit=limit + 1, offset=offset
+        )
         return jsonify({
             'success': True,
-            'lessons': lessons
+            'lessons': lessons[:limit],
+            'has_more': len(lessons) > limit,
+            'limit': limit,
+            'offset': offset
         })
     except Exception as e:
         logger.error(f"Error browsing lessons: {str(e)}", exc_info=True)
@@ -277,14 +303,18 @@ def search_lessons():
     try:
         search_term = request.args.get('q', '')
         grade_level = request.args.get('grade_level')
+        limit = max(1, min(request.args.get('limit', 50, type=int), 100))
+        offset = max(0, request.args.get('offset', 0, type=int))
         
         if not search_term:
             return jsonify({'error': 'Search term is required'}), 400
         
-        lessons = LessonModel.search_lessons(search_term, grade_level=grade_level)
+        lessons = LessonModel.search_lessons(search_term, grade_level=grade_level, limit=limit, offset=offset)
         return jsonify({
             'success': True,
-            'lessons': lessons
+            'lessons': lessons,
+            'limit': limit,
+            'offset': offset
         })
     except Exception as e:
         logger.error(f"Error searching lessons: {str(e)}", exc_info=True)
@@ -410,6 +440,8 @@ def update_lesson(lesson_id):
         )
         
         if success:
+            if content_to_save is not None or data.get('is_public') is not None:
+                schedule_content_index(lesson_id)
             return jsonify({
                 'success': True,
                 'message': 'Lesson updated successfully'
@@ -438,6 +470,8 @@ def delete_lesson(lesson_id):
         success = lesson_model.delete_lesson()
         
         if success:
+            # Drops it from the cross-lesson index
+            schedule_content_index(lesson_id)
             return jsonify({
                 'success': True,
                 'message': 'Lesson deleted successfully'
@@ -819,20 +853,24 @@ def ask_lesson_question():
     query_analysis = service.analyze_user_query(question)
     logger.info(f"Lesson question analysis: {query_analysis}")
     
-    # Try to answer using the specific lesson first with conversation context
-    result = service.answer_lesson_question(lesson_id, question, conversation_history)
-    
-    # If the specific lesson doesn't have good results, try general search with context
-    if 'error' in result or not result.get('answer') or len(result.get('answer', '')) < 50:
-        logger.info("Specific lesson search didn't provide good results, trying general search")
-        
-        # Get available lesson IDs for broader context
-        available_lessons = service._get_available_lesson_ids()
-        if available_lessons:
-            general_result = service.answer_general_question(question, available_lessons, conversation_history)
-            if general_result.get('answer') and len(general_result.get('answer', '')) > 50:
-                result = general_result
-                logger.info("Using general search result for better answer")
+    # Equivalent questions about the same lesson version reuse one answer
+    lesson = LessonModel.get_lesson_by_id(lesson_id)
+    cached_answer = answer_cache.lookup(lesson, question, conversation_history) if lesson else None
+    if cached_answer:
+        result = {'answer': cached_answer, 'lesson_id': lesson_id, 'question': question, 'source': 'answer_cache'}
+    else:
+        # Try to answer using the specific lesson first with conversation context
+        result = service.answer_lesson_question(lesson_id, question, conversation_history)
+        if 'error' not in result and is_not_found(result.get('answer')):
+            # Only a real "not in this lesson" goes to the other lessons: one search, one LLM call
+            logger.info(f"Lesson {lesson_id} does not cover the question, searching all lessons")
+            cross_lesson_result = service.answer_across_lessons(
+                question, conversation_history, exclude_lesson_id=lesson_id
+            )
+            if 'error' not in cross_lesson_result:
+                result = cross_lesson_result
+        elif lesson and 'error' not in result:
+            answer_cache.store(lesson, question, result['answer'], conversation_history)
     
     if 'error' in result:
         return jsonify({'error': result['error']}), 400
@@ -843,7 +881,7 @@ def ask_lesson_question():
     
     # Log the question to FAQ table for teacher visibility
     try:
-        LessonFAQ.log_question(lesson_id, canonical)
+        LessonFAQ.log_question(lesson_id, canonical, answer=result['answer'])
         logger.info(f"Question logged to FAQ table for lesson {lesson_id}: {canonical}")
     except Exception as e:
         logger.error(f"Error logging question to FAQ table: {str(e)}")
@@ -926,6 +964,8 @@ def create_lesson_version(lesson_id):
             content=data.get('content', original_lesson_data['content']),
             file_name=data.get('file_name', original_lesson_data.get('file_name'))
         )
+        schedule_content_index(new_lesson_id)
+        schedule_lesson_artifacts(new_lesson_id)
         
         return jsonify({
             'success': True,
@@ -1005,6 +1045,8 @@ def create_ai_lesson_version(lesson_id):
             content=improved_content,
             file_name=original_lesson_data.get('file_name')
         )
+        schedule_content_index(new_lesson_id)
+        schedule_lesson_artifacts(new_lesson_id)
         
         return jsonify({
             'success': True,
@@ -1034,33 +1076,13 @@ def get_lesson_faqs(lesson_id):
             return jsonify({'error': 'Lesson not found'}), 404
         
         # Read FAQs from the lesson_faq table (real student questions)
-        import sqlite3
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
+        db = get_db()
         
-        # Get questions from lesson_faq table for this specific lesson
-        # Use canonical form when available
-        c.execute('SELECT COALESCE(canonical_question, question) as question, count FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC', (lesson_id,))
-        faq_rows = c.fetchall()
-        conn.close()
+        # Each row is a cluster of equivalent questions, with the latest answer kept at ingest
+        faq_rows = db.execute('SELECT COALESCE(canonical_question, question) as question, count, latest_answer FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC', (lesson_id,)).fetchall()
         
         # Format the FAQs to match the expected structure
         faqs = []
-        
-        # Prepare DB for fetching latest answers from lesson_chat_history
-        import sqlite3 as _sqlite3
-        _conn2 = _sqlite3.connect('instance/chatbot.db')
-        _c2 = _conn2.cursor()
-        # Ensure table exists (defensive)
-        _c2.execute('''CREATE TABLE IF NOT EXISTS lesson_chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lesson_id INTEGER,
-            user_id INTEGER,
-            question TEXT,
-            answer TEXT,
-            canonical_question TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
 
         for row in faq_rows:
             # Determine version display text
@@ -1070,34 +1092,15 @@ def get_lesson_faqs(lesson_id):
             else:
                 version_text = "v1 (Original)"
             
-            canonical_or_question = row[0]
-            # Fetch latest answer using canonical match first, then exact, then partial
-            latest_answer = None
-            try:
-                # Try canonical match first
-                _c2.execute(
+            latest_answer = row[2]
+            if latest_answer is None:
+                # Clusters logged before answers were kept: fall back to the exact question in chat history
+                _row_ans = db.execute(
                     'SELECT answer FROM lesson_chat_history WHERE lesson_id = ? AND canonical_question = ? ORDER BY datetime(created_at) DESC LIMIT 1',
-                    (lesson_id, canonical_or_question)
-                )
-                _row_ans = _c2.fetchone()
-                if not _row_ans:
-                    # Fallback exact text match
-                    _c2.execute(
-                        'SELECT answer FROM lesson_chat_history WHERE lesson_id = ? AND question = ? ORDER BY datetime(created_at) DESC LIMIT 1',
-                        (lesson_id, canonical_or_question)
-                    )
-                    _row_ans = _c2.fetchone()
-                if not _row_ans:
-                    # Fallback: partial match using LIKE
-                    _c2.execute(
-                        'SELECT answer FROM lesson_chat_history WHERE lesson_id = ? AND (question LIKE ? OR canonical_question LIKE ?) ORDER BY datetime(created_at) DESC LIMIT 1',
-                        (lesson_id, f"%{canonical_or_question[:30]}%", f"%{canonical_or_question[:30]}%")
-                    )
-                    _row_ans = _c2.fetchone()
+                    (lesson_id, row[0])
+                ).fetchone()
                 if _row_ans:
                     latest_answer = _row_ans[0]
-            except Exception:
-                latest_answer = None
 
             faqs.append({
                 'question': row[0],
@@ -1112,7 +1115,6 @@ def get_lesson_faqs(lesson_id):
                 'parent_lesson_id': lesson.get('parent_lesson_id'),
                 'answer': latest_answer
             })
-        _conn2.close()
         
         return jsonify({'faqs': faqs})
         
@@ -1124,21 +1126,10 @@ def get_lesson_faqs(lesson_id):
 @login_required
 def get_lesson_faq_count(lesson_id):
     try:
-        import sqlite3
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS lesson_faq (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lesson_id INTEGER,
-            question TEXT,
-            count INTEGER DEFAULT 1,
-            canonical_question TEXT
-        )''')
-        c.execute('SELECT COALESCE(SUM(count), 0) FROM lesson_faq WHERE lesson_id=?', (lesson_id,))
-        total = c.fetchone()[0] or 0
-        c.execute('SELECT COUNT(*) FROM lesson_faq WHERE lesson_id=?', (lesson_id,))
-        unique_qs = c.fetchone()[0] or 0
-        conn.close()
+        db = get_db()
+        row = db.execute('SELECT COALESCE(SUM(count), 0), COUNT(*) FROM lesson_faq WHERE lesson_id=?', (lesson_id,)).fetchone()
+        total = row[0] or 0
+        unique_qs = row[1] or 0
         return jsonify({'total_count': int(total), 'unique_count': int(unique_qs)})
     except Exception:
         return jsonify({'total_count': 0, 'unique_count': 0})
@@ -1154,15 +1145,13 @@ def faq_dashboard():
         top_questions = []
         total_questions = 0
         recent_questions = []
-        import sqlite3
         from datetime import datetime, timedelta
 
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
+        db = get_db()
         # For each lesson, get top questions
         for lesson in lessons:
-            c.execute('SELECT COALESCE(canonical_question, question) as question, count FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC LIMIT 3', (lesson['id'],))
-            faqs = [{'question': row[0], 'count': row[1]} for row in c.fetchall()]
+            rows = db.execute('SELECT COALESCE(canonical_question, question) as question, count FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC LIMIT 3', (lesson['id'],)).fetchall()
+            faqs = [{'question': row[0], 'count': row[1]} for row in rows]
             total_questions += sum(row['count'] for row in faqs)
             if faqs:
                 top_questions.append({
@@ -1174,8 +1163,7 @@ def faq_dashboard():
         # If you want real recent questions, you need to log timestamps in lesson_faq
         # For now, just return the most asked question per lesson
         for lesson in lessons:
-            c.execute('SELECT COALESCE(canonical_question, question) as question, count FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC LIMIT 1', (lesson['id'],))
-            row = c.fetchone()
+            row = db.execute('SELECT COALESCE(canonical_question, question) as question, count FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC LIMIT 1', (lesson['id'],)).fetchone()
             if row:
                 recent_questions.append({
                     'question': row[0],
@@ -1183,7 +1171,6 @@ def faq_dashboard():
                     'lesson_title': lesson['title'],
                     'time_ago': 'Recently'
                 })
-        conn.close()
         return jsonify({
             'total_questions': total_questions,
             'weekly_questions': total_questions,  # Placeholder
@@ -1201,19 +1188,16 @@ def export_faq_dashboard():
     try:
         user_id = session['user_id']
         lessons = LessonModel.get_lessons_by_teacher(user_id)
-        import sqlite3
         from io import BytesIO
         from docx import Document
         from docx.shared import Pt
         from docx.enum.text import WD_ALIGN_PARAGRAPH
 
-        conn = sqlite3.connect('instance/chatbot.db')
-        c = conn.cursor()
+        db = get_db()
         # Prepare data for export
         rows = []
         for lesson in lessons:
-            c.execute('SELECT COALESCE(canonical_question, question) as question, count FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC', (lesson['id'],))
-            faqs = c.fetchall()
+            faqs = db.execute('SELECT COALESCE(canonical_question, question) as question, count FROM lesson_faq WHERE lesson_id=? ORDER BY count DESC', (lesson['id'],)).fetchall()
             for faq in faqs:
                 rows.append({
                     'lesson_title': lesson['title'],
@@ -1221,7 +1205,6 @@ def export_faq_dashboard():
                     'question': faq[0],
                     'count': faq[1]
                 })
-        conn.close()
 
         # Create Word document
         doc = Document()
@@ -1521,6 +1504,8 @@ def finalize_lesson_version(lesson_id):
             logger.info(f"Deleted FAISS index for finalized lesson {new_lesson_id}")
         except Exception as e:
             logger.warning(f"Failed to delete FAISS index for lesson {new_lesson_id}: {str(e)}")
+        schedule_content_index(new_lesson_id)
+        schedule_lesson_artifacts(new_lesson_id)
         
         # Clear the draft content from the current lesson
         LessonModel.clear_draft_content(lesson_id)
@@ -1586,6 +1571,7 @@ def interactive_chat(lesson_id):
             lesson_model = LessonModel(lesson_id)
             lesson_model.update_lesson(content=result.ai_response)
             logger.info(f"Complete lesson saved to database for lesson_id: {lesson_id}")
+            schedule_content_index(lesson_id)
 
         # Return response with lesson update status
         return jsonify({
@@ -1595,6 +1581,9 @@ def interactive_chat(lesson_id):
             'lesson_id': lesson_id
         })
 
+    except OllamaQueueFull:
+        # Handled app-wide as a 429 with Retry-After
+        raise
     except Exception as e:
         logger.error(f"Error in interactive chat: {str(e)}", exc_info=True)
         return jsonify({'error': f'Failed to process chat: {str(e)}'}), 500
@@ -1668,11 +1657,16 @@ def interactive_chat_stream(lesson_id):
                                 lesson_model = LessonModel(lesson_id)
                                 lesson_model.update_lesson(content=full_response)
                                 logger.info(f"Complete lesson saved to database for lesson_id: {lesson_id}")
+                                schedule_content_index(lesson_id)
                             except Exception as e:
                                 logger.error(f"Error saving lesson: {str(e)}")
                         
                         break
                 
+            except OllamaQueueFull as e:
+                # Headers are already sent, so the 429 goes in the event itself
+                retry_after = int(e.retry_after) + 1
+                yield f"data: {json.dumps({'error': str(e), 'status': 429, 'retry_after': retry_after, 'is_complete': True, 'complete_lesson': 'no'})}\n\n"
             except Exception as e:
                 logger.error(f"Error in streaming chat: {str(e)}", exc_info=True)
                 error_data = json.dumps({
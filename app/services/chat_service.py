@@ -51,7 +51,7 @@
 #             # Get relevant context from vector store
 #             context = ""
 #             try:
-#                 if self.vector_store._vectorstore:
+#                 if self.vector_store.has_documents():
 #                     relevant_docs = self.vector_store.search_similar(message, k=3)
 #                     if relevant_docs:
 #                         context = "Using the provided documents, I found this relevant information:\n\n" + "\n".join(
@@ -154,16 +154,86 @@
 # app/services/chat_service.py
 from typing import List, Dict, Optional, Any, Tuple
 from app.models import ChatModel, ConversationModel, VectorStoreModel
+import os
 import logging
 from datetime import datetime
 import re
 import httpx
 import time
 from app.utils.constants import MAX_MESSAGE_WINDOW, MAX_CONTEXT_TOKENS, SUMMARY_THRESHOLD, DEFAULT_PROMPT
-import tiktoken
+from app.utils.background import submit_background
+from app.utils.ollama_limiter import LimitedChatOllama, PRIORITY_BACKGROUND
+from app.utils.context_budget import count_tokens, pack_prompt, prompt_budget
+from app.utils.retention import prune_conversations, schedule_retention
 
 logger = logging.getLogger(__name__)
 
+SUMMARY_SYSTEM_PROMPT = "You are a helpful assistant that summarizes conversations concisely while maintaining context and key points."
+SUMMARY_MESSAGE_CHARS = 1000  # Per-message cap when folding into the summary
+SUMMARY_FOLD_LIMIT = 200  # Most messages folded into the summary in one pass
+DOCUMENT_CONTEXT_INSTRUCTIONS = "\n\nWhen answering questions, prioritize information from the provided documents. If the answer is not in the documents, clearly state that and provide a general explanation based on your knowledge."
+
+
+_summary_llm = None
+
+
+def _get_summary_llm():
+    """Shared chat model for summaries, queued behind interactive requests"""
+    global _summary_llm
+    if _summary_llm is None:
+        _summary_llm = LimitedChatOllama(
+            model=os.getenv('OLLAMA_MODEL', 'qwen2.5:3b'),
+            base_url=os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434'),
+            priority=PRIORITY_BACKGROUND
+        )
+    return _summary_llm
+
+
+def update_conversation_summary(user_id: int, conversation_id: int,
+                                previous_summary: str, previous_covered_id: int,
+                                covered_message_id: int) -> None:
+    """Fold messages evicted since previous_covered_id into a conversation's stored summary. Runs in the background.
+
+    Messages are folded oldest first, SUMMARY_FOLD_LIMIT at a time, and the
+    summary is saved after each page so a long backlog is never skipped.
+    Calls the model directly rather than through ChatModel: the summary is
+    housekeeping, so it takes no token from the user's rate-limit bucket
+    and is not counted against their token usage.
+    """
+    conversation_model = ConversationModel(user_id)
+    summary = previous_summary
+    covered_id = previous_covered_id
+    while covered_id < covered_message_id:
+        new_messages = conversation_model.get_messages_after(
+            conversation_id, covered_id, limit=SUMMARY_FOLD_LIMIT, through_id=covered_message_id
+        )
+        if not new_messages:
+            return
+        
+        transcript = ""
+        for msg in new_messages:
+            role = msg.get('role', 'user')
+            content = (msg.get('message') or '')[:SUMMARY_MESSAGE_CHARS]
+            transcript += f"{role}: {content}\n"
+        
+        if summary:
+            prompt = ("Update this conversation summary with the new messages below, "
+                      "keeping it concise while maintaining the context and key points.\n\n"
+                      f"Summary so far:\n{summary}\n\nNew messages:\n{transcript}")
+        else:
+            prompt = f"Summarize the following conversation in a concise way, maintaining the context and key points:\n\n{transcript}"
+        
+        # Nobody is waiting on this, so the slot is taken at background priority
+        summary = _get_summary_llm().invoke([
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]).content.strip()
+        # A short page means nothing else is left up to covered_message_id
+        covered_id = new_messages[-1]['id'] if len(new_messages) == SUMMARY_FOLD_LIMIT else covered_message_id
+        ConversationModel.save_summary(conversation_id, summary, covered_id)
+        logger.info(f"Updated summary for conversation {conversation_id} through message {covered_id}")
+
+
 class ChatService:
     """Service class for handling chat-related business logic"""
     
@@ -177,7 +247,6 @@ class ChatService:
         self._cache_ttl = 180  # Reduced from 300 (3 minutes instead of 5)
         self._cache_cleanup_interval = 60  # Clean up cache every minute
         self._last_cache_cleanup = time.time()
-        self._tokenizer = tiktoken.get_encoding("cl100k_base")  # For token counting
         self._system_prompt = DEFAULT_PROMPT  # Use the default prompt from constants
     
     @property
@@ -193,55 +262,53 @@ class ChatService:
         
     def _count_tokens(self, text: str) -> int:
         """Count the number of tokens in a text string."""
-        return len(self._tokenizer.encode(text))
+        return count_tokens(text)
 
-    def _summarize_history(self, history: List[Dict]) -> str:
-        """Summarize old messages in the conversation history."""
+    def _summarize_history(self, conversation_id: int, history: List[Dict]) -> str:
+        """Return the stored summary of messages older than the window, refreshing it in the background."""
         try:
-            # Get the most recent messages
-            recent_messages = history[-MAX_MESSAGE_WINDOW:]
-            
-            # Create a summary of older messages
             older_messages = history[:-MAX_MESSAGE_WINDOW]
             if not older_messages:
                 return ""
-                
-            summary_prompt = "Summarize the following conversation in a concise way, maintaining the context and key points:\n\n"
-            for msg in older_messages:
-                role = msg.get('role', 'user')
-                content = msg.get('message', '')
-                summary_prompt += f"{role}: {content}\n"
             
-            # Use the chat model to generate a summary
-            summary = self.chat_model.generate_response(
-                input_text=summary_prompt,
-                system_prompt="You are a helpful assistant that summarizes conversations concisely while maintaining context and key points.",
-                chat_history=[]
-            )
+            stored = ConversationModel.get_summary(conversation_id)
+            covered_id = stored['covered_message_id'] if stored else 0
+            boundary_id = older_messages[-1]['id']
+            
+            # Fold in only the messages evicted since the last summary, off the request path
+            if boundary_id > covered_id:
+                submit_background(
+                    update_conversation_summary,
+                    self.user_id, conversation_id,
+                    stored['summary'] if stored else "", covered_id, boundary_id,
+                    key=f"conversation_summary:{conversation_id}"
+                )
             
-            return f"[Previous conversation summary: {summary}]\n\n"
+            if not stored:
+                return ""
+            return f"[Previous conversation summary: {stored['summary']}]\n\n"
         except Exception as e:
             logger.error(f"Error summarizing history: {str(e)}")
             return ""
 
-    def _manage_context_window(self, history: List[Dict]) -> Tuple[List[Dict], str]:
+    def _manage_context_window(self, history: List[Dict], conversation_id: Optional[int] = None) -> Tuple[List[Dict], str]:
         """Manage the context window by implementing a sliding window and summarization."""
         if len(history) <= MAX_MESSAGE_WINDOW:
             return history, ""
             
         # If we have more messages than the window size, summarize older ones
-        if len(history) > SUMMARY_THRESHOLD:
-            summary = self._summarize_history(history)
+        if len(history) > SUMMARY_THRESHOLD and conversation_id:
+            summary = self._summarize_history(conversation_id, history)
             recent_messages = history[-MAX_MESSAGE_WINDOW:]
             return recent_messages, summary
             
         # Otherwise, just keep the most recent messages
         return history[-MAX_MESSAGE_WINDOW:], ""
 
-    def format_chat_history(self, history: List[Dict]) -> List[Dict]:
+    def format_chat_history(self, history: List[Dict], conversation_id: Optional[int] = None) -> List[Dict]:
         """Format chat history for the LLM with memory management."""
         # Apply memory management
-        managed_history, summary = self._manage_context_window(history)
+        managed_history, summary = self._manage_context_window(history, conversation_id)
         
         formatted_history = []
         if summary:
@@ -286,7 +353,7 @@ class ChatService:
             if cached_result and time.time() - cached_result['timestamp'] < self._cache_ttl:
                 return cached_result['context']
 
-            if self.vector_store._vectorstore:
+            if self.vector_store.has_documents():
                 # Check if the query is asking about a specific page
                 page_match = re.search(r'page\s*(\d+)', message.lower())
                 page_number = int(page_match.group(1)) if page_match else None
@@ -324,34 +391,24 @@ class ChatService:
                        conversation_id: Optional[int] = None) -> Dict[str, Any]:
         """Process a user message and generate a response"""
         try:
-            # Create new conversation if needed
-            if not conversation_id:
+            raw_history = None
+            if conversation_id:
+                # Ownership check and the history window in one query; only the window
+                # (and enough to tell whether a summary is due) is loaded
+                raw_history = self.conversation_model.load_turn(
+                    conversation_id, limit=max(MAX_MESSAGE_WINDOW, SUMMARY_THRESHOLD) + 1
+                )
+                if raw_history is None:
+                    logger.warning(f"User {self.user_id} attempted to use conversation {conversation_id} without ownership")
+            
+            if raw_history is None:
+                # New conversation, or the provided one doesn't belong to this user
                 conversation_id = self.conversation_model.create_conversation(
                     title=message[:50]
                 )
-                # For new conversations, don't include any chat history
                 formatted_history = []
             else:
-                # Verify conversation ownership before accessing
-                conversation = self.conversation_model.get_conversation_by_id(conversation_id)
-                if not conversation:
-                    logger.warning(f"User {self.user_id} attempted to use conversation {conversation_id} without ownership")
-                    # Create a new conversation if the provided one doesn't belong to this user
-                    conversation_id = self.conversation_model.create_conversation(
-                        title=message[:50]
-                    )
-                    formatted_history = []
-                else:
-                    # Get and format chat history only for existing conversations
-                    raw_history = self.conversation_model.get_chat_history(conversation_id)
-                    formatted_history = self.format_chat_history(raw_history)
-            
-            # Save user message
-            self.conversation_model.save_message(
-                conversation_id=conversation_id,
-                message=message,
-                role='user'
-            )
+                formatted_history = self.format_chat_history(raw_history, conversation_id)
             
             # Get document context
             document_context = self.get_document_context(message)
@@ -359,24 +416,28 @@ class ChatService:
             # For debugging
             logger.debug(f"Formatted history: {formatted_history}")
             
-            # Enhance system prompt with document context
-            enhanced_prompt = self._system_prompt
-            if document_context:
-                enhanced_prompt = f"{self._system_prompt}\n\nDocument Context:\n{document_context}\n\nWhen answering questions, prioritize information from the provided documents. If the answer is not in the documents, clearly state that and provide a general explanation based on your knowledge."
+            # Fit the system prompt, document context, history and message into the token budget
+            messages, budget_stats = pack_prompt(
+                self._system_prompt,
+                message,
+                history=formatted_history,
+                chunks=[document_context] if document_context else [],
+                max_tokens=min(MAX_CONTEXT_TOKENS, prompt_budget()),
+                context_header="\n\nDocument Context:\n" if document_context else "",
+                context_footer=DOCUMENT_CONTEXT_INSTRUCTIONS if document_context else ""
+            )
+            logger.debug(f"Prompt budget: {budget_stats}")
             
             # Generate response
             response = self.chat_model.generate_response(
                 input_text=message,
-                system_prompt=enhanced_prompt,
-                chat_history=formatted_history
+                system_prompt=messages[0]['content'],
+                chat_history=messages[1:-1]
             )
             
-            # Save bot response
-            self.conversation_model.save_message(
-                conversation_id=conversation_id,
-                message=response,
-                role='bot'
-            )
+            # Save the user message and bot response together
+            self.conversation_model.save_turn(conversation_id, message, response)
+            schedule_retention()
             
             return {
                 'response': response,
@@ -405,18 +466,39 @@ class ChatService:
                 return []
             
             raw_messages = self.conversation_model.get_chat_history(conversation_id)
-            return [
-                {
-                    'role': msg.get('role', 'user'),
-                    'message': msg.get('message', ''),
-                    'created_at': msg.get('created_at', datetime.now().isoformat())
-                }
-                for msg in raw_messages
-            ]
+            return [self._format_message(msg) for msg in raw_messages]
         except Exception as e:
             logger.error(f"Error retrieving messages: {str(e)}")
             raise
 
+    def get_conversation_messages_page(self, conversation_id: int, limit: int,
+                                       before_id: Optional[int] = None) -> Dict[str, Any]:
+        """Get one page of messages, newest first by page, oldest first within it - verifies user ownership"""
+        try:
+            # One extra row tells us whether there is an older page
+            raw_messages = self.conversation_model.get_recent_messages(
+                conversation_id, limit=limit + 1, before_id=before_id
+            )
+            has_more = len(raw_messages) > limit
+            if has_more:
+                raw_messages = raw_messages[1:]
+            return {
+                'messages': [self._format_message(msg) for msg in raw_messages],
+                'has_more': has_more,
+                'next_before_id': raw_messages[0]['id'] if has_more else None
+            }
+        except Exception as e:
+            logger.error(f"Error retrieving messages page: {str(e)}")
+            raise
+
+    def _format_message(self, msg: Dict) -> Dict[str, Any]:
+        return {
+            'id': msg.get('id'),
+            'role': msg.get('role', 'user'),
+            'message': msg.get('message', ''),
+            'created_at': msg.get('created_at', datetime.now().isoformat())
+        }
+
     def create_conversation(self, title: str) -> int:
         """Create a new conversation and clear user vector store context"""
         try:
@@ -451,13 +533,18 @@ class ChatService:
             logger.error(f"Error retrieving conversation details: {str(e)}")
             raise
 
+    def delete_conversations(self, conversation_ids: List[int]) -> int:
+        """Delete several conversations at once"""
+        try:
+            return self.conversation_model.delete_conversations(conversation_ids)
+        except Exception as e:
+            logger.error(f"Error deleting conversations: {str(e)}")
+            raise
+
     def clean_old_conversations(self, max_conversations: int = 50) -> None:
         """Clean up old conversations beyond the maximum limit"""
         try:
-            conversations = self.conversation_model.get_conversations()
-            if len(conversations) > max_conversations:
-                for conv in conversations[max_conversations:]:
-                    self.delete_conversation(conv['id'])
+            prune_conversations(max_per_user=max_conversations, user_id=self.user_id)
         except Exception as e:
             logger.error(f"Error cleaning old conversations: {str(e)}")
             raise
@@ -465,9 +552,7 @@ class ChatService:
     def reset_all_conversations(self) -> None:
         """Delete all conversations for the current user"""
         try:
-            conversations = self.conversation_model.get_conversations()
-            for conv in conversations:
-                self.delete_conversation(conv['id'])
+            self.conversation_model.reset_all_chats()
         except Exception as e:
             logger.error(f"Error resetting conversations: {str(e)}")
             raise
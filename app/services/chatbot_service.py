@@ -244,57 +244,173 @@
 #             formatted_lines.append(line)
 #         return '\n'.join(formatted_lines)
 import os
+import shutil
+import hashlib
 import logging
+import threading
+import uuid
 from urllib.parse import quote
 from pathlib import Path
-from typing import Optional, Union
+from typing import Optional, Union, List, MutableMapping
 # from langchain_groq import ChatGroq
 from langchain_ollama import ChatOllama
+from app.utils.ollama_limiter import LimitedChatOllama, OllamaQueueFull
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.document_loaders import PyPDFLoader, PyPDFDirectoryLoader
-from app.models.models import UserModel
+from app.config import Config
+from app.utils.embeddings import get_embeddings
 
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Prebuilt FAQ indexes live under instance/indexes/faq/<sha256 of the PDF>/
+FAQ_INDEX_DIR = os.path.join(Config.INDEX_DIR, 'faq')
+
+# Session key holding whether the user was offered a human support handoff
+AWAITING_CONFIRMATION_KEY = 'support_awaiting_confirmation'
+
+_faq_index_lock = threading.Lock()
+_faq_indexes = {}
+_shared_chatbot = None
+_shared_chatbot_lock = threading.Lock()
+
+
+def resolve_faq_document_path(document_path: Optional[Union[str, Path]] = None) -> Path:
+    """Locate the FAQ PDF (or directory of PDFs) the support chatbot answers from."""
+    if document_path:
+        doc_path = Path(document_path)
+    else:
+        if os.getenv('DOCKER_ENV') == 'true':
+            doc_path = Path('/app/app/IqbalAI_FAQ.pdf')
+        else:
+            doc_path = Path(__file__).parent.parent / 'app' / 'IqbalAI_FAQ.pdf'
+
+    if not doc_path.exists():
+        fallback_paths = [
+            Path('/app/IqbalAI_FAQ.pdf'),
+            Path('app/IqbalAI_FAQ.pdf'),
+            Path(__file__).parent / 'IqbalAI_FAQ.pdf'
+        ]
+        for alt in fallback_paths:
+            if alt.exists():
+                return alt
+        raise FileNotFoundError(
+            f"PDF file not found at any known location.\nChecked: {doc_path} and alternatives."
+        )
+    return doc_path
+
+
+def _faq_files(document_path: Path) -> List[Path]:
+    if document_path.is_dir():
+        return sorted(document_path.glob('*.pdf'))
+    return [document_path]
+
+
+def faq_content_hash(document_path: Path) -> str:
+    """SHA-256 over the FAQ PDF bytes; a changed PDF gets a fresh index."""
+    digest = hashlib.sha256()
+    for pdf in _faq_files(document_path):
+        digest.update(pdf.name.encode('utf-8'))
+        with open(pdf, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_faq_documents(document_path: Path):
+    logger.info(f"Document path: {document_path}")
+    if not document_path.exists():
+        raise FileNotFoundError(f"Path does not exist: {document_path}")
+    if document_path.is_file() and document_path.suffix.lower() == '.pdf':
+        loader = PyPDFLoader(str(document_path))
+    elif document_path.is_dir():
+        loader = PyPDFDirectoryLoader(str(document_path))
+    else:
+        raise ValueError("Provided path must be a .pdf file or directory containing PDFs.")
+    return loader.load()
+
+
+def build_faq_index(document_path: Optional[Union[str, Path]] = None, force: bool = False) -> str:
+    """Build and persist the FAQ index if it is missing. Returns the index directory."""
+    document_path = resolve_faq_document_path(document_path)
+    index_dir = os.path.join(FAQ_INDEX_DIR, faq_content_hash(document_path))
+    if os.path.exists(index_dir) and not force:
+        logger.info(f"FAQ index already built at {index_dir}")
+        return index_dir
+
+    docs = _load_faq_documents(document_path)
+    if not docs:
+        raise ValueError(f"No documents found in {document_path}")
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    split_docs = text_splitter.split_documents(docs)
+    vectors = FAISS.from_documents(split_docs, get_embeddings())
+
+    # Write to a staging directory and swap it in so concurrent builders never clash
+    os.makedirs(FAQ_INDEX_DIR, exist_ok=True)
+    staging = f"{index_dir}.tmp-{uuid.uuid4().hex}"
+    vectors.save_local(staging)
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir, ignore_errors=True)
+    try:
+        os.replace(staging, index_dir)
+    except OSError:
+        # Another process finished the same build first
+        shutil.rmtree(staging, ignore_errors=True)
+    logger.info(f"Built FAQ index with {len(split_docs)} chunks at {index_dir}")
+    return index_dir
+
+
+def load_faq_index(document_path: Optional[Union[str, Path]] = None):
+    """Return the FAQ vector store, loading it at most once per process."""
+    document_path = resolve_faq_document_path(document_path)
+    content_hash = faq_content_hash(document_path)
+    vectors = _faq_indexes.get(content_hash)
+    if vectors is not None:
+        return vectors
+
+    with _faq_index_lock:
+        vectors = _faq_indexes.get(content_hash)
+        if vectors is None:
+            index_dir = build_faq_index(document_path)
+            vectors = FAISS.load_local(index_dir, get_embeddings(), allow_dangerous_deserialization=True)
+            _faq_indexes[content_hash] = vectors
+            logger.info(f"Loaded FAQ index {content_hash[:12]} (pid {os.getpid()})")
+        return vectors
+
+
+def get_support_chatbot() -> "DocumentChatBot":
+    """Return the process-wide support chatbot; per-user state lives in the session."""
+    global _shared_chatbot
+    if _shared_chatbot is None:
+        with _shared_chatbot_lock:
+            if _shared_chatbot is None:
+                _shared_chatbot = DocumentChatBot()
+    return _shared_chatbot
+
 
 class DocumentChatBot:
     def __init__(self, user_id: Optional[int] = None, document_path: Optional[Union[str, Path]] = None):
+        # The bot is shared across users; user_id is kept for backward compatibility only
         self.user_id = user_id
         
-        # Get API keys from database if user_id is provided, otherwise from environment
-        if user_id:
-            user_model = UserModel(user_id)
-            self.groq_api_key = user_model.get_api_key()
-            if not self.groq_api_key:
-                raise ValueError(f"User {user_id} does not have a GROQ API key set")
-        else:
-            self.groq_api_key = os.getenv('GROQ_API_KEY')
-            if not self.groq_api_key:
-                raise ValueError("GROQ_API_KEY environment variable not set")
-        
-        # NOMIC API key is still from environment as it's not user-specific
-        self.nomic_api_key = os.getenv('NOMIC_API_KEY')
-        if not self.nomic_api_key:
-            raise ValueError("NOMIC_API_KEY environment variable not set")
-            
         # self.llm = ChatGroq(groq_api_key=self.groq_api_key, model_name="llama-3.3-70b-versatile")
         ollama_base_url = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
         ollama_model = os.getenv('OLLAMA_MODEL', 'qwen2.5:3b')
-        self.llm = ChatOllama(model="qwen2.5:1.5b", base_url=ollama_base_url)
+        self.llm = LimitedChatOllama(model="qwen2.5:1.5b", base_url=ollama_base_url)
         self.prompt = self._create_prompt()
         self.vectors = None
         self.embeddings = None
         self.retriever = None
         self.chain = None
-        self.awaiting_confirmation = False
+        # Fallback state when no session mapping is passed to get_response
+        self._local_state = {}
         self.support_phone = "+92 317 5161606"
         self.default_message = "Hi, I need help with my issue."
         self.document_path = self._resolve_document_path(document_path)
@@ -314,27 +430,7 @@ class DocumentChatBot:
         return f"https://wa.me/{phone_number}?text={encoded_message}"
 
     def _resolve_document_path(self, document_path: Optional[Union[str, Path]]) -> Path:
-        if document_path:
-            doc_path = Path(document_path)
-        else:
-            if os.getenv('DOCKER_ENV') == 'true':
-                doc_path = Path('/app/app/IqbalAI_FAQ.pdf')
-            else:
-                doc_path = Path(__file__).parent.parent / 'app' / 'IqbalAI_FAQ.pdf'
-
-        if not doc_path.exists():
-            fallback_paths = [
-                Path('/app/IqbalAI_FAQ.pdf'),
-                Path('app/IqbalAI_FAQ.pdf'),
-                Path(__file__).parent / 'IqbalAI_FAQ.pdf'
-            ]
-            for alt in fallback_paths:
-                if alt.exists():
-                    return alt
-            raise FileNotFoundError(
-                f"PDF file not found at any known location.\nChecked: {doc_path} and alternatives."
-            )
-        return doc_path
+        return resolve_faq_document_path(document_path)
 
     def _create_prompt(self) -> ChatPromptTemplate:
         return ChatPromptTemplate.from_template("""
@@ -354,35 +450,15 @@ class DocumentChatBot:
 
     Answer:""")
 
-    def _get_document_loader(self):
-        logger.info(f"Document path: {self.document_path}")
-        if not self.document_path.exists():
-            raise FileNotFoundError(f"Path does not exist: {self.document_path}")
-        if self.document_path.is_file() and self.document_path.suffix.lower() == '.pdf':
-            return PyPDFLoader(str(self.document_path))
-        elif self.document_path.is_dir():
-            return PyPDFDirectoryLoader(str(self.document_path))
-        else:
-            raise ValueError("Provided path must be a .pdf file or directory containing PDFs.")
-
     def _format_docs(self, docs):
         """Format retrieved documents into a single string"""
         return "\n\n".join(doc.page_content for doc in docs)
 
     def _initialize_embeddings(self):
         try:
-            self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-            loader = self._get_document_loader()
-            docs = loader.load()
-            if not docs:
-                logger.warning("No documents found.")
-                return
-
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            split_docs = text_splitter.split_documents(docs)
-
-            self.vectors = FAISS.from_documents(split_docs, self.embeddings)
+            self.embeddings = get_embeddings()
+            # Prebuilt index keyed by the PDF hash; only the first call per process loads it
+            self.vectors = load_faq_index(self.document_path)
             self.retriever = self.vectors.as_retriever()
             
             # Create the RAG chain using LCEL (pipe operator)
@@ -403,18 +479,18 @@ class DocumentChatBot:
             self.chain = None
             raise
 
-    def _handle_support_handoff(self, user_response: str) -> dict:
+    def _handle_support_handoff(self, user_response: str, state: MutableMapping) -> dict:
         """Handle user response to support handoff request."""
         user_response = user_response.lower().strip()
         if user_response in ['yes', 'y', 'yeah', 'sure', 'ok', 'okay', 'redirect me']:
-            self.awaiting_confirmation = False
+            state[AWAITING_CONFIRMATION_KEY] = False
             return {
                 "redirect": True,
                 "message": "I'm connecting you to our support team on WhatsApp...",
                 "whatsapp_url": self.get_whatsapp_url()
             }
         elif user_response in ['no', 'n', 'not now']:
-            self.awaiting_confirmation = False
+            state[AWAITING_CONFIRMATION_KEY] = False
             return {
                 "redirect": False,
                 "message": "No problem! How else can I assist you today?",
@@ -427,8 +503,15 @@ class DocumentChatBot:
                 "whatsapp_url": ""
             }
 
-    def get_response(self, question: str) -> dict:
-        """Get response from chatbot. Returns dict with response and redirect info."""
+    def get_response(self, question: str, state: Optional[MutableMapping] = None) -> dict:
+        """Get response from chatbot. Returns dict with response and redirect info.
+
+        state is a per-user mapping (normally the Flask session) that holds the
+        support handoff flag, so one bot instance can serve every user.
+        """
+        if state is None:
+            state = self._local_state
+
         if not question.strip():
             return {
                 "redirect": False,
@@ -436,8 +519,8 @@ class DocumentChatBot:
                 "whatsapp_url": ""
             }
             
-        if self.awaiting_confirmation:
-            return self._handle_support_handoff(question)
+        if state.get(AWAITING_CONFIRMATION_KEY):
+            return self._handle_support_handoff(question, state)
             
         if not self.chain:
             return {
@@ -462,7 +545,7 @@ class DocumentChatBot:
             ]
             
             if any(phrase.lower() in bot_answer.lower() for phrase in fallback_phrases):
-                self.awaiting_confirmation = True
+                state[AWAITING_CONFIRMATION_KEY] = True
                 return {
                     "redirect": False,
                     "message": "I couldn't find that information. Would you like me to connect you with our human support team on WhatsApp? (yes/no)",
@@ -475,6 +558,8 @@ class DocumentChatBot:
                 "whatsapp_url": ""
             }
             
+        except OllamaQueueFull:
+            raise
         except Exception as e:
             logger.error(f"Error during response generation: {e}")
             return {
@@ -5,6 +5,9 @@ from .base_service import BaseLessonService
 from .teacher_service import TeacherLessonService
 from .student_service import StudentLessonService
 from .rag_service import RAGService
+from .index_store import LessonIndexStore, lesson_index_store
+from .content_index import lesson_content_index_store, lesson_context
+from .session_store import ChatSessionStore, chat_session_store
 from .models import (
     LessonPlan, 
     LessonResponse, 
@@ -19,6 +22,12 @@ __all__ = [
     'TeacherLessonService', 
     'StudentLessonService',
     'RAGService',
+    'LessonIndexStore',
+    'lesson_index_store',
+    'lesson_content_index_store',
+    'lesson_context',
+    'ChatSessionStore',
+    'chat_session_store',
     'LessonPlan',
     'LessonResponse',
     'CreativeActivity',
@@ -0,0 +1,108 @@
+"""
+Semantic cache of answers to student lesson questions.
+
+A class asking the same thing thirty times should cost one LLM call. Each
+answered question is stored with its embedding, keyed by the lesson row
+id (the version) and a hash of the content. A new question about the same
+content whose embedding is within ANSWER_CACHE_THRESHOLD cosine similarity
+of a cached one gets that answer back. Entries live in SQLite, so every
+worker and replica shares them. Editing the lesson drops them.
+
+Follow-ups that lean on the conversation ("yes please", "explain that
+again") mean different things for different students. When there is
+history, those bypass the cache in both directions.
+"""
+import re
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.config import Config
+from app.utils.question_clusters import embed_question, from_blobs, nearest
+from .content_index import content_hash
+
+logger = logging.getLogger(__name__)
+
+# Words that usually point back into the conversation
+HISTORY_REFERENCES = re.compile(
+    r"\b(it|its|that|those|these|they|them|above|previous|again|earlier|before|last|"
+    r"more|yes|yeah|sure|ok|okay|also|too)\b",
+    re.IGNORECASE
+)
+MIN_STANDALONE_WORDS = 3
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stored': 0}
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[name] += 1
+
+
+def depends_on_history(question: str, history: Optional[List[Dict]] = None) -> bool:
+    """Whether the question likely only makes sense given earlier turns."""
+    if not history:
+        return False
+    words = re.findall(r"\w+", question)
+    return len(words) < MIN_STANDALONE_WORDS or bool(HISTORY_REFERENCES.search(question))
+
+
+def lookup(lesson: Dict[str, Any], question: str, history: Optional[List[Dict]] = None) -> Optional[str]:
+    """Cached answer to an equivalent question about this lesson version, or None."""
+    if not Config.ANSWER_CACHE_ENABLED:
+        return None
+    if depends_on_history(question, history):
+        _count('bypassed')
+        return None
+    from app.models.models import LessonAnswerCache
+    try:
+        entries = LessonAnswerCache.get_entries(lesson['id'], content_hash(lesson.get('content') or ''))
+        if not entries:
+            _count('misses')
+            return None
+        best, score = nearest(from_blobs([entry['embedding'] for entry in entries]), embed_question(question))
+        if score < Config.ANSWER_CACHE_THRESHOLD:
+            _count('misses')
+            return None
+        LessonAnswerCache.record_hit(entries[best]['id'])
+        _count('hits')
+        logger.info(f"Answer cache hit for lesson {lesson['id']} "
+                    f"(similarity {score:.3f} to '{entries[best]['question']}')")
+        return entries[best]['answer']
+    except Exception as e:
+        logger.error(f"Error looking up cached answer: {str(e)}")
+        return None
+
+
+def store(lesson: Dict[str, Any], question: str, answer: str, history: Optional[List[Dict]] = None) -> None:
+    """Cache an answer for reuse by equivalent questions about this lesson version."""
+    if not Config.ANSWER_CACHE_ENABLED or depends_on_history(question, history):
+        return
+    from app.models.models import LessonAnswerCache
+    try:
+        LessonAnswerCache.add_entry(
+            lesson['id'],
+            content_hash(lesson.get('content') or ''),
+            question,
+            embed_question(question).tobytes(),
+            answer,
+            Config.ANSWER_CACHE_MAX_ENTRIES
+        )
+        _count('stored')
+    except Exception as e:
+        logger.error(f"Error caching answer: {str(e)}")
+
+
+def stats() -> Dict[str, Any]:
+    """This worker's hit rate plus cache size and hits across all workers."""
+    with _lock:
+        counters = dict(_counters)
+    lookups = counters['hits'] + counters['misses']
+    counters['hit_rate'] = round(counters['hits'] / lookups, 3) if lookups else 0.0
+    from app.models.models import LessonAnswerCache
+    try:
+        counters['shared'] = LessonAnswerCache.get_stats()
+    except Exception:
+        counters['shared'] = None
+    return counters
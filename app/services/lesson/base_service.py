@@ -99,7 +99,7 @@ from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 # Import the Ollama limiter
-from app.utils.ollama_limiter import limit_ollama_requests, ollama_limiter
+from app.utils.ollama_limiter import limit_ollama_requests, ollama_limiter, LimitedChatOllama
 
 logger = logging.getLogger(__name__)
 
@@ -118,8 +118,8 @@ class BaseLessonService:
         ollama_model = os.getenv('OLLAMA_MODEL', 'qwen2.5:3b')
         ollama_timeout = int(os.getenv('OLLAMA_TIMEOUT', 600))
         
-        # Initialize Ollama client
-        self.llm = ChatOllama(
+        # Initialize Ollama client (every generation takes a shared Ollama slot)
+        self.llm = LimitedChatOllama(
             model=ollama_model,
             base_url=ollama_base_url,
             timeout=ollama_timeout,
@@ -175,7 +175,7 @@ class BaseLessonService:
         
         return heading
 
-    @limit_ollama_requests(timeout=600)
+    @limit_ollama_requests()
     def invoke_llm(self, prompt: str) -> str:
         """
         Invoke Ollama LLM with rate limiting.
@@ -188,7 +188,7 @@ class BaseLessonService:
             The LLM response as a string
         """
         try:
-            logger.info(f"[OLLAMA] Invoking LLM (active: {ollama_limiter.get_active_count()}/2)")
+            logger.info(f"[OLLAMA] Invoking LLM (active: {ollama_limiter.get_active_count()}/{ollama_limiter.max_concurrent})")
             response = self.llm.invoke(prompt)
             
             # Handle different response types
@@ -199,14 +199,14 @@ class BaseLessonService:
             else:
                 result = str(response)
             
-            logger.info(f"[OLLAMA] LLM invocation completed (active: {ollama_limiter.get_active_count()}/2)")
+            logger.info(f"[OLLAMA] LLM invocation completed (active: {ollama_limiter.get_active_count()}/{ollama_limiter.max_concurrent})")
             return result
             
         except Exception as e:
             logger.error(f"Error invoking LLM: {str(e)}")
             raise
 
-    @limit_ollama_requests(timeout=600)
+    @limit_ollama_requests()
     def stream_llm(self, prompt: str):
         """
         Stream responses from Ollama LLM with rate limiting.
@@ -218,7 +218,7 @@ class BaseLessonService:
             Chunks of the LLM response
         """
         try:
-            logger.info(f"[OLLAMA] Starting LLM stream (active: {ollama_limiter.get_active_count()}/2)")
+            logger.info(f"[OLLAMA] Starting LLM stream (active: {ollama_limiter.get_active_count()}/{ollama_limiter.max_concurrent})")
             
             for chunk in self.llm.stream(prompt):
                 if hasattr(chunk, 'content'):
@@ -228,7 +228,7 @@ class BaseLessonService:
                 else:
                     yield str(chunk)
             
-            logger.info(f"[OLLAMA] LLM stream completed (active: {ollama_limiter.get_active_count()}/2)")
+            logger.info(f"[OLLAMA] LLM stream completed (active: {ollama_limiter.get_active_count()}/{ollama_limiter.max_concurrent})")
             
         except Exception as e:
             logger.error(f"Error streaming from LLM: {str(e)}")
@@ -319,6 +319,7 @@ class BaseLessonService:
         return {
             'active_requests': ollama_limiter.get_active_count(),
             'max_concurrent': ollama_limiter.max_concurrent,
+            'queue': ollama_limiter.stats(),
             'base_url': os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434'),
             'model': os.getenv('OLLAMA_MODEL', 'qwen2.5:3b'),
             'timeout': int(os.getenv('OLLAMA_TIMEOUT', 600))
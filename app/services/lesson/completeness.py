@@ -0,0 +1,153 @@
+"""
+Local classifier for "is this a complete lesson or still a draft/outline?"
+
+Prof. Potter keeps ordinary turns under ~150 words and asks for confirmation
+before writing the full lesson, so most responses can be classified from
+structure alone: length, headed sections that contain real prose, lesson
+section vocabulary and the outline/confirmation phrases the model uses.
+Responses that land between the thresholds, and short turns that do not
+propose an outline, need the LLM check.
+"""
+import re
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Phrases that mean the model is still proposing a structure
+OUTLINE_PHRASES = (
+    'does this outline work',
+    'does this structure work',
+    'should i generate',
+    'shall i generate',
+    'should i proceed',
+    'shall i proceed',
+    'is this perfect now',
+    'would you like me to start',
+    'would you like me to generate',
+    'would you like me to proceed',
+    'would you like me to include prerequisite',
+    'before i generate',
+    'before i write',
+    'is that correct',
+    'which one matches',
+    'proposed outline',
+    'here is an outline',
+    "here's an outline",
+)
+
+# Vocabulary of sections a finished lesson usually contains
+LESSON_MARKERS = (
+    'learning objective',
+    'introduction',
+    'example',
+    'activity',
+    'activities',
+    'assessment',
+    'quiz',
+    'practice',
+    'exercise',
+    'summary',
+    'conclusion',
+    'recap',
+    'homework',
+    'materials',
+    'key concept',
+)
+
+MIN_LESSON_WORDS = 150     # Below this a response is a conversational turn
+SECTION_BODY_WORDS = 40    # A heading needs this much text under it to count as developed
+PROSE_LINE_WORDS = 12      # Lines at least this long count as prose rather than outline bullets
+YES_THRESHOLD = 5.0
+NO_THRESHOLD = 1.5
+
+_HEADING_RE = re.compile(
+    r'^\s{0,3}(#{1,6}\s+\S.*'                      # markdown heading
+    r'|\*\*[^*]{2,80}\*\*:?\s*'                     # bold line
+    r'|(\d+|[IVXivx]+)[.)]\s+[A-Z][^.?!]{0,70}:?'   # numbered section title
+    r'|[A-Z][A-Za-z /&-]{2,60}:)\s*$'               # "Title:" line
+)
+_BULLET_RE = re.compile(r'^\s*([-*•]|\d+[.)])\s+')
+
+
+def lesson_completeness_features(text: str) -> Dict[str, Any]:
+    """Structural features used by the classifier."""
+    lines = [line.rstrip() for line in (text or '').splitlines()]
+    words = len((text or '').split())
+
+    headings = 0
+    developed_sections = 0
+    section_words = None
+    prose_words = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        line_words = len(line.split())
+        if _HEADING_RE.match(line):
+            if section_words is not None and section_words >= SECTION_BODY_WORDS:
+                developed_sections += 1
+            headings += 1
+            section_words = 0
+            continue
+        if section_words is not None:
+            section_words += line_words
+        if line_words >= PROSE_LINE_WORDS:
+            prose_words += line_words
+    if section_words is not None and section_words >= SECTION_BODY_WORDS:
+        developed_sections += 1
+
+    lowered = (text or '').lower()
+    tail = lowered[-400:]
+    last_line = next((line.strip() for line in reversed(lines) if line.strip()), '')
+
+    return {
+        'words': words,
+        'headings': headings,
+        'developed_sections': developed_sections,
+        'prose_ratio': prose_words / words if words else 0.0,
+        'markers': sum(1 for marker in LESSON_MARKERS if marker in lowered),
+        'outline_phrase': any(phrase in lowered for phrase in OUTLINE_PHRASES),
+        'outline_phrase_in_tail': any(phrase in tail for phrase in OUTLINE_PHRASES),
+        'ends_with_question': last_line.endswith('?'),
+    }
+
+
+def lesson_completeness_score(features: Dict[str, Any]) -> float:
+    """Higher means more likely a complete lesson."""
+    score = 0.0
+    if features['words'] >= 400:
+        score += 2.0
+    elif features['words'] >= 250:
+        score += 1.0
+    score += min(features['developed_sections'], 4)
+    score += 0.5 * min(features['markers'], 4)
+    if features['outline_phrase_in_tail']:
+        score -= 3.0
+    elif features['outline_phrase']:
+        score -= 1.5
+    if features['ends_with_question']:
+        # Finished lessons often end by asking for feedback too, so this is weak
+        score -= 0.5
+    if features['prose_ratio'] < 0.3:
+        score -= 2.0
+    return score
+
+
+def classify_lesson_completeness(text: str) -> Optional[str]:
+    """Return 'yes' or 'no' when the structure is conclusive, None when ambiguous."""
+    features = lesson_completeness_features(text)
+    # A response is only a draft for sure if it says so by proposing an outline
+    # or asking to go on. Short turns, trailing questions and low-scoring prose
+    # without such a phrase go to the LLM.
+    if features['words'] < MIN_LESSON_WORDS:
+        if features['outline_phrase']:
+            return 'no'
+        logger.debug(f"Lesson completeness ambiguous (short turn): {features}")
+        return None
+    score = lesson_completeness_score(features)
+    if score >= YES_THRESHOLD:
+        return 'yes'
+    if score <= NO_THRESHOLD and features['outline_phrase']:
+        return 'no'
+    logger.debug(f"Lesson completeness ambiguous (score {score:.1f}): {features}")
+    return None
@@ -0,0 +1,165 @@
+"""
+Per-lesson index over the lesson's own content.
+
+Student Q&A used to paste the whole lesson into every prompt. Instead the
+content is split into chunks and embedded once per content version, in
+the background when a lesson is saved. A question then only sends the
+top-k chunks that fit in LESSON_CONTEXT_TOKENS. Lessons already under the
+budget are sent whole. A question that arrives before the index is ready
+gets truncated content and schedules the build, so embedding a long lesson
+never runs on the request path.
+
+Each chunk records a hash of the content it came from, so an index built
+before the lesson was edited is detected and rebuilt.
+"""
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+from app.config import Config
+from app.utils.context_budget import count_tokens, truncate_to_tokens
+from app.utils.embeddings import get_embeddings
+from .index_store import LessonIndexStore
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000     # Characters per chunk
+CHUNK_OVERLAP = 100
+CHUNK_SEPARATOR = "\n\n...\n\n"
+
+lesson_content_index_store = LessonIndexStore(
+    root=Config.LESSON_CONTENT_INDEX_DIR,
+    max_bytes=Config.INDEX_CACHE_MB * 1024 * 1024
+)
+
+BUILD_LOCK_STRIPES = 64
+# Builds of the same lesson serialize; different lessons build in parallel
+_build_locks = [threading.Lock() for _ in range(BUILD_LOCK_STRIPES)]
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+
+def _index_hash(vector_store) -> Optional[str]:
+    try:
+        first = vector_store.docstore.search(vector_store.index_to_docstore_id[0])
+        return first.metadata.get('content_hash')
+    except Exception:
+        return None
+
+
+def build_content_index(lesson_id: int, content: str):
+    """Chunk, embed and save a lesson's content. Returns the index (None for empty content)."""
+    if not (content or '').strip():
+        lesson_content_index_store.delete(lesson_id)
+        return None
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_text(content)
+    digest = content_hash(content)
+    metadatas = [{'lesson_id': lesson_id, 'position': i, 'content_hash': digest}
+                 for i in range(len(chunks))]
+    vector_store = FAISS.from_texts(chunks, get_embeddings(), metadatas=metadatas)
+    lesson_content_index_store.save(lesson_id, vector_store)
+    logger.info(f"Built content index for lesson {lesson_id} ({len(chunks)} chunks)")
+    return vector_store
+
+
+def get_content_index(lesson_id: int, content: str, build: bool = True):
+    """Return an index matching the lesson's current content.
+
+    If it is missing or stale it is built, or with build=False None is returned.
+    """
+    digest = content_hash(content)
+    vector_store = lesson_content_index_store.get(lesson_id)
+    if vector_store is not None and _index_hash(vector_store) == digest:
+        return vector_store
+    if not build:
+        return None
+    with _build_locks[lesson_id % BUILD_LOCK_STRIPES]:
+        # Another thread may have built it while we waited
+        vector_store = lesson_content_index_store.get(lesson_id)
+        if vector_store is not None and _index_hash(vector_store) == digest:
+            return vector_store
+        return build_content_index(lesson_id, content)
+
+
+def _index_lesson(lesson_id: int) -> None:
+    from app.models.models import LessonModel
+    from .global_index import sync_lesson_family
+    lesson = LessonModel.get_lesson_by_id(lesson_id)
+    if lesson:
+        get_content_index(lesson_id, lesson.get('content') or '')
+    else:
+        delete_content_index(lesson_id)
+    # Also picks up publishing, new versions and deletes
+    sync_lesson_family(lesson_id)
+
+
+def schedule_content_index(lesson_id: int) -> None:
+    """Bring the lesson's content index and its place in the cross-lesson index up to date, in the background."""
+    from app.utils.background import submit_background
+    try:
+        submit_background(_index_lesson, lesson_id, key=f"lesson_content_index:{lesson_id}")
+    except Exception as e:
+        # The index is built on first question instead
+        logger.warning(f"Could not schedule content index for lesson {lesson_id}: {str(e)}")
+
+
+def delete_content_index(lesson_id: int) -> bool:
+    return lesson_content_index_store.delete(lesson_id)
+
+
+def lesson_context(lesson: Dict[str, Any], query: Optional[str] = None,
+                   max_tokens: Optional[int] = None, k: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """Lesson content to put in a prompt, within max_tokens.
+
+    With a query, the top-k chunks by similarity are packed in rank order.
+    Without one (summaries, key points, FAQs), chunks are sampled evenly
+    across the lesson. Either way they are sent in lesson order. Content
+    with no lesson id to index under is truncated instead.
+    Returns (text, stats).
+    """
+    content = lesson.get('content') or ''
+    max_tokens = max_tokens or Config.LESSON_CONTEXT_TOKENS
+    k = k or Config.LESSON_CONTEXT_K
+    total = count_tokens(content)
+    if total <= max_tokens:
+        return content, {'mode': 'full', 'tokens': total, 'content_tokens': total}
+
+    try:
+        if lesson.get('id') is None:
+            raise ValueError("no lesson id to index under")
+        vector_store = get_content_index(lesson['id'], content, build=False)
+        if vector_store is None:
+            schedule_content_index(lesson['id'])
+            raise ValueError("content index not built yet")
+        if query:
+            candidates = vector_store.similarity_search(query, k=k)
+        else:
+            documents = [vector_store.docstore.search(doc_id)
+                         for doc_id in vector_store.index_to_docstore_id.values()]
+            documents.sort(key=lambda doc: doc.metadata['position'])
+            step = max(1, len(documents) // k)
+            candidates = documents[::step]
+    except Exception as e:
+        logger.warning(f"Sending truncated content for lesson {lesson.get('id')}: {str(e)}")
+        text = truncate_to_tokens(content, max_tokens)
+        return text, {'mode': 'truncated', 'tokens': count_tokens(text), 'content_tokens': total}
+
+    separator_tokens = count_tokens(CHUNK_SEPARATOR)
+    packed = []
+    used = 0
+    for doc in candidates:
+        cost = count_tokens(doc.page_content) + (separator_tokens if packed else 0)
+        if used + cost > max_tokens:
+            continue
+        packed.append(doc)
+        used += cost
+    packed.sort(key=lambda doc: doc.metadata['position'])
+    text = CHUNK_SEPARATOR.join(doc.page_content for doc in packed)
+    return text, {'mode': 'retrieved', 'tokens': used, 'content_tokens': total, 'chunks': len(packed)}
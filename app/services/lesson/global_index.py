@@ -0,0 +1,185 @@
+"""
+Cross-lesson chunk index over every published lesson.
+
+When a student's question is not covered by the lesson they are viewing,
+one similarity search over this index finds the relevant parts of the
+other lessons. One LLM call then answers from them. This replaces
+re-asking the question against a list of candidate lessons.
+
+The index is a single partition of a PartitionedVectorStore, holding the
+chunks of the latest public version of each lesson. The vectors are
+copied from the lesson's own content index, so nothing is embedded twice.
+lesson_global_index records the content hash, doc id prefix and chunk
+count of each indexed lesson. That lets a lesson's old chunks be
+tombstoned when it is edited, unpublished, superseded by a new version or
+deleted. Each indexing run gets a fresh prefix, because tombstoned ids
+must never be reused.
+"""
+import os
+import uuid
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from filelock import FileLock
+
+from app.config import Config
+from app.utils.db import get_db
+from app.utils.context_budget import count_tokens
+from app.utils.vector_partitions import PartitionedVectorStore, DOC_ID_KEY
+from .content_index import content_hash, get_content_index
+
+logger = logging.getLogger(__name__)
+
+PARTITION = 'public'
+SWEEP_BATCH = 20  # Unindexed published lessons picked up per sync
+
+lesson_chunk_store = PartitionedVectorStore(Config.LESSON_GLOBAL_INDEX_DIR)
+
+
+def _sync_lock() -> FileLock:
+    # One writer across workers, so a lesson is never appended twice
+    os.makedirs(Config.LESSON_GLOBAL_INDEX_DIR, exist_ok=True)
+    return FileLock(os.path.join(Config.LESSON_GLOBAL_INDEX_DIR, 'sync.lock'), timeout=300)
+
+
+def _doc_id(prefix: str, position: int) -> str:
+    return f"{prefix}:{position}"
+
+
+def _sync_lesson(db, lesson_id: int) -> None:
+    lesson = db.execute(
+        'SELECT id, title, content, is_public, is_latest FROM lessons WHERE id = ?', (lesson_id,)
+    ).fetchone()
+    indexed = db.execute(
+        'SELECT content_hash, doc_prefix, chunk_count FROM lesson_global_index WHERE lesson_id = ?',
+        (lesson_id,)
+    ).fetchone()
+
+    wanted = bool(lesson and lesson['is_public'] and lesson['is_latest'] and (lesson['content'] or '').strip())
+    digest = content_hash(lesson['content']) if wanted else None
+    if indexed and indexed['content_hash'] == digest:
+        return
+
+    if indexed:
+        lesson_chunk_store.delete_documents(
+            PARTITION, [_doc_id(indexed['doc_prefix'], i) for i in range(indexed['chunk_count'])]
+        )
+        db.execute('DELETE FROM lesson_global_index WHERE lesson_id = ?', (lesson_id,))
+        db.commit()
+    if not wanted:
+        return
+
+    vector_store = get_content_index(lesson_id, lesson['content'])
+    prefix = f"{lesson_id}:{uuid.uuid4().hex[:12]}"
+    text_embeddings = []
+    metadatas = []
+    for number, (position, docstore_id) in enumerate(vector_store.index_to_docstore_id.items()):
+        doc = vector_store.docstore.search(docstore_id)
+        text_embeddings.append((doc.page_content, vector_store.index.reconstruct(int(position)).tolist()))
+        metadatas.append({
+            'lesson_id': lesson_id,
+            'title': lesson['title'],
+            'position': doc.metadata.get('position', number),
+            DOC_ID_KEY: _doc_id(prefix, number),
+        })
+    lesson_chunk_store.add_embeddings(PARTITION, text_embeddings, metadatas)
+    db.execute(
+        '''INSERT OR REPLACE INTO lesson_global_index (lesson_id, content_hash, doc_prefix, chunk_count)
+           VALUES (?, ?, ?, ?)''',
+        (lesson_id, digest, prefix, len(metadatas))
+    )
+    db.commit()
+    logger.info(f"Added lesson {lesson_id} to the cross-lesson index ({len(metadatas)} chunks)")
+
+
+def _sync(lesson_ids: List[int]) -> int:
+    db = get_db()
+    with _sync_lock():
+        for lesson_id in lesson_ids:
+            _sync_lesson(db, lesson_id)
+    return len(lesson_ids)
+
+
+def sync_lesson_family(lesson_id: int) -> int:
+    """Bring every version of this lesson up to date in the index.
+
+    Also drops deleted lessons and indexes a batch of published lessons
+    that are missing. That covers an older version that became the latest
+    when a newer one was deleted, and spreads the initial backfill.
+    """
+    try:
+        db = get_db()
+        rows = db.execute(
+            '''SELECT id FROM lessons
+               WHERE id = ? OR lesson_id = (SELECT lesson_id FROM lessons WHERE id = ?)
+               UNION
+               SELECT lesson_id FROM lesson_global_index
+               WHERE lesson_id = ? OR lesson_id NOT IN (SELECT id FROM lessons)
+               UNION
+               SELECT * FROM (
+                   SELECT id FROM lessons
+                   WHERE is_public = TRUE AND is_latest = TRUE
+                   AND id NOT IN (SELECT lesson_id FROM lesson_global_index)
+                   LIMIT ?
+               )''',
+            (lesson_id, lesson_id, lesson_id, SWEEP_BATCH)
+        ).fetchall()
+        return _sync([row[0] for row in rows])
+    except Exception as e:
+        logger.error(f"Error syncing lesson {lesson_id} into the cross-lesson index: {str(e)}")
+        raise
+
+
+def sync_all() -> int:
+    """Index every published lesson and drop everything else. Returns lessons checked."""
+    try:
+        db = get_db()
+        rows = db.execute(
+            '''SELECT id FROM lessons WHERE is_public = TRUE AND is_latest = TRUE
+               UNION
+               SELECT lesson_id FROM lesson_global_index'''
+        ).fetchall()
+        return _sync([row[0] for row in rows])
+    except Exception as e:
+        logger.error(f"Error rebuilding the cross-lesson index: {str(e)}")
+        raise
+
+
+def global_lesson_context(question: str, exclude_lesson_id: Optional[int] = None,
+                          max_tokens: Optional[int] = None,
+                          k: Optional[int] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """The chunks of published lessons most relevant to question, within max_tokens.
+
+    Returns (text, lessons), lessons being [{'id', 'title'}] in rank order.
+    """
+    max_tokens = max_tokens or Config.LESSON_CONTEXT_TOKENS
+    k = k or Config.LESSON_CONTEXT_K
+    # Over-fetch: the index can briefly hold lessons unpublished since the last sync
+    docs = lesson_chunk_store.search(PARTITION, question, k=k * 2)
+    if not docs:
+        return '', []
+
+    lesson_ids = list(dict.fromkeys(doc.metadata['lesson_id'] for doc in docs))
+    placeholders = ','.join('?' * len(lesson_ids))
+    live = {row[0] for row in get_db().execute(
+        f'''SELECT id FROM lessons
+            WHERE id IN ({placeholders}) AND is_public = TRUE AND is_latest = TRUE''',
+        lesson_ids
+    ).fetchall()}
+
+    parts = []
+    lessons = []
+    used = 0
+    for doc in docs:
+        lesson_id = doc.metadata['lesson_id']
+        if lesson_id not in live or lesson_id == exclude_lesson_id or len(parts) >= k:
+            continue
+        part = f"[Lesson: {doc.metadata.get('title', '')}]\n{doc.page_content}"
+        cost = count_tokens(part) + 2
+        if used + cost > max_tokens:
+            continue
+        parts.append(part)
+        used += cost
+        if lesson_id not in (lesson['id'] for lesson in lessons):
+            lessons.append({'id': lesson_id, 'title': doc.metadata.get('title', '')})
+    return "\n\n".join(parts), lessons
@@ -0,0 +1,157 @@
+"""
+Per-lesson FAISS index store.
+
+Each lesson's document index lives on disk under ``instance/indexes/<lesson_id>/``
+and loaded indexes are kept in an in-memory LRU bounded by bytes, so chat
+turns hit memory instead of deserializing the index every time.
+"""
+import os
+import shutil
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from app.config import Config
+from app.utils.embeddings import get_embeddings
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILES = ('index.faiss', 'index.pkl')
+
+
+class LessonIndexStore:
+    """Disk-backed FAISS indexes keyed by lesson id with a byte-bounded LRU cache"""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()  # key -> (vector_store, size_bytes, mtime)
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, lesson_id) -> str:
+        return os.path.join(self.root, str(lesson_id))
+
+    def _disk_info(self, lesson_id) -> Optional[Tuple[int, float]]:
+        """Return (size_bytes, mtime) of the on-disk index, or None if missing."""
+        path = self._path(lesson_id)
+        try:
+            size = 0
+            mtime = 0.0
+            for name in INDEX_FILES:
+                stat = os.stat(os.path.join(path, name))
+                size += stat.st_size
+                mtime = max(mtime, stat.st_mtime)
+            return size, mtime
+        except FileNotFoundError:
+            return None
+
+    def _evict_locked(self, key: str) -> None:
+        entry = self._cache.pop(key, None)
+        if entry:
+            self._cached_bytes -= entry[1]
+
+    def _insert_locked(self, key: str, vector_store, size: int, mtime: float) -> None:
+        self._evict_locked(key)
+        if size > self.max_bytes:
+            logger.info(f"Index for lesson {key} ({size} bytes) exceeds cache budget, not caching")
+            return
+        self._cache[key] = (vector_store, size, mtime)
+        self._cached_bytes += size
+        while self._cached_bytes > self.max_bytes and self._cache:
+            evicted_key, (_, evicted_size, _) = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted_size
+            logger.info(f"Evicted index for lesson {evicted_key} from memory ({evicted_size} bytes)")
+
+    def save(self, lesson_id, vector_store) -> None:
+        """Persist a lesson's index and keep it warm in memory."""
+        key = str(lesson_id)
+        target = self._path(key)
+        staging = f"{target}.tmp-{uuid.uuid4().hex}"
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            vector_store.save_local(staging)
+
+            # Swap the directory in so readers in other workers never see a partial index
+            trash = None
+            if os.path.exists(target):
+                trash = f"{target}.old-{uuid.uuid4().hex}"
+                os.replace(target, trash)
+            os.replace(staging, target)
+            if trash:
+                shutil.rmtree(trash, ignore_errors=True)
+
+            info = self._disk_info(key)
+            with self._lock:
+                if info:
+                    self._insert_locked(key, vector_store, info[0], info[1])
+            logger.info(f"Saved index for lesson {key} to {target}")
+        except Exception as e:
+            shutil.rmtree(staging, ignore_errors=True)
+            logger.error(f"Error saving index for lesson {key}: {str(e)}")
+            raise
+
+    def get(self, lesson_id):
+        """Return the lesson's index from memory or disk, or None if it has none."""
+        key = str(lesson_id)
+        info = self._disk_info(key)
+
+        with self._lock:
+            if info is None:
+                # Deleted (possibly by another worker); drop any stale copy
+                self._evict_locked(key)
+                return None
+            entry = self._cache.get(key)
+            if entry and entry[2] == info[1]:
+                self._cache.move_to_end(key)
+                return entry[0]
+
+        try:
+            vector_store = FAISS.load_local(
+                self._path(key),
+                get_embeddings(),
+                allow_dangerous_deserialization=True
+            )
+        except Exception as e:
+            logger.error(f"Error loading index for lesson {key}: {str(e)}")
+            return None
+
+        with self._lock:
+            self._insert_locked(key, vector_store, info[0], info[1])
+        logger.info(f"Loaded index for lesson {key} from disk ({info[0]} bytes)")
+        return vector_store
+
+    def delete(self, lesson_id) -> bool:
+        """Evict a lesson's index from memory and remove it from disk."""
+        key = str(lesson_id)
+        with self._lock:
+            self._evict_locked(key)
+        path = self._path(key)
+        if not os.path.exists(path):
+            return False
+        try:
+            shutil.rmtree(path)
+            logger.info(f"Deleted index for lesson {key}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting index for lesson {key}: {str(e)}")
+            return False
+
+    def stats(self) -> dict:
+        """Return cache occupancy for monitoring."""
+        with self._lock:
+            return {
+                'cached_indexes': len(self._cache),
+                'cached_bytes': self._cached_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+lesson_index_store = LessonIndexStore(
+    root=Config.INDEX_DIR,
+    max_bytes=Config.INDEX_CACHE_MB * 1024 * 1024
+)
@@ -6,10 +6,11 @@ import tempfile
 import os
 from typing import List, Dict, Any, Optional
 from langchain_core.documents import Document
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from app.utils.embeddings import get_embeddings
+
 # Disable tqdm threading to prevent "cannot start new thread" errors
 os.environ['TQDM_DISABLE'] = '1'
 os.environ['TOKENIZERS_PARALLELISM'] = 'false'
@@ -24,18 +25,8 @@ class RAGService:
     
     def __init__(self):
         """Initialize RAG service with embeddings and text splitter"""
-        # Configure embeddings to disable threading and progress bars
-        # Environment variables TQDM_DISABLE and TOKENIZERS_PARALLELISM are set at app startup
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={
-                'device': 'cpu',
-                'trust_remote_code': False
-            },
-            encode_kwargs={
-                'normalize_embeddings': False
-            }
-        )
+        # Embeddings are shared process-wide; constructing a RAGService is cheap
+        self.embeddings = get_embeddings()
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
@@ -97,13 +88,7 @@ class RAGService:
             # Create embeddings and vector store
             self.documents = all_chunks
             self.vector_store = FAISS.from_documents(all_chunks, self.embeddings)
-            #saved the vector
-
-            self.vector_store.save_local("vector_store.faiss")
-
-            
-           
-            logger.info("Vector store saved successfully")
+            # Persisting is keyed by lesson id, see TeacherLessonService.save_lesson_index
             self.use_rag = True
             
             logger.info("Vector store created successfully")
@@ -0,0 +1,229 @@
+"""
+Durable teacher chat sessions.
+
+Messages for each session (``lesson_<id>``) are stored in the
+``lesson_chat_sessions`` table of a small SQLite file in the coordination
+directory (not the main database, which read replicas mount read-only),
+so a teacher's next turn can land on any worker or container. Each process keeps a small LRU of recently used
+sessions in front of the table. A cached session is revalidated with one
+indexed MAX(id) lookup, so writes from other workers are picked up. Each
+session keeps only its most recent ``max_messages``. Idle sessions drop
+out of memory after ``idle_ttl`` and out of the table after ``retention``.
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from app.config import Config
+from app.utils.db import db_connection, get_pool
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE_TYPES = {
+    'human': HumanMessage,
+    'ai': AIMessage,
+    'system': SystemMessage,
+}
+
+
+class ChatSessionStore:
+    """SQLite-backed chat sessions with a bounded in-memory LRU front"""
+
+    def __init__(self, max_messages: int = 20, cache_size: int = 256,
+                 idle_ttl: float = 1800, retention: float = 30 * 86400,
+                 database: Optional[str] = None):
+        self.max_messages = max_messages
+        self.cache_size = cache_size
+        self.idle_ttl = idle_ttl
+        self.retention = retention
+        self.database = database
+        self._cache = OrderedDict()  # session_id -> (messages, last_id, last_used)
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._initialized_pid = None
+        self._init_lock = threading.Lock()
+
+    def _ensure_table(self) -> None:
+        if self._initialized_pid == os.getpid():
+            return
+        with self._init_lock:
+            if self._initialized_pid == os.getpid():
+                return
+            if self.database:
+                os.makedirs(os.path.dirname(self.database) or '.', exist_ok=True)
+            with get_pool(self.database).connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS lesson_chat_sessions (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT NOT NULL,
+                        role TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_lesson_chat_sessions_session ON lesson_chat_sessions(session_id, id)')
+            self._initialized_pid = os.getpid()
+
+    def _cache_put(self, session_id: str, messages: List[BaseMessage], last_id: int) -> None:
+        with self._lock:
+            self._cache[session_id] = (messages, last_id, time.monotonic())
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            # Drop idle sessions while we hold the lock anyway
+            cutoff = time.monotonic() - self.idle_ttl
+            while self._cache:
+                _, (_, _, last_used) = next(iter(self._cache.items()))
+                if last_used >= cutoff:
+                    break
+                self._cache.popitem(last=False)
+
+    def get_messages(self, session_id: str) -> List[BaseMessage]:
+        """Return the session's recent messages, oldest first."""
+        try:
+            self._ensure_table()
+            with db_connection(self.database) as conn:
+                row = conn.execute(
+                    'SELECT MAX(id) FROM lesson_chat_sessions WHERE session_id = ?',
+                    (session_id,)
+                ).fetchone()
+                last_id = row[0] or 0
+
+                with self._lock:
+                    entry = self._cache.get(session_id)
+                if entry and entry[1] == last_id:
+                    self._cache_put(session_id, entry[0], last_id)
+                    return list(entry[0])
+
+                rows = conn.execute(
+                    '''SELECT role, content FROM (
+                           SELECT id, role, content FROM lesson_chat_sessions
+                           WHERE session_id = ? ORDER BY id DESC LIMIT ?
+                       ) ORDER BY id''',
+                    (session_id, self.max_messages)
+                ).fetchall()
+            messages = [_MESSAGE_TYPES.get(row['role'], HumanMessage)(content=row['content']) for row in rows]
+            self._cache_put(session_id, messages, last_id)
+            return list(messages)
+        except Exception as e:
+            logger.error(f"Error loading chat session {session_id}: {str(e)}")
+            raise
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> None:
+        """Persist messages and trim the session to its most recent max_messages."""
+        if not messages:
+            return
+        now = time.time()
+        try:
+            self._ensure_table()
+            with db_connection(self.database) as conn:
+                conn.executemany(
+                    'INSERT INTO lesson_chat_sessions (session_id, role, content, created_at) VALUES (?, ?, ?, ?)',
+                    [(session_id, message.type, message.content, now) for message in messages]
+                )
+                conn.execute(
+                    '''DELETE FROM lesson_chat_sessions
+                       WHERE session_id = ? AND id <= (
+                           SELECT id FROM lesson_chat_sessions WHERE session_id = ?
+                           ORDER BY id DESC LIMIT 1 OFFSET ?
+                       )''',
+                    (session_id, session_id, self.max_messages)
+                )
+            # Reload on next read; another worker may have interleaved writes
+            with self._lock:
+                self._cache.pop(session_id, None)
+        except Exception as e:
+            logger.error(f"Error saving chat session {session_id}: {str(e)}")
+            raise
+        self._maybe_prune()
+
+    def clear(self, session_id: str) -> None:
+        """Delete a session everywhere."""
+        try:
+            self._ensure_table()
+            with db_connection(self.database) as conn:
+                conn.execute('DELETE FROM lesson_chat_sessions WHERE session_id = ?', (session_id,))
+            with self._lock:
+                self._cache.pop(session_id, None)
+        except Exception as e:
+            logger.error(f"Error clearing chat session {session_id}: {str(e)}")
+            raise
+
+    def prune(self, older_than: Optional[float] = None) -> int:
+        """Delete sessions with no activity within the retention window. Returns rows removed."""
+        cutoff = time.time() - (self.retention if older_than is None else older_than)
+        try:
+            self._ensure_table()
+            with db_connection(self.database) as conn:
+                cursor = conn.execute(
+                    '''DELETE FROM lesson_chat_sessions WHERE session_id IN (
+                           SELECT session_id FROM lesson_chat_sessions
+                           GROUP BY session_id HAVING MAX(created_at) < ?
+                       )''',
+                    (cutoff,)
+                )
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error pruning chat sessions: {str(e)}")
+            raise
+
+    def _maybe_prune(self) -> None:
+        # At most once an hour per process
+        if time.time() - self._last_prune < 3600:
+            return
+        self._last_prune = time.time()
+        try:
+            removed = self.prune()
+            if removed:
+                logger.info(f"Pruned {removed} expired chat session messages")
+        except Exception:
+            pass
+
+    def history(self, session_id: str) -> 'StoredChatMessageHistory':
+        """Chat history view for one session."""
+        return StoredChatMessageHistory(self, session_id)
+
+
+class StoredChatMessageHistory(BaseChatMessageHistory):
+    """BaseChatMessageHistory view of one session in a ChatSessionStore.
+
+    Meant to live for one request: messages are read once and reused until
+    this view writes to the session.
+    """
+
+    def __init__(self, store: ChatSessionStore, session_id: str):
+        self.store = store
+        self.session_id = session_id
+        self._messages = None
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        if self._messages is None:
+            self._messages = self.store.get_messages(self.session_id)
+        return self._messages
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.store.append(self.session_id, list(messages))
+        self._messages = None
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    def clear(self) -> None:
+        self.store.clear(self.session_id)
+        self._messages = None
+
+
+chat_session_store = ChatSessionStore(
+    max_messages=Config.CHAT_SESSION_MAX_MESSAGES,
+    cache_size=Config.CHAT_SESSION_CACHE_SIZE,
+    idle_ttl=Config.CHAT_SESSION_IDLE_TTL,
+    retention=Config.CHAT_SESSION_RETENTION_DAYS * 86400,
+    database=Config.CHAT_SESSION_DATABASE
+)
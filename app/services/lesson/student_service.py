@@ -1,15 +1,31 @@
 """
 Student-focused lesson service for learning and Q&A
 """
+import json
 import logging
 from typing import Dict, List, Any, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
 from .base_service import BaseLessonService
+from .content_index import content_hash, lesson_context
+from app.config import Config
+from app.utils.ollama_limiter import ollama_slot, PRIORITY_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
+# Phrases answer_lesson_question's prompt uses when the lesson doesn't cover a question
+NOT_FOUND_MARKERS = (
+    "is not related to the lesson",
+    "no relevant information about this topic is found in the lesson",
+)
+
+
+def is_not_found(answer: str) -> bool:
+    """Whether an answer says the lesson does not cover the question."""
+    answer = (answer or '').lower()
+    return any(marker in answer for marker in NOT_FOUND_MARKERS)
+
 
 class StudentLessonService(BaseLessonService):
     """
@@ -32,8 +48,9 @@ class StudentLessonService(BaseLessonService):
             if not lesson:
                 return {"error": "Lesson not found"}
 
-            lesson_content = lesson.get('content', '')
+            lesson_content, context_stats = lesson_context(lesson, question)
             lesson_title = lesson.get('title', 'this lesson')
+            logger.info(f"Lesson {lesson_id} context: {context_stats}")
 
             # Limit history for clarity but include enough for context
             history = (conversation_history or [])[-3:]
@@ -105,8 +122,70 @@ class StudentLessonService(BaseLessonService):
             return {"error": str(e)}
 
 
+    def answer_across_lessons(self, question: str, conversation_history: list = None,
+                              exclude_lesson_id: Optional[int] = None) -> Dict[str, Any]:
+        """Answer from the most relevant chunks of all published lessons, in one LLM call."""
+        try:
+            from .global_index import global_lesson_context
+            lesson_context_text, lessons = global_lesson_context(question, exclude_lesson_id=exclude_lesson_id)
+            if not lessons:
+                return {"error": "No relevant lesson content found"}
+
+            history = (conversation_history or [])[-3:]
+            formatted_history = "\n".join(
+                f"Student Question: {h.get('question', '')}\nAI Answer: {h.get('answer', '')}"
+                for h in history if h
+            ) or "No previous conversation."
+
+            prompt = ChatPromptTemplate.from_template("""
+        You are a helpful teaching assistant.
+
+        Answer the student's question using the lesson excerpts below. Each excerpt
+        starts with the title of the lesson it comes from; mention that lesson in
+        your answer. If the excerpts do not cover the question, say so and offer
+        to answer it using your own knowledge.
+
+        Lesson Excerpts:
+        {lesson_content}
+
+        Current Student Question: {question}
+
+        Conversation History:
+        {formatted_history}
+        """)
+
+            chain = prompt | self.llm | StrOutputParser()
+
+            answer = chain.invoke({
+                "lesson_content": lesson_context_text,
+                "question": question,
+                "formatted_history": formatted_history,
+            })
+
+            return {
+                "answer": answer.strip(),
+                "question": question,
+                "source": "lesson_index",
+                "relevant_lessons": lessons
+            }
+
+        except Exception as e:
+            logger.exception("Error answering question across lessons")
+            return {"error": str(e)}
+
+    def _cached_artifact(self, lesson: Dict[str, Any], artifact_type: str, generate):
+        """Return the artifact for the lesson's current content, generating and caching it on a miss"""
+        from app.models.models import LessonModel
+        digest = content_hash(lesson.get('content') or '')
+        payload = LessonModel.get_artifact(lesson['id'], artifact_type, digest)
+        if payload is not None:
+            return json.loads(payload)
+        value = generate()
+        LessonModel.save_artifact(lesson['id'], artifact_type, digest, json.dumps(value))
+        return value
+
     def get_lesson_faqs(self, lesson_id: int, limit: int = 5) -> List[Dict[str, str]]:
-        """Get frequently asked questions for a lesson"""
+        """Get frequently asked questions for a lesson (cached per content version)"""
         try:
             from app.models.models import LessonModel
             lesson = LessonModel.get_lesson_by_id(lesson_id)
@@ -114,40 +193,44 @@ class StudentLessonService(BaseLessonService):
             if not lesson:
                 return []
             
-            lesson_content = lesson.get('content', '')
-            lesson_title = lesson.get('title', '')
-            
-            # Create prompt for FAQ generation
-            prompt = ChatPromptTemplate.from_template("""
-            Based on the following lesson content, generate {limit} frequently asked questions that students might have.
-            
-            Lesson Title: {lesson_title}
-            Lesson Content: {lesson_content}
-            
-            For each question, provide:
-            1. The question
-            2. A clear, educational answer
-            
-            Format as JSON with this structure:
-            [
-                {{"question": "Question text", "answer": "Answer text"}},
-                ...
-            ]
-            """)
-            
-            chain = prompt | self.llm | StrOutputParser()
-            
-            faq_response = chain.invoke({
-                "lesson_title": lesson_title,
-                "lesson_content": lesson_content,
-                "limit": limit
-            })
-            
-            # Parse JSON response
-            import json
-            try:
+            def generate():
+                lesson_content, _ = lesson_context(lesson)
+                lesson_title = lesson.get('title', '')
+                
+                # Create prompt for FAQ generation
+                prompt = ChatPromptTemplate.from_template("""
+                Based on the following lesson content, generate {limit} frequently asked questions that students might have.
+                
+                Lesson Title: {lesson_title}
+                Lesson Content: {lesson_content}
+                
+                For each question, provide:
+                1. The question
+                2. A clear, educational answer
+                
+                Format as JSON with this structure:
+                [
+                    {{"question": "Question text", "answer": "Answer text"}},
+                    ...
+                ]
+                """)
+                
+                chain = prompt | self.llm | StrOutputParser()
+                
+                # Precomputable, so it yields to interactive requests
+                with ollama_slot(priority=PRIORITY_BACKGROUND):
+                    faq_response = chain.invoke({
+                        "lesson_title": lesson_title,
+                        "lesson_content": lesson_content,
+                        "limit": limit
+                    })
+                
+                # Unparseable output raises, so it is not cached
                 faqs = json.loads(faq_response)
                 return faqs[:limit]  # Ensure we don't exceed the limit
+            
+            try:
+                return self._cached_artifact(lesson, f"faqs:{limit}", generate)
             except json.JSONDecodeError:
                 # Fallback if JSON parsing fails
                 return [{"question": "What is this lesson about?", "answer": "This lesson covers important concepts and topics."}]
@@ -157,7 +240,7 @@ class StudentLessonService(BaseLessonService):
             return []
 
     def get_lesson_summary(self, lesson_id: int) -> Dict[str, str]:
-        """Get a summary of the lesson for students"""
+        """Get a summary of the lesson for students (cached per content version)"""
         try:
             from app.models.models import LessonModel
             lesson = LessonModel.get_lesson_by_id(lesson_id)
@@ -165,30 +248,36 @@ class StudentLessonService(BaseLessonService):
             if not lesson:
                 return {"error": "Lesson not found"}
             
-            lesson_content = lesson.get('content', '')
             lesson_title = lesson.get('title', '')
             
-            # Create prompt for lesson summary
-            prompt = ChatPromptTemplate.from_template("""
-            Create a student-friendly summary of this lesson.
-            
-            Lesson Title: {lesson_title}
-            Lesson Content: {lesson_content}
-            
-            Provide:
-            1. A brief overview of what students will learn
-            2. Key concepts they should understand
-            3. Why this lesson is important
-            
-            Keep it concise and engaging for students.
-            """)
-            
-            chain = prompt | self.llm | StrOutputParser()
-            
-            summary = chain.invoke({
-                "lesson_title": lesson_title,
-                "lesson_content": lesson_content
-            })
+            def generate():
+                lesson_content, _ = lesson_context(lesson)
+                
+                # Create prompt for lesson summary
+                prompt = ChatPromptTemplate.from_template("""
+                Create a student-friendly summary of this lesson.
+                
+                Lesson Title: {lesson_title}
+                Lesson Content: {lesson_content}
+                
+                Provide:
+                1. A brief overview of what students will learn
+                2. Key concepts they should understand
+                3. Why this lesson is important
+                
+                Keep it concise and engaging for students.
+                """)
+                
+                chain = prompt | self.llm | StrOutputParser()
+                
+                # Precomputable, so it yields to interactive requests
+                with ollama_slot(priority=PRIORITY_BACKGROUND):
+                    return chain.invoke({
+                        "lesson_title": lesson_title,
+                        "lesson_content": lesson_content
+                    })
+            
+            summary = self._cached_artifact(lesson, "summary", generate)
             
             return {
                 "summary": summary,
@@ -201,7 +290,7 @@ class StudentLessonService(BaseLessonService):
             return {"error": f"Failed to generate summary: {str(e)}"}
 
     def get_lesson_key_points(self, lesson_id: int) -> List[str]:
-        """Extract key learning points from a lesson"""
+        """Extract key learning points from a lesson (cached per content version)"""
         try:
             from app.models.models import LessonModel
             lesson = LessonModel.get_lesson_by_id(lesson_id)
@@ -209,40 +298,48 @@ class StudentLessonService(BaseLessonService):
             if not lesson:
                 return []
             
-            lesson_content = lesson.get('content', '')
-            lesson_title = lesson.get('title', '')
-            
-            # Create prompt for key points extraction
-            prompt = ChatPromptTemplate.from_template("""
-            Extract the key learning points from this lesson.
-            
-            Lesson Title: {lesson_title}
-            Lesson Content: {lesson_content}
-            
-            Provide a list of 5-10 key points that students should remember.
-            Each point should be clear and concise.
-            
-            Format as a simple list, one point per line.
-            """)
-            
-            chain = prompt | self.llm | StrOutputParser()
-            
-            key_points_response = chain.invoke({
-                "lesson_title": lesson_title,
-                "lesson_content": lesson_content
-            })
-            
-            # Split response into list
-            key_points = [point.strip() for point in key_points_response.split('\n') if point.strip()]
-            return key_points[:10]  # Limit to 10 points
+            def generate():
+                lesson_content, _ = lesson_context(lesson)
+                lesson_title = lesson.get('title', '')
+                
+                # Create prompt for key points extraction
+                prompt = ChatPromptTemplate.from_template("""
+                Extract the key learning points from this lesson.
+                
+                Lesson Title: {lesson_title}
+                Lesson Content: {lesson_content}
+                
+                Provide a list of 5-10 key points that students should remember.
+                Each point should be clear and concise.
+                
+                Format as a simple list, one point per line.
+                """)
+                
+                chain = prompt | self.llm | StrOutputParser()
+                
+                # Precomputable, so it yields to interactive requests
+                with ollama_slot(priority=PRIORITY_BACKGROUND):
+                    key_points_response = chain.invoke({
+                        "lesson_title": lesson_title,
+                        "lesson_content": lesson_content
+                    })
+                
+                # Split response into list
+                key_points = [point.strip() for point in key_points_response.split('\n') if point.strip()]
+                return key_points[:10]  # Limit to 10 points
+            
+            return self._cached_artifact(lesson, "key_points", generate)
             
         except Exception as e:
             logger.error(f"Error extracting lesson key points: {str(e)}")
             return []
 
-    def llm_answer(self, lesson_content: str, question: str, lesson_title: str = "this lesson") -> str:
+    def llm_answer(self, lesson_content: str, question: str, lesson_title: str = "this lesson",
+                   lesson_id: Optional[int] = None) -> str:
         """Generate an answer using the LLM with lesson-specific context"""
         try:
+            # With a lesson id, send only the chunks relevant to the question
+            lesson_content, _ = lesson_context({'id': lesson_id, 'content': lesson_content}, question)
             prompt = ChatPromptTemplate.from_template("""
             You are a helpful teaching assistant. Answer the student's question based on the lesson content.
             
@@ -278,7 +375,7 @@ class StudentLessonService(BaseLessonService):
             if not lesson:
                 return question
             
-            lesson_content = lesson.get('content', '')
+            lesson_content, _ = lesson_context(lesson, question)
             
             # Create prompt for question canonicalization
             prompt = ChatPromptTemplate.from_template("""
@@ -293,13 +390,35 @@ class StudentLessonService(BaseLessonService):
             
             chain = prompt | self.llm | StrOutputParser()
             
-            canonical_question = chain.invoke({
-                "lesson_content": lesson_content,
-                "question": question
-            })
+            # Precomputable, so it yields to interactive requests
+            with ollama_slot(priority=PRIORITY_BACKGROUND):
+                canonical_question = chain.invoke({
+                    "lesson_content": lesson_content,
+                    "question": question
+                })
             
             return canonical_question.strip()
             
         except Exception as e:
             logger.error(f"Error canonicalizing question: {str(e)}")
             return question
+
+
+def precompute_lesson_artifacts(lesson_id: int) -> None:
+    """Generate and cache a lesson's summary, key points and FAQs."""
+    service = StudentLessonService(groq_api_key='')
+    service.get_lesson_summary(lesson_id)
+    service.get_lesson_key_points(lesson_id)
+    service.get_lesson_faqs(lesson_id)
+
+
+def schedule_lesson_artifacts(lesson_id: int) -> None:
+    """Precompute a finalized lesson's artifacts in the background, if enabled."""
+    if not Config.LESSON_ARTIFACTS_PRECOMPUTE:
+        return
+    from app.utils.background import submit_background
+    try:
+        submit_background(precompute_lesson_artifacts, lesson_id, key=f"lesson_artifacts:{lesson_id}")
+    except Exception as e:
+        # They are generated on first request instead
+        logger.warning(f"Could not schedule artifacts for lesson {lesson_id}: {str(e)}")
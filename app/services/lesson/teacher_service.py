@@ -5,6 +5,7 @@ import os
 import logging
 import tempfile
 from typing import Any, Dict, List, Optional
+from functools import lru_cache
 
 # Disable tqdm threading to prevent "cannot start new thread" errors
 os.environ['TQDM_DISABLE'] = '1'
@@ -23,6 +24,9 @@ import json
 from .base_service import BaseLessonService
 from .models import LessonResponse, LessonPlan
 from .rag_service import RAGService
+from .index_store import lesson_index_store
+from .session_store import chat_session_store
+from app.utils.context_budget import count_tokens, truncate_to_tokens, pack_prompt
 
 from app.models.models import LessonModel
 
@@ -67,6 +71,8 @@ import re
 from langchain_core.runnables import RunnableLambda
 from langchain_core.runnables.config import RunnableConfig
 from langchain_ollama import ChatOllama
+from app.utils.ollama_limiter import LimitedChatOllama, OllamaQueueFull
+from .completeness import classify_lesson_completeness
 
 
 
@@ -81,17 +87,23 @@ class InteractiveChatResponse(BaseModel):
     ai_response: str = Field(..., description="The AI's response text")
     complete_lesson: Literal["yes", "no"] = Field(..., description="Whether the complete lesson has been generated ('yes') or still in draft/outline stage ('no')")
 
+@lru_cache(maxsize=1)
+def _get_completeness_llm():
+    """Structured-output client for the ambiguous completeness cases, built once per process"""
+    ollama_base_url = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+    llm = LimitedChatOllama(model="qwen2.5:1.5b", base_url=ollama_base_url)
+    return llm.with_structured_output(lesson_response)
+
 def check_lesson_response(text: str, groq_api_key: str):
     """Check if the AI response indicates a complete lesson has been generated"""
-    # llm = ChatGroq(
-    #     groq_api_key=groq_api_key,
-    #     model_name="llama-3.1-8b-instant",
-    #     temperature=0.1
-    # )
-    ollama_base_url = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
-    ollama_model = os.getenv('OLLAMA_MODEL', 'qwen2.5:3b')
-    llm = ChatOllama(model="qwen2.5:1.5b", base_url=ollama_base_url)
-    
+    # Most responses are conclusive from their structure alone
+    verdict = classify_lesson_completeness(text)
+    if verdict is not None:
+        return lesson_response(complete_lesson=verdict)
+    return _llm_lesson_check(text)
+
+def _llm_lesson_check(text: str):
+    """Ask the LLM whether the response is a complete lesson"""
     # Create a prompt to analyze if the response is a complete lesson or just an outline/draft
     analysis_prompt = f"""Analyze the following AI response and determine if it contains a COMPLETE LESSON or just an OUTLINE/DRAFT.
 
@@ -112,8 +124,7 @@ AI Response:
 
 Determine if this is a complete lesson (yes) or still a draft/outline (no)."""
 
-    llm_with_structured_output = llm.with_structured_output(lesson_response)
-    return llm_with_structured_output.invoke(analysis_prompt)
+    return _get_completeness_llm().invoke(analysis_prompt)
 
 class TeacherLessonService(BaseLessonService):
     """
@@ -127,10 +138,6 @@ class TeacherLessonService(BaseLessonService):
     7. User/teacher can download the final version.
     """
     
-    # Class-level dictionary to persist chat histories across service instances
-    # This ensures conversation history persists across HTTP requests
-    _chat_histories = {}
-    
     def __init__(self, groq_api_key: str):
         super().__init__(groq_api_key)
         self.rag_service = RAGService()
@@ -224,29 +231,44 @@ class TeacherLessonService(BaseLessonService):
 
     
     
+    def save_lesson_index(self, lesson_id: int) -> bool:
+        """Persist the index built by process_file under the given lesson id.
+
+        The lesson row is already committed, so a failure here is logged and
+        reported as False rather than raised; the lesson still works without
+        document context.
+        """
+        if not self.rag_service.vector_store:
+            teacher_logger.info(f"No document index to save for lesson {lesson_id}")
+            return False
+        try:
+            lesson_index_store.save(lesson_id, self.rag_service.vector_store)
+        except Exception as e:
+            teacher_logger.error(f"Error saving document index for lesson {lesson_id}: {str(e)}")
+            return False
+        teacher_logger.info(f"Document index saved for lesson {lesson_id}")
+        return True
+
+    def _get_lesson_retriever(self, lesson_id: int, k: int = 5):
+        """Return a retriever over the lesson's document index, or None if it has none"""
+        vector_db = lesson_index_store.get(lesson_id)
+        if vector_db is None:
+            teacher_logger.warning(f"No document index found for lesson {lesson_id}, continuing without context")
+            return None
+        # Keep k at 5 to stay within token limits
+        return vector_db.as_retriever(search_type="similarity", search_kwargs={"k": k})
+
     def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
-        """Get or create chat history for a session"""
-        # Use class-level dictionary to persist history across service instances
-        if session_id not in TeacherLessonService._chat_histories:
-            TeacherLessonService._chat_histories[session_id] = InMemoryChatMessageHistory()
-            teacher_logger.info(f"Created new chat history for session: {session_id}")
-        else:
-            history = TeacherLessonService._chat_histories[session_id]
-            message_count = len(history.messages) if hasattr(history, 'messages') else 0
-            teacher_logger.info(f"Retrieved existing chat history for session: {session_id} ({message_count} messages)")
-        return TeacherLessonService._chat_histories[session_id]
+        """Get the persistent chat history for a session (shared across workers)"""
+        return chat_session_store.history(session_id)
 
     def _estimate_tokens(self, text: str) -> int:
-        """Rough token estimation: ~4 characters per token"""
-        return len(text) // 4
+        """Token count of text (cl100k_base, memoized)"""
+        return count_tokens(text)
     
     def _truncate_text(self, text: str, max_tokens: int) -> str:
         """Truncate text to fit within token limit"""
-        max_chars = max_tokens * 4
-        if len(text) <= max_chars:
-            return text
-        # Truncate and add indicator
-        return text[:max_chars - 50] + "... [truncated]"
+        return truncate_to_tokens(text, max_tokens)
     
     def format_context(self, relevant_chunks: List[Document], max_tokens: int = 2000) -> str:
         """Format context and escape curly braces to prevent LangChain template errors"""
@@ -258,6 +280,29 @@ class TeacherLessonService(BaseLessonService):
         escaped_context = rag_context.replace("{", "{{").replace("}", "}}")
         return escaped_context
     
+    def _build_chat_messages(self, base_system_prompt: str, query: str, docs: List[Document],
+                             chat_history: BaseChatMessageHistory, uploaded_doc_content: str = ""):
+        """Fit the system prompt, retrieved context, chat history and query into the model's budget"""
+        history = [
+            {"role": "user" if msg.type == "human" else "assistant", "content": msg.content}
+            for msg in chat_history.messages
+        ]
+        messages, budget_stats = pack_prompt(
+            base_system_prompt,
+            query,
+            history=history,
+            chunks=[doc.page_content for doc in docs],
+            context_header="\n\n### Knowledge Base Context:\n",
+            context_footer=uploaded_doc_content,
+            max_message_tokens=500
+        )
+        teacher_logger.info(
+            f"Built message array with {len(messages)} messages, {budget_stats['tokens']}/{budget_stats['budget']} tokens "
+            f"({budget_stats['chunks']} chunks, {budget_stats['history']} history messages; dropped "
+            f"{budget_stats['chunks_dropped']} chunks, {budget_stats['history_dropped']} history messages)"
+        )
+        return messages
+    
     def _format_context_for_system_prompt(self, relevant_chunks: List[Document]) -> str:
         """Format context for system prompt without escaping (will be escaped later)"""
         return "\n\n".join([doc.page_content for doc in relevant_chunks])
@@ -282,15 +327,8 @@ class TeacherLessonService(BaseLessonService):
             session_id = f"lesson_{lesson_id}"
         
         try:
-            # Step 1: Load vector DB
-            vector_db = FAISS.load_local(
-                "vector_store.faiss", 
-                self.rag_service.embeddings, 
-                allow_dangerous_deserialization=True
-            )
-            # Reduce k to 5 to stay within token limits (was 15)
-            retriever = vector_db.as_retriever(search_type="similarity", search_kwargs={"k": 5})
-            teacher_logger.info("Vector DB loaded successfully")
+            # Step 1: Get the lesson's vector DB (served from memory after the first turn)
+            retriever = self._get_lesson_retriever(lesson_id)
             
             # Step 2: Handle uploaded document content
             uploaded_doc_content = ""
@@ -324,7 +362,7 @@ class TeacherLessonService(BaseLessonService):
             if is_first_message and document_uploaded:
                 try:
                     overview_query = "What is this document about? Provide a brief summary."
-                    overview_docs = retriever.invoke(overview_query)
+                    overview_docs = retriever.invoke(overview_query) if retriever else []
                     if overview_docs:
                         doc_summary = "\n".join([doc.page_content[:200] for doc in overview_docs[:3]])
                         enhanced_query = f"{user_query}\n\n[Document Context: {doc_summary}...]"
@@ -336,112 +374,23 @@ class TeacherLessonService(BaseLessonService):
             teacher_logger.info("Starting manual chain execution (no threading)")
             
             # Step 7: Retrieve context from vector store
-            docs = retriever.invoke(enhanced_query)
-            # Limit context to 1500 tokens to leave room for system prompt and chat history
-            context = self.format_context(docs, max_tokens=1500)
+            docs = retriever.invoke(enhanced_query) if retriever else []
             teacher_logger.info(f"Retrieved {len(docs)} documents from vector store")
             
-            # Step 8: Build messages array manually with token management
-            messages = []
-            
-            # Add system message with context
-            system_content = f"{base_system_prompt}\n\n### Knowledge Base Context:\n{context}{uploaded_doc_content}"
-            messages.append({"role": "system", "content": system_content})
+            # Step 8: Pack system prompt, context, history and query into the token budget
+            messages = self._build_chat_messages(
+                base_system_prompt, enhanced_query, docs, chat_history, uploaded_doc_content
+            )
             
-            # Add chat history messages (limit to last 10 messages to prevent token overflow)
-            if hasattr(chat_history, 'messages'):
-                history_messages = list(chat_history.messages)
-                # Keep only the most recent 10 messages (5 exchanges)
-                if len(history_messages) > 10:
-                    history_messages = history_messages[-10:]
-                    teacher_logger.info(f"Truncated chat history to last 10 messages (from {len(chat_history.messages)})")
-                
-                for msg in history_messages:
-                    if hasattr(msg, 'type'):
-                        role = "user" if msg.type == "human" else "assistant"
-                        content = msg.content if hasattr(msg, 'content') else str(msg)
-                        # Truncate individual messages if too long (max 500 tokens per message)
-                        if self._estimate_tokens(content) > 500:
-                            content = self._truncate_text(content, 500)
-                        messages.append({"role": role, "content": content})
-            
-            # Add current user query
-            messages.append({"role": "user", "content": enhanced_query})
-            
-            # Estimate total tokens before sending
-            total_text = "\n".join([msg.get("content", "") for msg in messages])
-            estimated_tokens = self._estimate_tokens(total_text)
-            teacher_logger.info(f"Built message array with {len(messages)} messages, estimated tokens: {estimated_tokens}")
-            
-            # If estimated tokens exceed limit, reduce context further
-            if estimated_tokens > 5500:  # Leave some buffer below 6000 limit
-                teacher_logger.warning(f"Estimated tokens ({estimated_tokens}) exceed safe limit, reducing context")
-                # Reduce context to 800 tokens
-                context = self.format_context(docs, max_tokens=800)
-                system_content = f"{base_system_prompt}\n\n### Knowledge Base Context:\n{context}{uploaded_doc_content}"
-                messages[0] = {"role": "system", "content": system_content}
-                # Re-estimate
-                total_text = "\n".join([msg.get("content", "") for msg in messages])
-                estimated_tokens = self._estimate_tokens(total_text)
-                teacher_logger.info(f"After reduction, estimated tokens: {estimated_tokens}")
-            
-            # Step 9: Call LLM directly (no chain, no threading) with retry logic
+            # Step 9: Call LLM directly (no chain, no threading)
             teacher_logger.info("Calling LLM directly...")
-            try:
-                response = self.llm.invoke(messages)
-                response_text = response.content if hasattr(response, 'content') else str(response)
-                teacher_logger.info(f"LLM response received: {len(response_text)} characters")
-            except Exception as e:
-                error_str = str(e)
-                # Check if it's a 413 error (payload too large) or token limit error
-                is_token_error = (
-                    "413" in error_str or 
-                    "too large" in error_str.lower() or 
-                    "tokens per minute" in error_str.lower() or
-                    "rate_limit_exceeded" in error_str.lower() or
-                    "request too large" in error_str.lower()
-                )
-                
-                if is_token_error:
-                    teacher_logger.warning(f"Request too large (token limit error), retrying with reduced context. Error: {error_str[:200]}")
-                    # Retry with minimal context (500 tokens)
-                    context = self.format_context(docs, max_tokens=500)
-                    system_content = f"{base_system_prompt}\n\n### Knowledge Base Context:\n{context}"
-                    messages[0] = {"role": "system", "content": system_content}
-                    # Also reduce chat history to last 4 messages
-                    if hasattr(chat_history, 'messages'):
-                        history_messages = list(chat_history.messages)
-                        if len(history_messages) > 4:
-                            history_messages = history_messages[-4:]
-                        # Rebuild messages with reduced history
-                        messages = [{"role": "system", "content": system_content}]
-                        for msg in history_messages:
-                            if hasattr(msg, 'type'):
-                                role = "user" if msg.type == "human" else "assistant"
-                                content = msg.content if hasattr(msg, 'content') else str(msg)
-                                content = self._truncate_text(content, 300)  # Further truncate
-                                messages.append({"role": role, "content": content})
-                        messages.append({"role": "user", "content": enhanced_query})
-                    # Re-estimate tokens after reduction
-                    total_text = "\n".join([msg.get("content", "") for msg in messages])
-                    estimated_tokens = self._estimate_tokens(total_text)
-                    teacher_logger.info(f"Retrying with reduced context and chat history. Estimated tokens: {estimated_tokens}")
-                    try:
-                        response = self.llm.invoke(messages)
-                        response_text = response.content if hasattr(response, 'content') else str(response)
-                        teacher_logger.info(f"LLM response received after retry: {len(response_text)} characters")
-                    except Exception as retry_error:
-                        teacher_logger.error(f"Retry also failed: {str(retry_error)}")
-                        # If retry fails, return a helpful error message
-                        raise Exception(f"Request exceeds token limit even after reduction. Please try with a shorter query or less context. Original error: {error_str[:200]}")
-                else:
-                    # Re-raise if it's a different error
-                    raise
+            response = self.llm.invoke(messages)
+            response_text = response.content if hasattr(response, 'content') else str(response)
+            teacher_logger.info(f"LLM response received: {len(response_text)} characters")
             
             # Step 10: Update chat history manually
             from langchain_core.messages import HumanMessage, AIMessage
-            chat_history.add_message(HumanMessage(content=enhanced_query))
-            chat_history.add_message(AIMessage(content=response_text))
+            chat_history.add_messages([HumanMessage(content=enhanced_query), AIMessage(content=response_text)])
             teacher_logger.info(f"Chat history updated for session: {session_id}")
             
         except Exception as e:
@@ -494,14 +443,8 @@ class TeacherLessonService(BaseLessonService):
         complete_lesson_status = "no"
         
         try:
-            # Step 1: Load vector DB
-            vector_db = FAISS.load_local(
-                "vector_store.faiss", 
-                self.rag_service.embeddings, 
-                allow_dangerous_deserialization=True
-            )
-            retriever = vector_db.as_retriever(search_type="similarity", search_kwargs={"k": 5})
-            teacher_logger.info("Vector DB loaded successfully")
+            # Step 1: Get the lesson's vector DB (served from memory after the first turn)
+            retriever = self._get_lesson_retriever(lesson_id)
             
             # Step 2: Handle uploaded document content
             uploaded_doc_content = ""
@@ -535,7 +478,7 @@ class TeacherLessonService(BaseLessonService):
             if is_first_message and document_uploaded:
                 try:
                     overview_query = "What is this document about? Provide a brief summary."
-                    overview_docs = retriever.invoke(overview_query)
+                    overview_docs = retriever.invoke(overview_query) if retriever else []
                     if overview_docs:
                         doc_summary = "\n".join([doc.page_content[:200] for doc in overview_docs[:3]])
                         enhanced_query = f"{user_query}\n\n[Document Context: {doc_summary}...]"
@@ -544,50 +487,17 @@ class TeacherLessonService(BaseLessonService):
                     teacher_logger.warning(f"Could not retrieve document overview: {str(e)}")
             
             # Step 7: Retrieve context from vector store
-            docs = retriever.invoke(enhanced_query)
-            context = self.format_context(docs, max_tokens=1500)
+            docs = retriever.invoke(enhanced_query) if retriever else []
             teacher_logger.info(f"Retrieved {len(docs)} documents from vector store")
             
-            # Step 8: Build messages array manually with token management
-            messages = []
-            
-            # Add system message with context
-            system_content = f"{base_system_prompt}\n\n### Knowledge Base Context:\n{context}{uploaded_doc_content}"
-            messages.append({"role": "system", "content": system_content})
-            
-            # Add chat history messages (limit to last 10 messages)
-            if hasattr(chat_history, 'messages'):
-                history_messages = list(chat_history.messages)
-                if len(history_messages) > 10:
-                    history_messages = history_messages[-10:]
-                
-                for msg in history_messages:
-                    if hasattr(msg, 'type'):
-                        role = "user" if msg.type == "human" else "assistant"
-                        content = msg.content if hasattr(msg, 'content') else str(msg)
-                        if self._estimate_tokens(content) > 500:
-                            content = self._truncate_text(content, 500)
-                        messages.append({"role": role, "content": content})
-            
-            # Add current user query
-            messages.append({"role": "user", "content": enhanced_query})
-            
-            # Estimate total tokens before sending
-            total_text = "\n".join([msg.get("content", "") for msg in messages])
-            estimated_tokens = self._estimate_tokens(total_text)
-            teacher_logger.info(f"Built message array with {len(messages)} messages, estimated tokens: {estimated_tokens}")
-            
-            # If estimated tokens exceed limit, reduce context further
-            if estimated_tokens > 5500:
-                teacher_logger.warning(f"Estimated tokens ({estimated_tokens}) exceed safe limit, reducing context")
-                context = self.format_context(docs, max_tokens=800)
-                system_content = f"{base_system_prompt}\n\n### Knowledge Base Context:\n{context}{uploaded_doc_content}"
-                messages[0] = {"role": "system", "content": system_content}
+            # Step 8: Pack system prompt, context, history and query into the token budget
+            messages = self._build_chat_messages(
+                base_system_prompt, enhanced_query, docs, chat_history, uploaded_doc_content
+            )
             
             # Step 9: Stream LLM response
             teacher_logger.info("Starting LLM streaming...")
             try:
-                # Stream the response
                 for chunk in self.llm.stream(messages):
                     if hasattr(chunk, 'content'):
                         chunk_text = chunk.content
@@ -601,60 +511,26 @@ class TeacherLessonService(BaseLessonService):
                 
                 teacher_logger.info(f"LLM streaming completed: {len(response_text)} characters")
                 
+            except OllamaQueueFull:
+                raise
             except Exception as e:
-                error_str = str(e)
-                is_token_error = (
-                    "413" in error_str or 
-                    "too large" in error_str.lower() or 
-                    "tokens per minute" in error_str.lower() or
-                    "rate_limit_exceeded" in error_str.lower() or
-                    "request too large" in error_str.lower()
-                )
-                
-                if is_token_error:
-                    teacher_logger.warning(f"Request too large, retrying with reduced context. Error: {error_str[:200]}")
-                    # Retry with minimal context
-                    context = self.format_context(docs, max_tokens=500)
-                    system_content = f"{base_system_prompt}\n\n### Knowledge Base Context:\n{context}"
-                    messages[0] = {"role": "system", "content": system_content}
-                    
-                    if hasattr(chat_history, 'messages'):
-                        history_messages = list(chat_history.messages)
-                        if len(history_messages) > 4:
-                            history_messages = history_messages[-4:]
-                        messages = [{"role": "system", "content": system_content}]
-                        for msg in history_messages:
-                            if hasattr(msg, 'type'):
-                                role = "user" if msg.type == "human" else "assistant"
-                                content = msg.content if hasattr(msg, 'content') else str(msg)
-                                content = self._truncate_text(content, 300)
-                                messages.append({"role": role, "content": content})
-                        messages.append({"role": "user", "content": enhanced_query})
-                    
-                    # Retry streaming
-                    response_text = ""
-                    for chunk in self.llm.stream(messages):
-                        if hasattr(chunk, 'content'):
-                            chunk_text = chunk.content
-                        else:
-                            chunk_text = str(chunk)
-                        
-                        if chunk_text:
-                            response_text += chunk_text
-                            yield (chunk_text, False, "no")
-                else:
-                    # Re-raise if it's a different error
-                    error_msg = f"\n\n[Error: {str(e)}]"
-                    response_text += error_msg
-                    yield (error_msg, False, "no")
-                    raise
+                error_msg = f"\n\n[Error: {str(e)}]"
+                response_text += error_msg
+                yield (error_msg, False, "no")
+                raise
             
-            # Step 10: Update chat history manually
+            # Step 10: Update chat history manually. The reply has already been
+            # streamed, so a failed save is logged rather than reported as an error.
             from langchain_core.messages import HumanMessage, AIMessage
-            chat_history.add_message(HumanMessage(content=enhanced_query))
-            chat_history.add_message(AIMessage(content=response_text))
-            teacher_logger.info(f"Chat history updated for session: {session_id}")
+            try:
+                chat_history.add_messages([HumanMessage(content=enhanced_query), AIMessage(content=response_text)])
+                teacher_logger.info(f"Chat history updated for session: {session_id}")
+            except Exception as e:
+                teacher_logger.error(f"Error saving chat history for session {session_id}: {str(e)}")
             
+        except OllamaQueueFull:
+            # The route reports this as a 429 event
+            raise
         except Exception as e:
             teacher_logger.error(f"Interactive chat streaming error: {str(e)}", exc_info=True)
             # Yield error message
@@ -1854,7 +1730,6 @@ Answer:"""
 
             #retced the relevnt chunk from saved faiss
             from langchain_community.vectorstores import FAISS
-            from langchain_community.embeddings import HuggingFaceEmbeddings
             import tempfile
             import os
             # embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
@@ -1867,21 +1742,11 @@ Answer:"""
             # lesson_doc = Document(page_content="\n the previous version context".join(lesson_text))
             # relevant_docs.append(lesson_doc)
             from langchain_core.documents import Document
-            from langchain_community.vectorstores import FAISS
-            from langchain_community.embeddings import HuggingFaceEmbeddings
-
-            # Environment variables TQDM_DISABLE and TOKENIZERS_PARALLELISM are set at app startup
-            embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={
-                    'device': 'cpu',
-                    'trust_remote_code': False
-                },
-                encode_kwargs={
-                    'normalize_embeddings': False
-                }
-            )
-            vector_db = FAISS.load_local("vector_store.faiss", embeddings, allow_dangerous_deserialization=True)
+            # Only the index built for this request's upload is relevant here
+            vector_db = self.rag_service.vector_store
+            if vector_db is None:
+                teacher_logger.info("No document index for this request, building one from the lesson text")
+                return self._edit_lesson_with_fallback_rag(lesson_text, user_prompt)
 
             # Retrieve relevant docs (these are already Document objects)
             relevant_docs = vector_db.similarity_search(user_prompt, k=10)
@@ -1947,7 +1812,7 @@ Answer:"""
         """Fallback method to create RAG from lesson text"""
         try:
             from langchain_community.vectorstores import FAISS
-            from langchain_community.embeddings import HuggingFaceEmbeddings
+            from app.utils.embeddings import get_embeddings
             import tempfile
             import os
 
@@ -1957,17 +1822,7 @@ Answer:"""
                 return lesson_text
 
             # 2. Embed and store in FAISS
-            # Environment variables TQDM_DISABLE and TOKENIZERS_PARALLELISM are set at app startup
-            embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={
-                    'device': 'cpu',
-                    'trust_remote_code': False
-                },
-                encode_kwargs={
-                    'normalize_embeddings': False
-                }
-            )
+            embeddings = get_embeddings()
             
             with tempfile.TemporaryDirectory() as tmpdir:
                 faiss_path = os.path.join(tmpdir, "faiss_index")
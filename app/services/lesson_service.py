@@ -33,6 +33,10 @@ class LessonService:
         """Process an uploaded file and return structured lesson content with DOCX bytes."""
         return self.teacher_service.process_file(file, lesson_details)
 
+    def save_lesson_index(self, lesson_id: int) -> bool:
+        """Persist the uploaded document's index under the lesson id"""
+        return self.teacher_service.save_lesson_index(lesson_id)
+
     def create_ppt(self, lesson_data: dict) -> bytes:
         """Generate a basic PPTX file from the lesson structure using python-pptx."""
         return self.teacher_service.create_ppt(lesson_data)
@@ -100,6 +104,11 @@ class LessonService:
         """Answer a student's question about a specific lesson"""
         return self.student_service.answer_lesson_question(lesson_id, question, conversation_history)
 
+    def answer_across_lessons(self, question: str, conversation_history: list = None,
+                              exclude_lesson_id: int = None) -> Dict[str, Any]:
+        """Answer from the most relevant chunks of all published lessons"""
+        return self.student_service.answer_across_lessons(question, conversation_history, exclude_lesson_id)
+
     def get_lesson_faqs(self, lesson_id: int, limit: int = 5) -> list:
         """Get frequently asked questions for a lesson"""
         return self.student_service.get_lesson_faqs(lesson_id, limit)
@@ -113,9 +122,10 @@ class LessonService:
         return self.student_service.get_lesson_key_points(lesson_id)
 
     # Legacy methods for backward compatibility
-    def llm_answer(self, lesson_content: str, question: str, lesson_title: str = "this lesson") -> str:
+    def llm_answer(self, lesson_content: str, question: str, lesson_title: str = "this lesson",
+                   lesson_id: int = None) -> str:
         """Generate an answer using the LLM with lesson-specific context"""
-        return self.student_service.llm_answer(lesson_content, question, lesson_title)
+        return self.student_service.llm_answer(lesson_content, question, lesson_title, lesson_id)
 
     def canonicalize_question(self, lesson_id: int, question: str) -> str:
         """Return a canonical phrasing for the question using semantic similarity"""
@@ -250,10 +260,12 @@ class LessonService:
         """Create DOCX from lesson data"""
         return self.teacher_service._create_docx(lesson_data)
 
-    def _delete_faiss_index(self, lesson_id: int):
-        """Delete FAISS index for a lesson (placeholder)"""
-        # This would need to be implemented if you're using persistent FAISS indices
-        logger.info(f"FAISS index deletion requested for lesson {lesson_id}")
+    def _delete_faiss_index(self, lesson_id: int) -> bool:
+        """Evict a lesson's FAISS index from memory and delete it from disk"""
+        from .lesson.index_store import lesson_index_store
+        deleted = lesson_index_store.delete(lesson_id)
+        logger.info(f"FAISS index deletion requested for lesson {lesson_id} (deleted: {deleted})")
+        return deleted
 
     def review_by_ai(self, lesson_id: int, user_query: str) -> str:
         """AI review of lesson content"""
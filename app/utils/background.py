@@ -0,0 +1,68 @@
+"""
+Small per-process thread pool for work that should not block a request.
+
+Jobs run inside an app context (so models can use get_db()) and can be
+de-duplicated by key, so a job already queued or running for the same
+key is not submitted twice.
+"""
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    # Threads do not survive fork; each gunicorn worker builds its own pool
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                from app.config import Config
+                _executor = ThreadPoolExecutor(
+                    max_workers=Config.BACKGROUND_WORKERS,
+                    thread_name_prefix='background'
+                )
+                _executor_pid = os.getpid()
+                _in_flight.clear()
+    return _executor
+
+
+def submit_background(fn: Callable, *args, key: Optional[str] = None, **kwargs) -> bool:
+    """Run fn(*args, **kwargs) in the background. Returns False if key is already in flight."""
+    app = current_app._get_current_object()
+    executor = _get_executor()
+    if key is not None:
+        with _executor_lock:
+            if key in _in_flight:
+                return False
+            _in_flight.add(key)
+
+    def run():
+        try:
+            with app.app_context():
+                fn(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Error in background job {key or getattr(fn, '__name__', fn)}: {str(e)}")
+        finally:
+            if key is not None:
+                with _executor_lock:
+                    _in_flight.discard(key)
+
+    try:
+        executor.submit(run)
+    except Exception:
+        if key is not None:
+            with _executor_lock:
+                _in_flight.discard(key)
+        raise
+    return True
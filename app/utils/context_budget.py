@@ -0,0 +1,181 @@
+"""
+Token budgeting for LLM prompts.
+
+Tokens are counted with tiktoken's cl100k_base encoder, loaded once per
+process. Counts are memoized per text, so a history message is tokenized
+once however many turns re-send it. ``pack_prompt`` fits the system prompt,
+query, retrieved chunks and chat history into the model's context window
+in a single greedy pass. It no longer builds the prompt, measures it and
+rebuilds it smaller.
+
+Packing priority, highest first:
+
+1. the system prompt and the query (always sent),
+2. the most recent ``keep_recent`` history messages,
+3. retrieved chunks in rank order, interleaved with older history
+   (newest first).
+
+History is only ever dropped from the oldest end, and the last chunk
+that fits is truncated rather than skipped.
+"""
+import os
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import tiktoken
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+ENCODING_NAME = "cl100k_base"
+MESSAGE_OVERHEAD = 4        # Role and separator tokens per chat message
+MIN_CHUNK_TOKENS = 64       # Don't bother sending a truncated chunk smaller than this
+TRUNCATION_MARKER = "... [truncated]"
+
+# Prompt windows by model name prefix. For Ollama this is the num_ctx the
+# server runs with, not the model's advertised maximum.
+MODEL_CONTEXT_WINDOWS = {
+    'llama-3.3-70b-versatile': 6000,
+    'qwen2.5': 8192,
+    'llama3': 8192,
+    'mistral': 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 6000
+
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+    try:
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        # The BPE file is downloaded on first use; estimate rather than fail
+        logger.warning(f"Could not load {ENCODING_NAME} encoder, estimating tokens: {str(e)}")
+        return None
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Number of tokens in text (memoized)."""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is None:
+        return len(text) // 4 + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=2048)
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens, marking the cut (memoized)."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens - count_tokens(TRUNCATION_MARKER))
+    encoder = _get_encoder()
+    if encoder is None:
+        return text[:keep * 4] + TRUNCATION_MARKER
+    return encoder.decode(encoder.encode(text, disallowed_special=())[:keep]) + TRUNCATION_MARKER
+
+
+def context_window(model: Optional[str] = None) -> int:
+    """Prompt window for a model, overridable with LLM_CONTEXT_WINDOW."""
+    if Config.LLM_CONTEXT_WINDOW:
+        return Config.LLM_CONTEXT_WINDOW
+    model = model or os.getenv('OLLAMA_MODEL', 'qwen2.5:3b')
+    for prefix, window in MODEL_CONTEXT_WINDOWS.items():
+        if model.startswith(prefix):
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def prompt_budget(model: Optional[str] = None) -> int:
+    """Tokens available for the prompt once the response reserve is set aside."""
+    return context_window(model) - Config.LLM_RESPONSE_RESERVE
+
+
+def pack_prompt(system_prompt: str,
+                query: str,
+                history: Sequence[Dict[str, str]] = (),
+                chunks: Sequence[str] = (),
+                max_tokens: Optional[int] = None,
+                context_header: str = "",
+                context_footer: str = "",
+                max_message_tokens: Optional[int] = None,
+                keep_recent: int = 2) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """Build the message list for one LLM call within max_tokens.
+
+    history is oldest first, as {'role', 'content'} dicts. Packed chunks go
+    into the system message between context_header and context_footer.
+    Returns (messages, stats).
+    """
+    budget = prompt_budget() if max_tokens is None else max_tokens
+    context_frame = context_header + context_footer
+    required = (count_tokens(system_prompt) + count_tokens(context_frame)
+                + count_tokens(query) + 2 * MESSAGE_OVERHEAD)
+    remaining = budget - required
+    if remaining < 0:
+        logger.warning(f"System prompt and query alone use {required} tokens (budget {budget})")
+
+    history_texts = []
+    for msg in history:
+        content = msg.get('content') or ''
+        if max_message_tokens:
+            content = truncate_to_tokens(content, max_message_tokens)
+        history_texts.append(content)
+
+    # (priority, order, kind, index): newest history first, then chunks by rank,
+    # interleaved with the remaining history by age
+    candidates = []
+    for age, index in enumerate(reversed(range(len(history_texts)))):
+        priority = 0 if age < keep_recent else 2 + age - keep_recent
+        candidates.append((priority, 1, 'history', index))
+    for rank in range(len(chunks)):
+        candidates.append((1 + rank, 0, 'chunk', rank))
+    candidates.sort()
+
+    packed_chunks = {}
+    packed_history = set()
+    history_closed = False
+    for _, _, kind, index in candidates:
+        if kind == 'history':
+            if history_closed:
+                continue
+            cost = count_tokens(history_texts[index]) + MESSAGE_OVERHEAD
+            if cost > remaining:
+                # Never leave a gap in the conversation
+                history_closed = True
+                continue
+            packed_history.add(index)
+        else:
+            text = chunks[index]
+            separator = 2 if packed_chunks else 0  # "\n\n" between chunks
+            cost = count_tokens(text) + separator
+            if cost > remaining:
+                if remaining - separator < MIN_CHUNK_TOKENS:
+                    continue
+                text = truncate_to_tokens(text, remaining - separator)
+                cost = count_tokens(text) + separator
+            packed_chunks[index] = text
+        remaining -= cost
+
+    system_content = system_prompt
+    if context_frame or packed_chunks:
+        context = "\n\n".join(packed_chunks[rank] for rank in sorted(packed_chunks))
+        system_content = f"{system_prompt}{context_header}{context}{context_footer}"
+
+    messages = [{'role': 'system', 'content': system_content}]
+    for index, msg in enumerate(history):
+        if index in packed_history:
+            messages.append({'role': msg.get('role', 'user'), 'content': history_texts[index]})
+    messages.append({'role': 'user', 'content': query})
+
+    stats = {
+        'budget': budget,
+        'tokens': budget - remaining,
+        'chunks': len(packed_chunks),
+        'chunks_dropped': len(chunks) - len(packed_chunks),
+        'history': len(packed_history),
+        'history_dropped': len(history) - len(packed_history),
+    }
+    return messages, stats
@@ -0,0 +1,95 @@
+"""
+Process-wide embedding model registry.
+
+Loading sentence-transformers weights is slow and memory hungry, so every
+service shares one lazily loaded instance per model name. When the app is
+created under gunicorn ``--preload`` the model is loaded in the master and
+forked workers share the weights copy-on-write.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any
+
+# Disable tqdm threading to prevent "cannot start new thread" errors
+os.environ.setdefault('TQDM_DISABLE', '1')
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+_lock = threading.Lock()
+_models: Dict[str, Any] = {}
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def _resident_bytes() -> int:
+    """Return the resident set size of the current process (0 if unknown)."""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except Exception:
+        return 0
+
+
+def get_embeddings(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """Return the shared embeddings instance for model_name, loading it on first use."""
+    embeddings = _models.get(model_name)
+    if embeddings is not None:
+        return embeddings
+
+    with _lock:
+        # Another thread may have loaded it while we waited for the lock
+        embeddings = _models.get(model_name)
+        if embeddings is not None:
+            return embeddings
+
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        rss_before = _resident_bytes()
+        started = time.perf_counter()
+        try:
+            embeddings = HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={
+                    'device': 'cpu',
+                    'trust_remote_code': False
+                },
+                encode_kwargs={
+                    'normalize_embeddings': False
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error loading embedding model {model_name}: {str(e)}")
+            raise
+
+        load_seconds = time.perf_counter() - started
+        resident_delta = max(_resident_bytes() - rss_before, 0)
+        _models[model_name] = embeddings
+        _stats[model_name] = {
+            'model_name': model_name,
+            'pid': os.getpid(),
+            'load_seconds': round(load_seconds, 3),
+            'resident_bytes': resident_delta,
+        }
+        logger.info(
+            f"Loaded embedding model {model_name} in {load_seconds:.2f}s "
+            f"(~{resident_delta / (1024 * 1024):.1f} MB resident, pid {os.getpid()})"
+        )
+        return embeddings
+
+
+def preload_embeddings(model_name: str = DEFAULT_EMBEDDING_MODEL) -> None:
+    """Load the embedding model eagerly; failures are logged, not raised."""
+    try:
+        get_embeddings(model_name)
+    except Exception as e:
+        logger.error(f"Embedding preload failed, will retry lazily: {str(e)}")
+
+
+def get_embedding_stats() -> Dict[str, Dict[str, Any]]:
+    """Return load time and resident size for every loaded model."""
+    with _lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
@@ -0,0 +1,493 @@
+"""
+Versioned schema migrations.
+
+Each migration is a function that receives an open connection and applies one
+schema change. The highest applied version is recorded in ``schema_version``,
+so app startup only needs a single SELECT when the schema is current. Pending
+migrations run under a file lock, so only one process (worker or replica)
+applies them while the others wait and then find nothing to do.
+
+New migrations are appended to ``MIGRATIONS`` with the next version number;
+never edit or reorder one that has already shipped.
+"""
+import os
+import sqlite3
+import logging
+from typing import Callable, List, Tuple
+
+from filelock import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, definition: str) -> None:
+    """ALTER TABLE ... ADD COLUMN only when the column is missing."""
+    if column not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _baseline_schema(conn: sqlite3.Connection) -> None:
+    """Tables and indexes as they existed before versioned migrations."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            useremail TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'student' CHECK(role IN ('student', 'teacher')),
+            class_standard TEXT NOT NULL,
+            medium TEXT NOT NULL,
+            groq_api_key TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_login DATETIME
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lessons (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            teacher_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            summary TEXT,
+            detailed_answer TEXT,
+            learning_objectives TEXT,
+            focus_area TEXT,
+            grade_level TEXT,
+            content TEXT NOT NULL,
+            file_name TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            is_public BOOLEAN DEFAULT TRUE,
+            has_child_version BOOLEAN DEFAULT FALSE,
+            parent_lesson_id INTEGER,
+            version INTEGER DEFAULT 1,
+            FOREIGN KEY (teacher_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (parent_lesson_id) REFERENCES lessons(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Student question log used for lesson FAQs
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lesson_faq (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lesson_id INTEGER,
+            question TEXT,
+            count INTEGER DEFAULT 1,
+            canonical_question TEXT
+        )
+    ''')
+
+    # Per-student Q&A history for lessons
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lesson_chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lesson_id INTEGER,
+            user_id INTEGER,
+            question TEXT,
+            answer TEXT,
+            canonical_question TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('user', 'bot')),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS survey_responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL CHECK(rating BETWEEN 1 AND 10),
+            message TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_prompts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            prompt TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            file_name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            file_type TEXT NOT NULL,
+            vector_db_ids TEXT,
+            processed BOOLEAN DEFAULT FALSE,
+            uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_accessed_at DATETIME,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_token_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date DATE NOT NULL DEFAULT CURRENT_DATE,
+            tokens_used INTEGER NOT NULL DEFAULT 0,
+            last_updated DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, date),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS token_reset_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            reset_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            tokens_used INTEGER NOT NULL,
+            was_limit_reached BOOLEAN NOT NULL DEFAULT FALSE,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Columns added to lessons and the FAQ tables after their first release
+    _add_column(conn, 'lessons', 'parent_lesson_id', 'INTEGER')
+    _add_column(conn, 'lessons', 'version', 'INTEGER DEFAULT 1')
+    _add_column(conn, 'lessons', 'has_child_version', 'BOOLEAN DEFAULT FALSE')
+    _add_column(conn, 'lessons', 'detailed_answer', 'TEXT')
+    _add_column(conn, 'lesson_faq', 'canonical_question', 'TEXT')
+    _add_column(conn, 'lesson_chat_history', 'canonical_question', 'TEXT')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_token_usage_user_id ON user_token_usage(user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_token_usage_date ON user_token_usage(date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_lessons_teacher_id ON lessons(teacher_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_lessons_grade_level ON lessons(grade_level)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_lessons_focus_area ON lessons(focus_area)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_lessons_is_public ON lessons(is_public)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_lesson_faq_lesson_id ON lesson_faq(lesson_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_lesson_chat_history_lesson_user ON lesson_chat_history(lesson_id, user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_conversation_id ON chat_history(conversation_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_prompts_user_id ON user_prompts(user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_documents_user_id ON user_documents(user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_documents_file_type ON user_documents(file_type)')
+
+
+def _lesson_versioning(conn: sqlite3.Connection) -> None:
+    """Lesson version columns, backfill for existing rows and the uniqueness guard."""
+    _add_column(conn, 'lessons', 'lesson_id', 'TEXT')
+    _add_column(conn, 'lessons', 'version_number', 'INTEGER DEFAULT 1')
+    _add_column(conn, 'lessons', 'parent_version_id', 'INTEGER')
+    _add_column(conn, 'lessons', 'original_content', 'TEXT')
+    _add_column(conn, 'lessons', 'draft_content', 'TEXT')
+    _add_column(conn, 'lessons', 'status', "TEXT DEFAULT 'finalized'")
+
+    # Existing lessons get an id like L000001
+    conn.execute("UPDATE lessons SET lesson_id = printf('L%06d', id) WHERE lesson_id IS NULL")
+    conn.execute('UPDATE lessons SET original_content = content WHERE original_content IS NULL')
+    conn.execute('UPDATE lessons SET version_number = 1 WHERE version_number IS NULL')
+    conn.execute("UPDATE lessons SET status = 'finalized' WHERE status IS NULL")
+    conn.execute('UPDATE lessons SET has_child_version = FALSE WHERE has_child_version IS NULL')
+
+    # Keep the lowest id of any duplicated (lesson_id, version_number) before the unique index
+    conn.execute('''
+        DELETE FROM lessons
+        WHERE id NOT IN (
+            SELECT MIN(id)
+            FROM lessons
+            GROUP BY lesson_id, version_number
+        )
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_lesson_version_unique
+        ON lessons(lesson_id, version_number)
+    ''')
+
+
+def _lesson_chat_sessions(conn: sqlite3.Connection) -> None:
+    """Durable teacher chat sessions shared by all workers."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lesson_chat_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_lesson_chat_sessions_session ON lesson_chat_sessions(session_id, id)')
+
+
+def _conversation_summaries(conn: sqlite3.Connection) -> None:
+    """Rolling summary of each conversation's messages outside the context window."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            conversation_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL,
+            covered_message_id INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
+        )
+    ''')
+
+
+def _chat_history_keyset_index(conn: sqlite3.Connection) -> None:
+    """Composite index for paging a conversation's messages by id."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_conversation_message ON chat_history(conversation_id, id)')
+    # The single-column index is a prefix of the new one
+    conn.execute('DROP INDEX IF EXISTS idx_chat_history_conversation_id')
+
+
+def _conversation_last_message_at(conn: sqlite3.Connection) -> None:
+    """Denormalized time of each conversation's latest message, for the sidebar."""
+    _add_column(conn, 'conversations', 'last_message_at', 'DATETIME')
+    conn.execute('''
+        UPDATE conversations SET last_message_at = (
+            SELECT MAX(created_at) FROM chat_history WHERE conversation_id = conversations.id
+        )
+    ''')
+    # Covers the sidebar's top-N read, so it never touches the table
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_user_last_message
+        ON conversations(user_id, last_message_at DESC, title)
+    ''')
+    conn.execute('DROP INDEX IF EXISTS idx_conversations_user_id')
+
+
+def _lessons_fts(conn: sqlite3.Connection) -> None:
+    """FTS5 index over lesson text, kept in sync with lessons by triggers."""
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS lessons_fts USING fts5(
+                title, summary, content, focus_area,
+                content='lessons', content_rowid='id',
+                tokenize='porter unicode61'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5; LessonModel.search_lessons falls back to LIKE
+        logger.warning(f"FTS5 unavailable, lesson search will not be indexed: {str(e)}")
+        return
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS lessons_fts_insert AFTER INSERT ON lessons BEGIN
+            INSERT INTO lessons_fts(rowid, title, summary, content, focus_area)
+            VALUES (new.id, new.title, new.summary, new.content, new.focus_area);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS lessons_fts_delete AFTER DELETE ON lessons BEGIN
+            INSERT INTO lessons_fts(lessons_fts, rowid, title, summary, content, focus_area)
+            VALUES ('delete', old.id, old.title, old.summary, old.content, old.focus_area);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS lessons_fts_update
+        AFTER UPDATE OF title, summary, content, focus_area ON lessons BEGIN
+            INSERT INTO lessons_fts(lessons_fts, rowid, title, summary, content, focus_area)
+            VALUES ('delete', old.id, old.title, old.summary, old.content, old.focus_area);
+            INSERT INTO lessons_fts(rowid, title, summary, content, focus_area)
+            VALUES (new.id, new.title, new.summary, new.content, new.focus_area);
+        END
+    ''')
+    conn.execute("INSERT INTO lessons_fts(lessons_fts) VALUES ('rebuild')")
+
+
+def _lesson_is_latest(conn: sqlite3.Connection) -> None:
+    """Flag the latest public version of each lesson so browsing is an index range scan."""
+    _add_column(conn, 'lessons', 'is_latest', 'BOOLEAN DEFAULT FALSE')
+    conn.execute('''
+        UPDATE lessons SET is_latest = CASE
+            WHEN lesson_id IS NULL OR lesson_id = '' THEN is_public
+            ELSE id IS (
+                SELECT l2.id FROM lessons l2
+                WHERE l2.lesson_id = lessons.lesson_id AND l2.is_public = TRUE
+                ORDER BY COALESCE(l2.version_number, 1) DESC, l2.id DESC
+                LIMIT 1
+            )
+        END
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_lessons_browse
+        ON lessons(is_public, is_latest, grade_level, focus_area, created_at)
+    ''')
+    # Unfiltered browsing reads newest-first without a sort
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_lessons_browse_recent
+        ON lessons(is_public, is_latest, created_at)
+    ''')
+
+
+def _lesson_artifacts(conn: sqlite3.Connection) -> None:
+    """LLM-derived lesson artifacts (summary, key points, FAQs) cached per content version."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lesson_artifacts (
+            lesson_id INTEGER NOT NULL,
+            artifact_type TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (lesson_id, artifact_type, content_hash),
+            FOREIGN KEY (lesson_id) REFERENCES lessons(id) ON DELETE CASCADE
+        )
+    ''')
+
+
+def _lesson_answer_cache(conn: sqlite3.Connection) -> None:
+    """Semantic cache of answers to student questions, per lesson version and content."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lesson_answer_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lesson_id INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            question TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            answer TEXT NOT NULL,
+            hits INTEGER DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_hit_at DATETIME,
+            FOREIGN KEY (lesson_id) REFERENCES lessons(id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_lesson_answer_cache_lesson
+        ON lesson_answer_cache(lesson_id, content_hash)
+    ''')
+
+
+def _lesson_global_index(conn: sqlite3.Connection) -> None:
+    """Which lessons (and which content) the cross-lesson chunk index holds."""
+    # No foreign key: rows of deleted lessons are how their chunks get found and removed
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lesson_global_index (
+            lesson_id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            doc_prefix TEXT NOT NULL,
+            chunk_count INTEGER NOT NULL,
+            indexed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _lesson_faq_clusters(conn: sqlite3.Connection) -> None:
+    """lesson_faq rows become question clusters: centroid embedding and latest answer."""
+    _add_column(conn, 'lesson_faq', 'centroid', 'BLOB')
+    _add_column(conn, 'lesson_faq', 'latest_answer', 'TEXT')
+    _add_column(conn, 'lesson_faq', 'last_asked_at', 'DATETIME')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_lesson_faq_lesson_count ON lesson_faq(lesson_id, count DESC)')
+    # The single-column index is a prefix of the new one
+    conn.execute('DROP INDEX IF EXISTS idx_lesson_faq_lesson_id')
+
+
+def _drop_lesson_chat_sessions(conn: sqlite3.Connection) -> None:
+    """Chat sessions moved to their own database in the coordination directory."""
+    conn.execute('DROP INDEX IF EXISTS idx_lesson_chat_sessions_session')
+    conn.execute('DROP TABLE IF EXISTS lesson_chat_sessions')
+
+
+# (version, name, function) -- append only
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, 'baseline schema', _baseline_schema),
+    (2, 'lesson versioning', _lesson_versioning),
+    (3, 'lesson chat sessions', _lesson_chat_sessions),
+    (4, 'conversation summaries', _conversation_summaries),
+    (5, 'chat history keyset index', _chat_history_keyset_index),
+    (6, 'conversation last_message_at', _conversation_last_message_at),
+    (7, 'lesson full-text index', _lessons_fts),
+    (8, 'lesson is_latest flag', _lesson_is_latest),
+    (9, 'lesson artifact cache', _lesson_artifacts),
+    (10, 'lesson answer cache', _lesson_answer_cache),
+    (11, 'cross-lesson index bookkeeping', _lesson_global_index),
+    (12, 'lesson faq clusters', _lesson_faq_clusters),
+    (13, 'move lesson chat sessions out', _drop_lesson_chat_sessions),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    if conn.in_transaction:
+        conn.commit()
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Highest applied migration version, or 0 for a database without one."""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def run_migrations(database: str) -> int:
+    """Bring the database up to LATEST_VERSION. Returns the number of migrations applied."""
+    from app.utils.db import db_connection
+
+    os.makedirs(os.path.dirname(database) or '.', exist_ok=True)
+
+    # Fast path for every worker once the schema is current
+    with db_connection(database) as conn:
+        if get_schema_version(conn) >= LATEST_VERSION:
+            return 0
+
+    applied = 0
+    with FileLock(f"{database}.migrate.lock", timeout=600):
+        with db_connection(database) as conn:
+            _ensure_version_table(conn)
+            # Another process may have finished while we waited for the lock
+            current = get_schema_version(conn)
+            for version, name, migrate in MIGRATIONS:
+                if version <= current:
+                    continue
+                logger.info(f"Applying schema migration {version}: {name}")
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    migrate(conn)
+                    conn.execute(
+                        'INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                        (version, name)
+                    )
+                    conn.commit()
+                    applied += 1
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Error applying schema migration {version} ({name}): {str(e)}")
+                    raise
+    if applied:
+        logger.info(f"Database schema now at version {LATEST_VERSION}")
+    return applied
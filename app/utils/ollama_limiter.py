@@ -0,0 +1,264 @@
+"""
+Admission control in front of the Ollama server.
+
+Ollama only runs ``OLLAMA_NUM_PARALLEL`` generations at once. This module
+hands out that many slots across every worker and replica:
+
+- Slots are ``flock``-ed files in a shared directory (one file per slot), so
+  the bound holds across processes and containers that mount it, and a
+  crashed worker's slots are released by the kernel.
+- Within a process, waiters form a priority queue. Interactive requests
+  (chat, streaming) are admitted before background work such as FAQ or
+  summary generation. Interactive waiters also poll for a free slot more
+  often than background ones, which biases admission across processes.
+- When the local queue is full, or a waiter times out, ``OllamaQueueFull``
+  is raised with an estimated ``retry_after``; the app turns it into a 429.
+
+Slots are re-entrant per thread, so a decorated helper calling the limited
+chat model does not take a second slot.
+"""
+import os
+import time
+import heapq
+import fcntl
+import inspect
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_ollama import ChatOllama
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Seconds between slot probes while at the head of the local queue
+_POLL_INTERVAL = {PRIORITY_INTERACTIVE: 0.02, PRIORITY_BACKGROUND: 0.2}
+
+
+class OllamaQueueFull(Exception):
+    """Raised when a request cannot be admitted to Ollama soon enough"""
+    def __init__(self, retry_after: float, message: str = "The AI service is busy"):
+        self.retry_after = retry_after
+        super().__init__(f"{message}. Please try again in {int(retry_after) + 1} seconds")
+
+
+class OllamaLimiter:
+    """Cross-process slot semaphore with an in-process priority queue"""
+
+    def __init__(self, slot_dir: str, max_concurrent: int, max_queue: int, default_timeout: float):
+        self.slot_dir = slot_dir
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self._local = threading.local()
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._waiters: List[tuple] = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._active = 0
+        self._avg_hold = 5.0  # EWMA of seconds a slot is held
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def _check_fork(self) -> None:
+        # Queue state and held slots belong to the parent after a fork
+        if os.getpid() != self._pid:
+            self._local = threading.local()
+            self._reset_state()
+
+    def _slot_path(self, index: int) -> str:
+        return os.path.join(self.slot_dir, f"slot_{index}.lock")
+
+    def _try_lock_slot(self) -> Optional[int]:
+        """Lock the first free slot file and return its fd, or None if all are busy."""
+        os.makedirs(self.slot_dir, exist_ok=True)
+        for index in range(self.max_concurrent):
+            fd = os.open(self._slot_path(index), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def _estimate_wait(self, queued: int) -> float:
+        return max(1.0, self._avg_hold * (queued + 1) / max(1, self.max_concurrent))
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None) -> None:
+        """Block until a slot is free; raise OllamaQueueFull if the queue is full or on timeout."""
+        self._check_fork()
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            return
+
+        timeout = self.default_timeout if timeout is None else timeout
+        with self._cond:
+            if len(self._waiters) >= self.max_queue:
+                self._rejected += 1
+                raise OllamaQueueFull(self._estimate_wait(len(self._waiters)))
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+
+        poll = _POLL_INTERVAL.get(priority, _POLL_INTERVAL[PRIORITY_BACKGROUND])
+        deadline = time.monotonic() + timeout
+        fd = None
+        try:
+            while fd is None:
+                with self._cond:
+                    at_head = self._waiters[0] == entry
+                if at_head:
+                    fd = self._try_lock_slot()
+                    if fd is not None:
+                        break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._cond:
+                        self._timed_out += 1
+                        queued = len(self._waiters)
+                    raise OllamaQueueFull(self._estimate_wait(queued))
+                with self._cond:
+                    self._cond.wait(min(remaining, poll))
+        finally:
+            with self._cond:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                if fd is not None:
+                    self._active += 1
+                    self._admitted += 1
+                self._cond.notify_all()
+
+        self._local.depth = 1
+        self._local.fd = fd
+        self._local.started = time.monotonic()
+
+    def release(self) -> None:
+        """Release the calling thread's slot (or one level of re-entry)."""
+        depth = getattr(self._local, 'depth', 0)
+        if depth > 1:
+            self._local.depth = depth - 1
+            return
+        if depth == 0:
+            return
+        fd = self._local.fd
+        held = time.monotonic() - self._local.started
+        self._local.depth = 0
+        self._local.fd = None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+        with self._cond:
+            self._active -= 1
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None):
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_active_count(self) -> int:
+        """Slots held by this process."""
+        return self._active
+
+    def get_queue_depth(self) -> int:
+        """Requests waiting for a slot in this process."""
+        return len(self._waiters)
+
+    def get_global_active_count(self) -> int:
+        """Slots held across all processes sharing the slot directory."""
+        busy = 0
+        for index in range(self.max_concurrent):
+            try:
+                fd = os.open(self._slot_path(index), os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            except BlockingIOError:
+                busy += 1
+            finally:
+                os.close(fd)
+        return busy
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue metrics for monitoring."""
+        with self._cond:
+            waiting = list(self._waiters)
+        return {
+            'active_local': self._active,
+            'active_global': self.get_global_active_count(),
+            'max_concurrent': self.max_concurrent,
+            'queued': len(waiting),
+            'queued_interactive': sum(1 for p, _ in waiting if p <= PRIORITY_INTERACTIVE),
+            'queued_background': sum(1 for p, _ in waiting if p > PRIORITY_INTERACTIVE),
+            'max_queue': self.max_queue,
+            'avg_hold_seconds': round(self._avg_hold, 2),
+            'admitted': self._admitted,
+            'rejected': self._rejected,
+            'timed_out': self._timed_out,
+        }
+
+
+ollama_limiter = OllamaLimiter(
+    slot_dir=Config.OLLAMA_SLOT_DIR,
+    max_concurrent=Config.OLLAMA_MAX_CONCURRENT,
+    max_queue=Config.OLLAMA_MAX_QUEUE,
+    default_timeout=Config.OLLAMA_QUEUE_TIMEOUT
+)
+
+
+def ollama_slot(priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None):
+    """Context manager holding one Ollama slot."""
+    return ollama_limiter.slot(priority, timeout)
+
+
+def limit_ollama_requests(timeout: Optional[float] = None, priority: int = PRIORITY_INTERACTIVE):
+    """Decorator holding an Ollama slot for the call (or, for generators, the whole iteration)."""
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                with ollama_limiter.slot(priority, timeout):
+                    yield from func(*args, **kwargs)
+            return gen_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with ollama_limiter.slot(priority, timeout):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LimitedChatOllama(ChatOllama):
+    """ChatOllama that takes an Ollama slot for every generation.
+
+    Covers invoke, stream, chains and structured output, since they all go
+    through _generate/_stream.
+    """
+    priority: int = PRIORITY_INTERACTIVE
+
+    def _generate(self, *args, **kwargs):
+        with ollama_limiter.slot(self.priority):
+            return super()._generate(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs) -> Iterator:
+        with ollama_limiter.slot(self.priority):
+            yield from super()._stream(*args, **kwargs)
@@ -0,0 +1,59 @@
+"""
+Question embeddings and online clustering.
+
+Student questions are embedded with the shared sentence-transformers model
+and L2-normalized, so a dot product is the cosine similarity. Each lesson's
+FAQ is a set of clusters. A new question joins the nearest centroid if it
+is within the threshold, or starts a new cluster. The centroid is the
+running mean of its members, so clustering never has to revisit old
+questions.
+"""
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.embeddings import get_embeddings
+
+
+def normalize_question(question: str) -> str:
+    return ' '.join((question or '').lower().split())
+
+
+@lru_cache(maxsize=256)
+def _embed_normalized(text: str) -> np.ndarray:
+    vector = np.asarray(get_embeddings().embed_query(text), dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embed_question(question: str) -> np.ndarray:
+    """Unit-length embedding of a question (memoized on its normalized text)."""
+    return _embed_normalized(normalize_question(question))
+
+
+def to_blob(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_blobs(blobs: Sequence[bytes]) -> np.ndarray:
+    """Stack stored vectors into a (len(blobs), dim) matrix."""
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+
+
+def nearest(matrix: np.ndarray, vector: np.ndarray) -> Tuple[Optional[int], float]:
+    """Row of matrix most similar to vector and its cosine similarity ((None, -1.0) if empty)."""
+    if not len(matrix):
+        return None, -1.0
+    scores = matrix @ vector
+    best = int(np.argmax(scores))
+    return best, float(scores[best])
+
+
+def merge_centroid(centroid: np.ndarray, count: int, vector: np.ndarray, weight: int = 1) -> np.ndarray:
+    """Centroid of count members plus weight more at vector, renormalized."""
+    merged = (centroid * count + vector * weight) / (count + weight)
+    norm = np.linalg.norm(merged)
+    return merged / norm if norm else merged
@@ -0,0 +1,152 @@
+"""
+Token buckets shared by every worker and replica.
+
+Bucket state lives in a small SQLite file of its own (not the main
+database), so all gunicorn workers and containers mounting the same
+``instance/`` directory draw from the same buckets. Acquiring returns the
+number of seconds until enough tokens will be available instead of
+sleeping, so callers decide whether to wait briefly or reject with a
+Retry-After.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Iterable, Optional, Tuple
+
+from app.config import Config
+from app.utils.db import get_pool
+
+logger = logging.getLogger(__name__)
+
+# (key, rate in tokens/second, capacity)
+BucketSpec = Tuple[str, float, float]
+
+
+class RateLimitError(Exception):
+    """Raised when a request would have to wait too long for a token"""
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Too many requests. Please try again in {int(retry_after) + 1} seconds")
+
+
+class SharedTokenBucket:
+    """Token buckets stored in SQLite and updated atomically across processes"""
+
+    def __init__(self, database: str):
+        self.database = database
+        self._initialized_pid = None
+        self._init_lock = threading.Lock()
+
+    def _ensure_table(self) -> None:
+        if self._initialized_pid == os.getpid():
+            return
+        with self._init_lock:
+            if self._initialized_pid == os.getpid():
+                return
+            os.makedirs(os.path.dirname(self.database) or '.', exist_ok=True)
+            with get_pool(self.database).connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS rate_buckets (
+                        key TEXT PRIMARY KEY,
+                        tokens REAL NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                ''')
+            self._initialized_pid = os.getpid()
+
+    def try_acquire(self, buckets: Iterable[BucketSpec], tokens: float = 1.0) -> float:
+        """Take tokens from every bucket, or from none.
+
+        Returns 0.0 when the tokens were taken, otherwise the seconds to wait
+        before all buckets can cover the request.
+        """
+        buckets = list(buckets)
+        self._ensure_table()
+        pool = get_pool(self.database)
+        conn = pool.acquire()
+        try:
+            # IMMEDIATE takes the write lock up front so refill-and-take is atomic
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            levels = []
+            wait = 0.0
+            for key, rate, capacity in buckets:
+                row = conn.execute(
+                    'SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    level = float(capacity)
+                else:
+                    level = min(float(capacity), row['tokens'] + max(0.0, now - row['updated_at']) * rate)
+                levels.append(level)
+                if level < tokens:
+                    wait = max(wait, (tokens - level) / rate if rate > 0 else float('inf'))
+
+            acquired = wait == 0.0
+            conn.executemany(
+                '''INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at''',
+                [
+                    (key, level - tokens if acquired else level, now)
+                    for (key, _, _), level in zip(buckets, levels)
+                ]
+            )
+            conn.commit()
+            return wait
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"Error acquiring rate limit tokens: {str(e)}")
+            raise
+        finally:
+            pool.release(conn)
+
+
+class LLMRateLimiter:
+    """Per-user and global request limits for calls to the LLM backend"""
+
+    def __init__(self, backend: SharedTokenBucket, user_rate_per_min: float, user_burst: float,
+                 global_rate_per_min: float, global_burst: float, max_wait: float):
+        self.backend = backend
+        self.user_rate = user_rate_per_min / 60.0
+        self.user_burst = user_burst
+        self.global_rate = global_rate_per_min / 60.0
+        self.global_burst = global_burst
+        self.max_wait = max_wait
+
+    def _buckets(self, user_id: Optional[int]):
+        buckets = [('global', self.global_rate, self.global_burst)]
+        if user_id is not None:
+            buckets.append((f"user:{user_id}", self.user_rate, self.user_burst))
+        return buckets
+
+    def try_acquire(self, user_id: Optional[int] = None) -> float:
+        """Seconds to wait before a request is allowed (0.0 if it was admitted)."""
+        try:
+            return self.backend.try_acquire(self._buckets(user_id))
+        except Exception:
+            # Fail open: a broken limiter must not take the chat down with it
+            return 0.0
+
+    def acquire(self, user_id: Optional[int] = None) -> None:
+        """Admit a request, sleeping once for a short wait or raising RateLimitError."""
+        wait = self.try_acquire(user_id)
+        if wait <= 0:
+            return
+        if wait > self.max_wait:
+            raise RateLimitError(wait)
+        time.sleep(wait)
+        wait = self.try_acquire(user_id)
+        if wait > 0:
+            raise RateLimitError(wait)
+
+
+llm_rate_limiter = LLMRateLimiter(
+    backend=SharedTokenBucket(Config.RATE_LIMIT_DATABASE),
+    user_rate_per_min=Config.USER_REQUESTS_PER_MINUTE,
+    user_burst=Config.USER_REQUEST_BURST,
+    global_rate_per_min=Config.GLOBAL_REQUESTS_PER_MINUTE,
+    global_burst=Config.GLOBAL_REQUEST_BURST,
+    max_wait=Config.RATE_LIMIT_MAX_WAIT
+)
@@ -0,0 +1,143 @@
+"""
+Conversation retention.
+
+Deletes conversations idle for longer than CONVERSATION_RETENTION_DAYS and
+each user's conversations beyond the newest CONVERSATION_MAX_PER_USER.
+Messages and summaries go with them through the foreign key cascade. Work
+is done a batch of conversations at a time, each batch in its own short
+transaction, so other writers get the lock between batches.
+
+schedule_retention() is cheap enough to call on the request path. It
+queues a background run at most once per CONVERSATION_RETENTION_INTERVAL
+across all workers and replicas. ``flask prune-conversations`` runs the
+job on demand.
+"""
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+from filelock import FileLock, Timeout
+
+from app.config import Config
+from app.utils.db import db_connection
+
+logger = logging.getLogger(__name__)
+
+_STAMP_PATH = os.path.join(Config.COORDINATION_DIR, 'conversation_retention.stamp')
+_CHECK_INTERVAL = 60  # Seconds between stamp checks in one process
+_last_check = 0.0
+
+
+def _expired_ids(conn, max_age_days: float, batch_size: int, user_id: Optional[int]) -> List[int]:
+    query = '''SELECT id FROM conversations
+               WHERE COALESCE(last_message_at, created_at) < datetime('now', ?)'''
+    params = [f'-{max_age_days} days']
+    if user_id is not None:
+        query += ' AND user_id = ?'
+        params.append(user_id)
+    query += ' LIMIT ?'
+    params.append(batch_size)
+    return [row[0] for row in conn.execute(query, params).fetchall()]
+
+
+def _overflow_ids(conn, max_per_user: int, batch_size: int, user_id: Optional[int]) -> List[int]:
+    query = '''SELECT id FROM (
+                   SELECT id, ROW_NUMBER() OVER (
+                       PARTITION BY user_id
+                       ORDER BY COALESCE(last_message_at, created_at) DESC, id DESC
+                   ) AS position
+                   FROM conversations {where}
+               ) WHERE position > ? LIMIT ?'''
+    params = []
+    where = ''
+    if user_id is not None:
+        where = 'WHERE user_id = ?'
+        params.append(user_id)
+    params += [max_per_user, batch_size]
+    return [row[0] for row in conn.execute(query.format(where=where), params).fetchall()]
+
+
+def _delete_in_batches(select_ids, database: Optional[str], pause: float) -> int:
+    deleted = 0
+    while True:
+        with db_connection(database) as conn:
+            # Select and delete under one write lock so a conversation that
+            # just got a message can't be picked and then deleted
+            conn.execute('BEGIN IMMEDIATE')
+            ids = select_ids(conn)
+            if ids:
+                placeholders = ','.join('?' * len(ids))
+                deleted += conn.execute(
+                    f'DELETE FROM conversations WHERE id IN ({placeholders})', ids
+                ).rowcount
+        if not ids:
+            return deleted
+        time.sleep(pause)
+
+
+def prune_conversations(max_age_days: Optional[float] = None,
+                        max_per_user: Optional[int] = None,
+                        user_id: Optional[int] = None,
+                        batch_size: Optional[int] = None,
+                        database: Optional[str] = None,
+                        pause: float = 0.05) -> Dict[str, int]:
+    """Delete expired and over-limit conversations (optionally for one user). Returns counts."""
+    batch_size = batch_size or Config.CONVERSATION_RETENTION_BATCH
+    result = {'expired': 0, 'over_limit': 0}
+    try:
+        if max_age_days:
+            result['expired'] = _delete_in_batches(
+                lambda conn: _expired_ids(conn, max_age_days, batch_size, user_id), database, pause
+            )
+        if max_per_user:
+            result['over_limit'] = _delete_in_batches(
+                lambda conn: _overflow_ids(conn, max_per_user, batch_size, user_id), database, pause
+            )
+        if result['expired'] or result['over_limit']:
+            logger.info(f"Pruned {result['expired']} expired and {result['over_limit']} over-limit conversations")
+        return result
+    except Exception as e:
+        logger.error(f"Error pruning conversations: {str(e)}")
+        raise
+
+
+def _stamp_age() -> float:
+    try:
+        return time.time() - os.path.getmtime(_STAMP_PATH)
+    except OSError:
+        return float('inf')
+
+
+def run_retention(database: Optional[str] = None) -> Optional[Dict[str, int]]:
+    """Run the configured retention policy unless another worker ran it recently."""
+    os.makedirs(os.path.dirname(_STAMP_PATH), exist_ok=True)
+    try:
+        with FileLock(f"{_STAMP_PATH}.lock", timeout=0):
+            if _stamp_age() < Config.CONVERSATION_RETENTION_INTERVAL:
+                return None
+            result = prune_conversations(
+                max_age_days=Config.CONVERSATION_RETENTION_DAYS,
+                max_per_user=Config.CONVERSATION_MAX_PER_USER,
+                database=database
+            )
+            with open(_STAMP_PATH, 'a'):
+                os.utime(_STAMP_PATH, None)
+            return result
+    except Timeout:
+        return None  # Another worker is running it
+
+
+def schedule_retention() -> None:
+    """Queue a background retention run if one is due."""
+    global _last_check
+    if not (Config.CONVERSATION_RETENTION_DAYS or Config.CONVERSATION_MAX_PER_USER):
+        return
+    now = time.time()
+    if now - _last_check < _CHECK_INTERVAL:
+        return
+    _last_check = now
+    if _stamp_age() < Config.CONVERSATION_RETENTION_INTERVAL:
+        return
+    from app.utils.background import submit_background
+    submit_background(run_retention, key='conversation_retention')
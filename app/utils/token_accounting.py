@@ -0,0 +1,135 @@
+"""
+Write-behind token usage accounting.
+
+Chat requests record token usage in memory. A background thread flushes the
+coalesced per-user deltas to ``user_token_usage`` with a single executemany
+UPSERT on an interval, or sooner when enough users are pending. A final
+flush runs at interpreter exit. Readers merge pending deltas so reported
+usage stays exact between flushes.
+"""
+import os
+import atexit
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+UPSERT_SQL = '''
+    INSERT INTO user_token_usage (user_id, date, tokens_used, last_updated)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id, date) DO UPDATE SET
+        tokens_used = tokens_used + excluded.tokens_used,
+        last_updated = CURRENT_TIMESTAMP
+'''
+
+
+def _today() -> str:
+    # Same day boundary as SQLite's CURRENT_DATE (UTC)
+    return datetime.utcnow().date().isoformat()
+
+
+class TokenUsageAccumulator:
+    """Coalesces per-user token deltas in memory and flushes them in batches"""
+
+    def __init__(self, flush_interval: float = 5.0, max_pending: int = 500,
+                 database: Optional[str] = None):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.database = database
+        self._pending: Dict[Tuple[int, str], int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_flusher(self) -> None:
+        # Started lazily so each forked gunicorn worker gets its own thread
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Deltas copied from the parent were the parent's to flush
+                self._pending = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='token-usage-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # Already logged; deltas were re-queued
+
+    def record(self, user_id: int, tokens_used: int) -> None:
+        """Queue a usage delta for the user's current day."""
+        if not user_id or not tokens_used:
+            return
+        self._ensure_flusher()
+        key = (user_id, _today())
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + tokens_used
+            pending = len(self._pending)
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def pending_for(self, user_id: int, date: Optional[str] = None) -> int:
+        """Tokens recorded for the user but not yet written to the database."""
+        with self._lock:
+            return self._pending.get((user_id, date or _today()), 0)
+
+    def flush(self) -> int:
+        """Write all pending deltas in one transaction. Returns the number of rows upserted."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+
+            rows = [(user_id, date, tokens) for (user_id, date), tokens in batch.items()]
+            try:
+                from app.utils.db import db_connection
+                with db_connection(self.database) as conn:
+                    try:
+                        conn.executemany(UPSERT_SQL, rows)
+                    except sqlite3.IntegrityError:
+                        # A user was deleted since recording; write the rest row by row
+                        conn.rollback()
+                        for row in rows:
+                            try:
+                                conn.execute(UPSERT_SQL, row)
+                            except sqlite3.IntegrityError as e:
+                                logger.warning(f"Dropping token usage for user {row[0]}: {str(e)}")
+                logger.debug(f"Flushed token usage for {len(rows)} users")
+                return len(rows)
+            except Exception as e:
+                logger.error(f"Error flushing token usage: {str(e)}")
+                # Put the deltas back so the next flush retries them
+                with self._lock:
+                    for key, tokens in batch.items():
+                        self._pending[key] = self._pending.get(key, 0) + tokens
+                raise
+
+
+token_accumulator = TokenUsageAccumulator(
+    flush_interval=float(os.getenv('TOKEN_FLUSH_INTERVAL', '5')),
+    max_pending=int(os.getenv('TOKEN_FLUSH_MAX_PENDING', '500'))
+)
+
+
+def _flush_at_exit() -> None:
+    try:
+        token_accumulator.flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,300 @@
+"""
+Partitioned, append-only FAISS vector store.
+
+Each partition (e.g. one per user) is a directory of immutable segments:
+
+    <root>/<partition>/seg_<timestamp>_<id>/   FAISS index written once
+    <root>/<partition>/tombstones.json          doc ids deleted since the last compaction
+
+Adds write a new segment instead of rewriting the store, deletes only
+append tombstones, and compaction folds live vectors into a single segment.
+Searches only ever touch the caller's partition.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from filelock import FileLock
+from langchain_community.vectorstores import FAISS
+
+from app.utils.embeddings import get_embeddings
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'seg_'
+TOMBSTONES_FILE = 'tombstones.json'
+DOC_ID_KEY = 'doc_id'
+
+
+class PartitionedVectorStore:
+    """Append-only FAISS segments per partition with tombstone deletes and compaction"""
+
+    def __init__(self, root: str, max_segments: int = 8, max_tombstone_ratio: float = 0.3,
+                 max_loaded_partitions: int = 64):
+        self.root = root
+        self.max_segments = max_segments
+        self.max_tombstone_ratio = max_tombstone_ratio
+        self.max_loaded_partitions = max_loaded_partitions
+        self._loaded = OrderedDict()  # partition -> (signature, vector_store, live_count, tombstones)
+        self._lock = threading.Lock()
+
+    # ---- layout helpers ----
+
+    def _partition_path(self, partition: str) -> str:
+        return os.path.join(self.root, str(partition))
+
+    def _file_lock(self, partition: str) -> FileLock:
+        path = self._partition_path(partition)
+        os.makedirs(path, exist_ok=True)
+        return FileLock(os.path.join(path, '.lock'), timeout=60)
+
+    def _segments(self, partition: str) -> List[str]:
+        path = self._partition_path(partition)
+        try:
+            names = os.listdir(path)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if n.startswith(SEGMENT_PREFIX) and '.tmp' not in n)
+
+    def _read_tombstones(self, partition: str) -> set:
+        path = os.path.join(self._partition_path(partition), TOMBSTONES_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return set(json.load(f))
+        except FileNotFoundError:
+            return set()
+        except Exception as e:
+            logger.error(f"Error reading tombstones for partition {partition}: {str(e)}")
+            return set()
+
+    def _write_tombstones(self, partition: str, tombstones: Iterable[str]) -> None:
+        path = os.path.join(self._partition_path(partition), TOMBSTONES_FILE)
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(sorted(tombstones), f)
+        os.replace(tmp_path, path)
+
+    def _signature(self, partition: str) -> Tuple:
+        """Cheap fingerprint of a partition's on-disk state for cache validation."""
+        tombstone_path = os.path.join(self._partition_path(partition), TOMBSTONES_FILE)
+        try:
+            tombstone_mtime = os.stat(tombstone_path).st_mtime
+        except FileNotFoundError:
+            tombstone_mtime = 0.0
+        return tuple(self._segments(partition)), tombstone_mtime
+
+    def _write_segment(self, partition: str, vector_store) -> str:
+        name = f"{SEGMENT_PREFIX}{int(time.time() * 1000):015d}_{uuid.uuid4().hex[:8]}"
+        target = os.path.join(self._partition_path(partition), name)
+        staging = f"{target}.tmp"
+        vector_store.save_local(staging)
+        os.replace(staging, target)
+        return name
+
+    def _load(self, partition: str):
+        """Return (vector_store, live_doc_count, tombstones) for a partition, cached per process."""
+        signature = self._signature(partition)
+        with self._lock:
+            entry = self._loaded.get(partition)
+            if entry and entry[0] == signature:
+                self._loaded.move_to_end(partition)
+                return entry[1], entry[2], entry[3]
+
+        segments, _ = signature
+        if not segments:
+            with self._lock:
+                self._loaded.pop(partition, None)
+            return None, 0, set()
+
+        embeddings = get_embeddings()
+        merged = None
+        for name in segments:
+            segment = FAISS.load_local(
+                os.path.join(self._partition_path(partition), name),
+                embeddings,
+                allow_dangerous_deserialization=True
+            )
+            if merged is None:
+                merged = segment
+            else:
+                merged.merge_from(segment)
+
+        tombstones = self._read_tombstones(partition)
+        live_count = merged.index.ntotal - len(tombstones)
+
+        with self._lock:
+            self._loaded[partition] = (signature, merged, live_count, tombstones)
+            self._loaded.move_to_end(partition)
+            while len(self._loaded) > self.max_loaded_partitions:
+                self._loaded.popitem(last=False)
+        return merged, live_count, tombstones
+
+    def _forget(self, partition: str) -> None:
+        with self._lock:
+            self._loaded.pop(partition, None)
+
+    # ---- public API ----
+
+    def has_documents(self, partition: str) -> bool:
+        """True if the partition has at least one segment on disk."""
+        return bool(self._segments(partition))
+
+    def add_documents(self, partition: str, documents: List) -> List[str]:
+        """Append documents as a new segment. Returns the assigned doc ids."""
+        if not documents:
+            return []
+        doc_ids = []
+        for doc in documents:
+            doc_id = doc.metadata.get(DOC_ID_KEY) or uuid.uuid4().hex
+            doc.metadata[DOC_ID_KEY] = doc_id
+            doc_ids.append(doc_id)
+
+        # Embed outside the lock; only the directory rename needs serializing
+        segment = FAISS.from_documents(documents, get_embeddings())
+        with self._file_lock(partition):
+            name = self._write_segment(partition, segment)
+        self._forget(partition)
+        logger.info(f"Appended segment {name} with {len(documents)} documents to partition {partition}")
+
+        if len(self._segments(partition)) > self.max_segments:
+            self.compact(partition)
+        return doc_ids
+
+    def add_embeddings(self, partition: str, text_embeddings: List[Tuple[str, List[float]]],
+                       metadatas: List[Dict]) -> None:
+        """Append precomputed vectors as a new segment (used by migrations)."""
+        if not text_embeddings:
+            return
+        for metadata in metadatas:
+            metadata.setdefault(DOC_ID_KEY, uuid.uuid4().hex)
+        segment = FAISS.from_embeddings(text_embeddings, get_embeddings(), metadatas=metadatas)
+        with self._file_lock(partition):
+            self._write_segment(partition, segment)
+        self._forget(partition)
+
+    def delete_documents(self, partition: str, doc_ids: Iterable[str]) -> None:
+        """Tombstone documents; they are filtered from searches and dropped at compaction."""
+        doc_ids = set(doc_ids)
+        if not doc_ids:
+            return
+        with self._file_lock(partition):
+            tombstones = self._read_tombstones(partition) | doc_ids
+            self._write_tombstones(partition, tombstones)
+        self._forget(partition)
+
+        _, live_count, tombstones = self._load(partition)
+        total = live_count + len(tombstones)
+        if total and len(tombstones) / total > self.max_tombstone_ratio:
+            self.compact(partition)
+
+    def drop_partition(self, partition: str) -> None:
+        """Remove a partition entirely."""
+        self._forget(partition)
+        path = self._partition_path(partition)
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Dropped vector partition {partition}")
+
+    def search(self, partition: str, query: str, k: int = 3) -> List:
+        """Similarity search within one partition, skipping tombstoned documents."""
+        vector_store, live_count, tombstones = self._load(partition)
+        if vector_store is None or live_count <= 0:
+            return []
+        # Over-fetch by the number of tombstones so deleted docs never crowd out live ones
+        fetch_k = min(k + len(tombstones), vector_store.index.ntotal)
+        results = vector_store.similarity_search(query, k=fetch_k)
+        if tombstones:
+            results = [doc for doc in results if doc.metadata.get(DOC_ID_KEY) not in tombstones]
+        return results[:k]
+
+    def compact(self, partition: str) -> None:
+        """Fold all segments into one, dropping tombstoned vectors."""
+        with self._file_lock(partition):
+            segments = self._segments(partition)
+            tombstones = self._read_tombstones(partition)
+            if len(segments) <= 1 and not tombstones:
+                return
+
+            embeddings = get_embeddings()
+            text_embeddings = []
+            metadatas = []
+            for name in segments:
+                segment = FAISS.load_local(
+                    os.path.join(self._partition_path(partition), name),
+                    embeddings,
+                    allow_dangerous_deserialization=True
+                )
+                for position, docstore_id in segment.index_to_docstore_id.items():
+                    doc = segment.docstore.search(docstore_id)
+                    if doc.metadata.get(DOC_ID_KEY) in tombstones:
+                        continue
+                    vector = segment.index.reconstruct(int(position)).tolist()
+                    text_embeddings.append((doc.page_content, vector))
+                    metadatas.append(dict(doc.metadata))
+
+            if text_embeddings:
+                merged = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+                self._write_segment(partition, merged)
+            for name in segments:
+                shutil.rmtree(os.path.join(self._partition_path(partition), name), ignore_errors=True)
+            self._write_tombstones(partition, [])
+        self._forget(partition)
+        logger.info(f"Compacted partition {partition}: {len(segments)} segments, "
+                    f"{len(tombstones)} tombstones -> {len(text_embeddings)} live documents")
+
+    def partitions(self) -> List[str]:
+        """List partition names present on disk."""
+        try:
+            return sorted(
+                name for name in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, name))
+            )
+        except FileNotFoundError:
+            return []
+
+    def compact_all(self, min_segments: int = 2) -> int:
+        """Compact every partition with enough segments or any tombstones. Returns count."""
+        compacted = 0
+        for partition in self.partitions():
+            if len(self._segments(partition)) >= min_segments or self._read_tombstones(partition):
+                self.compact(partition)
+                compacted += 1
+        return compacted
+
+
+def import_faiss_store(store: PartitionedVectorStore, vector_store,
+                       partition_for: Callable[[Dict], Optional[str]]) -> Dict[str, int]:
+    """Copy an existing FAISS store into partitions without re-embedding.
+
+    partition_for maps a document's metadata to its partition name (None skips it).
+    Returns the number of documents written per partition.
+    """
+    grouped: Dict[str, Tuple[list, list]] = {}
+    skipped = 0
+    for position, docstore_id in vector_store.index_to_docstore_id.items():
+        doc = vector_store.docstore.search(docstore_id)
+        if not hasattr(doc, 'metadata'):
+            skipped += 1
+            continue
+        partition = partition_for(doc.metadata)
+        if partition is None:
+            skipped += 1
+            continue
+        vector = vector_store.index.reconstruct(int(position)).tolist()
+        text_embeddings, metadatas = grouped.setdefault(partition, ([], []))
+        text_embeddings.append((doc.page_content, vector))
+        metadatas.append(dict(doc.metadata))
+
+    counts = {}
+    for partition, (text_embeddings, metadatas) in grouped.items():
+        store.add_embeddings(partition, text_embeddings, metadatas)
+        counts[partition] = len(text_embeddings)
+    if skipped:
+        logger.warning(f"Skipped {skipped} documents without a partition during import")
+    return counts
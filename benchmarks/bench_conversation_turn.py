@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+SQL statements, commits and latency of one /chat turn's database work.
+
+    python benchmarks/bench_conversation_turn.py
+    python benchmarks/bench_conversation_turn.py --history 500 --turns 200
+
+Compares the old per-turn sequence (get_conversation_by_id, get_chat_history,
+save_message for the user message and again for the reply) with
+load_turn + save_turn. The LLM call is left out. Statements are counted
+with sqlite3's trace callback on the request connection, against a
+throwaway database. Needs the app's dependencies.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask
+
+from app.utils.db import get_db, init_db
+from app.models.models import ConversationModel
+from app.utils.constants import MAX_MESSAGE_WINDOW, SUMMARY_THRESHOLD
+
+WINDOW = max(MAX_MESSAGE_WINDOW, SUMMARY_THRESHOLD) + 1
+
+
+def seed(history: int):
+    db = get_db()
+    user_id = db.execute(
+        '''INSERT INTO users (username, useremail, password, class_standard, medium, groq_api_key)
+           VALUES ('bench', 'bench@example.com', 'x', '10', 'English', 'x')'''
+    ).lastrowid
+    conversation_id = db.execute(
+        'INSERT INTO conversations (user_id, title) VALUES (?, ?)', (user_id, 'bench')
+    ).lastrowid
+    db.executemany(
+        'INSERT INTO chat_history (conversation_id, message, role) VALUES (?, ?, ?)',
+        [(conversation_id, f"message {i} " + "lorem ipsum " * 40, 'user' if i % 2 == 0 else 'bot')
+         for i in range(history)]
+    )
+    db.commit()
+    return user_id, conversation_id
+
+
+def old_turn(model: ConversationModel, conversation_id: int) -> None:
+    model.get_conversation_by_id(conversation_id)
+    model.get_chat_history(conversation_id)
+    model.save_message(conversation_id, "What is photosynthesis?", 'user')
+    model.save_message(conversation_id, "Photosynthesis is how plants make food.", 'bot')
+
+
+def new_turn(model: ConversationModel, conversation_id: int) -> None:
+    model.load_turn(conversation_id, limit=WINDOW)
+    model.save_turn(conversation_id, "What is photosynthesis?", "Photosynthesis is how plants make food.")
+
+
+def measure(name, turn, model, conversation_id, turns):
+    statements = []
+    db = get_db()
+    db.set_trace_callback(statements.append)
+    try:
+        turn(model, conversation_id)
+    finally:
+        db.set_trace_callback(None)
+    commits = sum(1 for sql in statements if sql.strip().upper().startswith('COMMIT'))
+    queries = len(statements) - commits - sum(1 for sql in statements if sql.strip().upper().startswith('BEGIN'))
+
+    latencies = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        turn(model, conversation_id)
+        latencies.append(time.perf_counter() - start)
+    p50 = statistics.median(latencies) * 1000
+    p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{name:<34} {queries:>2} statements  {commits} commits  p50 {p50:.2f} ms  p95 {p95:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--history', type=int, default=200, help='messages already in the conversation')
+    parser.add_argument('--turns', type=int, default=100, help='timed turns per variant')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        init_db(app)
+        with app.app_context():
+            user_id, conversation_id = seed(args.history)
+            model = ConversationModel(user_id)
+            print(f"conversation with {args.history} messages, window {WINDOW}")
+            measure('before (get + history + 2 saves)', old_turn, model, conversation_id, args.turns)
+            measure('after (load_turn + save_turn)', new_turn, model, conversation_id, args.turns)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Accuracy/latency of the local lesson completeness classifier vs. the LLM check.
+
+    python benchmarks/bench_lesson_completeness.py               # local classifier only
+    python benchmarks/bench_lesson_completeness.py --llm         # also time the Ollama check
+    python benchmarks/bench_lesson_completeness.py --samples logged.jsonl
+    python benchmarks/bench_lesson_completeness.py --from-db instance/chatbot.db
+
+--samples takes JSON lines of {"text": ..., "label": "yes"|"no"} (e.g. labelled
+interactive_chat responses); otherwise a built-in set of Prof. Potter style
+turns is used. --from-db adds the content of every finalized lesson in an
+app database as a "yes" sample: that is interactive_chat output the teacher
+kept as the lesson. Outlines and clarifying turns were never stored, so
+real "no" samples have to come from --samples.
+
+--llm also runs the LLM check alone (the prompt check_lesson_response sent on
+every turn before the local classifier) and check_lesson_response itself
+(local first, LLM when ambiguous) on the same samples. It needs the app's
+dependencies and a reachable Ollama.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import statistics
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_classifier():
+    """Import completeness.py directly so the local path runs without the model stack."""
+    path = os.path.join(ROOT, 'app', 'services', 'lesson', 'completeness.py')
+    spec = importlib.util.spec_from_file_location('lesson_completeness', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+TOPICS = [
+    ('Photosynthesis', 'chlorophyll', 'glucose'),
+    ("Newton's Second Law", 'force', 'acceleration'),
+    ('Fractions', 'numerator', 'denominator'),
+    ('The Water Cycle', 'evaporation', 'condensation'),
+    ('Ohm\'s Law', 'voltage', 'resistance'),
+    ('Cell Division', 'mitosis', 'chromosomes'),
+]
+
+PARAGRAPH = (
+    "Students begin by recalling what they already know about {a} and how it connects to {b}. "
+    "The teacher then explains, step by step, why {a} matters in everyday life, using a short "
+    "demonstration and asking students to predict what will happen before revealing the result. "
+    "Each idea builds on the previous one so there are no gaps in the reasoning."
+)
+
+
+def complete_lesson(topic, a, b, sections, closing=True):
+    parts = [f"# {topic} - Complete Lesson Plan", ""]
+    for title in sections:
+        parts += [f"## {title}", PARAGRAPH.format(a=a, b=b), PARAGRAPH.format(a=b, b=a), ""]
+    if closing:
+        parts.append("Does this lesson plan address your teaching objectives? Would you like me to adjust anything?")
+    return "\n".join(parts)
+
+
+def outline(topic, a, b, closing):
+    return "\n".join([
+        f"Here's an outline for **{topic}**:",
+        "",
+        "**Learning Objectives**",
+        f"- Define {a}",
+        f"- Explain the role of {b}",
+        "",
+        "**Main Topics**",
+        f"1. What is {a}?",
+        f"2. How {a} relates to {b}",
+        "3. Real-world examples",
+        "4. Practice questions",
+        "",
+        "**Assessment**",
+        "- Short quiz",
+        "- Exit ticket",
+        "",
+        closing,
+    ])
+
+
+def clarifying_turn(topic, a, b):
+    return (
+        f"Great question! I can interpret your request about {topic} in these ways: "
+        f"(1) a conceptual introduction to {a}, (2) a calculation-focused lesson on {b}, or "
+        f"(3) a lab-style activity. Which one matches your intent?"
+    )
+
+
+def prerequisite_turn(topic, a, b):
+    return (
+        f"For students to understand {topic}, they need to know {a} and {b}. "
+        "Would you like me to include prerequisite material in the lesson plan?"
+    )
+
+
+def progress_turn(topic, a, b):
+    return (
+        f"So far, I've covered what {a} is and why it matters for {topic}. "
+        + PARAGRAPH.format(a=a, b=b) + " " + PARAGRAPH.format(a=b, b=a)
+        + f" Next, I'll address {b}. Would you like me to start explaining {b} now?"
+    )
+
+
+def long_outline(topic, a, b):
+    # Long and heavily structured, but every section is a stub
+    lines = [f"# Proposed outline: {topic}", ""]
+    for i in range(1, 9):
+        lines += [f"## Section {i}: {a.title()} and {b} part {i}", f"- Key idea {i} about {a}", f"- Example {i} using {b}", ""]
+    lines.append("Should I generate the full lesson from this outline?")
+    return "\n".join(lines)
+
+
+def term_explanation(topic, a, b):
+    # Equation protocol step: one developed section, then a check-in
+    return "\n".join([
+        f"**Step 1: What {a} means**",
+        PARAGRAPH.format(a=a, b=b),
+        PARAGRAPH.format(a=a, b=topic),
+        PARAGRAPH.format(a=topic, b=b),
+        "",
+        f"Does this explanation of {a} work for your students, or should I simplify it further?",
+    ])
+
+
+def short_lesson(topic, a, b):
+    # A complete but compact lesson: three developed sections, no feedback question
+    return "\n".join([
+        f"## {topic}: Introduction", PARAGRAPH.format(a=a, b=b), "",
+        f"## Example", PARAGRAPH.format(a=b, b=a), "",
+        f"## Practice and Summary", PARAGRAPH.format(a=a, b=topic),
+    ])
+
+
+def builtin_samples():
+    samples = []
+    full_sections = ['Learning Objectives', 'Introduction', 'Key Concepts', 'Worked Examples',
+                     'Class Activity', 'Assessment', 'Summary']
+    for topic, a, b in TOPICS:
+        samples.append((complete_lesson(topic, a, b, full_sections), 'yes'))
+        samples.append((complete_lesson(topic, a, b, full_sections[:4], closing=False), 'yes'))
+        samples.append((outline(topic, a, b, "Does this outline work for you?"), 'no'))
+        samples.append((outline(topic, a, b, "Is this perfect now, or should I generate the full lesson?"), 'no'))
+        samples.append((clarifying_turn(topic, a, b), 'no'))
+        samples.append((prerequisite_turn(topic, a, b), 'no'))
+        samples.append((progress_turn(topic, a, b), 'no'))
+        samples.append((long_outline(topic, a, b), 'no'))
+        samples.append((term_explanation(topic, a, b), 'no'))
+        samples.append((short_lesson(topic, a, b), 'yes'))
+    return samples
+
+
+def finalized_lessons(database):
+    """Distinct finalized lesson contents from an app database, labelled "yes"."""
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            """SELECT DISTINCT content FROM lessons
+               WHERE status = 'finalized' AND length(trim(content)) > 200"""
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(row[0], 'yes') for row in rows]
+
+
+def summarize(name, latencies, correct, total, extra=""):
+    p50 = statistics.median(latencies) * 1000
+    p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{name:<28} accuracy {correct}/{total} ({100.0 * correct / total:.1f}%)  "
+          f"p50 {p50:.3f} ms  p95 {p95:.3f} ms{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--samples', help='JSON lines file of {"text", "label"}')
+    parser.add_argument('--from-db', help='app database whose finalized lessons are added as "yes" samples')
+    parser.add_argument('--llm', action='store_true', help='also run the Ollama structured-output check')
+    parser.add_argument('--repeat', type=int, default=200, help='timing repetitions for the local classifier')
+    args = parser.parse_args()
+
+    if args.samples:
+        with open(args.samples, 'r', encoding='utf-8') as f:
+            samples = [(row['text'], row['label']) for row in (json.loads(line) for line in f if line.strip())]
+    else:
+        samples = builtin_samples()
+    if args.from_db:
+        real = finalized_lessons(args.from_db)
+        print(f"{len(real)} finalized lessons from {args.from_db}")
+        samples += real
+    completeness = load_classifier()
+
+    latencies, correct, ambiguous, ambiguous_labels = [], 0, 0, []
+    for text, label in samples:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            verdict = completeness.classify_lesson_completeness(text)
+        latencies.append((time.perf_counter() - start) / args.repeat)
+        if verdict is None:
+            ambiguous += 1
+            ambiguous_labels.append(label)
+        elif verdict == label:
+            correct += 1
+        else:
+            features = completeness.lesson_completeness_features(text)
+            print(f"  misclassified (label {label}, got {verdict}): {features}")
+
+    decided = len(samples) - ambiguous
+    print(f"{len(samples)} samples, {decided} decided locally, {ambiguous} ambiguous (sent to the LLM)")
+    if decided:
+        summarize('local classifier (decided)', latencies, correct, decided)
+    if ambiguous_labels:
+        print(f"  ambiguous labels: {ambiguous_labels.count('yes')} yes / {ambiguous_labels.count('no')} no")
+
+    if args.llm:
+        from app.services.lesson.teacher_service import _llm_lesson_check, check_lesson_response
+        llm_latencies, llm_correct = [], 0
+        hybrid_latencies, hybrid_correct = [], 0
+        for text, label in samples:
+            start = time.perf_counter()
+            answer = _llm_lesson_check(text).complete_lesson
+            llm_latencies.append(time.perf_counter() - start)
+            llm_correct += answer == label
+
+            start = time.perf_counter()
+            hybrid = check_lesson_response(text, '').complete_lesson
+            hybrid_latencies.append(time.perf_counter() - start)
+            hybrid_correct += hybrid == label
+        summarize('LLM check (every turn)', llm_latencies, llm_correct, len(samples))
+        summarize('hybrid (local + fallback)', hybrid_latencies, hybrid_correct, len(samples),
+                  f"  LLM calls {ambiguous}/{len(samples)}")
+
+
+if __name__ == '__main__':
+    main()
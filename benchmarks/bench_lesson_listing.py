@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Response size and latency of the lesson listing queries.
+
+    python benchmarks/bench_lesson_listing.py
+    python benchmarks/bench_lesson_listing.py --lessons 500 --content-kb 100
+
+Seeds a teacher with --lessons public lessons whose content,
+original_content, draft_content and detailed_answer are filled to the
+given sizes. Then it compares full rows (l.*) with the summary projection
+for get_lessons_by_teacher, get_public_lessons and get_public_latest_lessons.
+Size is the JSON body the route would send. Uses a throwaway database and
+needs the app's dependencies.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask
+
+from app.utils.db import get_db, init_db
+from app.models.models import LessonModel
+
+
+def seed(lessons: int, content_kb: int):
+    db = get_db()
+    teacher_id = db.execute(
+        '''INSERT INTO users (username, useremail, password, class_standard, medium, groq_api_key, role)
+           VALUES ('bench', 'bench@example.com', 'x', '10', 'English', 'x', 'teacher')'''
+    ).lastrowid
+    body = ("Photosynthesis converts light energy into chemical energy. " * 20 * content_kb)[:content_kb * 1024]
+    for i in range(lessons):
+        LessonModel.create_lesson(
+            teacher_id=teacher_id,
+            title=f"Lesson {i}",
+            summary="A short summary of the lesson.",
+            learning_objectives="Understand the topic.",
+            focus_area="Science",
+            grade_level=str(6 + i % 6),
+            content=body,
+            draft_content=body[:len(body) // 2],
+            original_content=body,
+        )
+    db.execute('UPDATE lessons SET detailed_answer = ?', (body[:len(body) // 4],))
+    db.commit()
+    return teacher_id
+
+
+def measure(name, fetch, runs):
+    rows = fetch()
+    size = len(json.dumps({'success': True, 'lessons': rows}, default=str))
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        json.dumps({'success': True, 'lessons': fetch()}, default=str)
+        latencies.append(time.perf_counter() - start)
+    p50 = statistics.median(latencies) * 1000
+    print(f"{name:<36} {len(rows):>5} rows  {size / 1024:>10.1f} KB  p50 {p50:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--lessons', type=int, default=500, help='lessons owned by the teacher')
+    parser.add_argument('--content-kb', type=int, default=50, help='size of each lesson body in KB')
+    parser.add_argument('--runs', type=int, default=20, help='timed runs per query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        init_db(app)
+        with app.app_context():
+            teacher_id = seed(args.lessons, args.content_kb)
+            print(f"{args.lessons} lessons, {args.content_kb} KB content each")
+            for label, method, kwargs in (
+                ('get_lessons_by_teacher', LessonModel.get_lessons_by_teacher, {'teacher_id': teacher_id}),
+                ('get_public_lessons', LessonModel.get_public_lessons, {}),
+                ('get_public_latest_lessons', LessonModel.get_public_latest_lessons, {}),
+            ):
+                measure(f"{label} (full)", lambda: method(full=True, **kwargs), args.runs)
+                measure(f"{label} (summary)", lambda: method(**kwargs), args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Prompt tokens and latency of student lesson Q&A: full content vs retrieved chunks.
+
+    python benchmarks/bench_lesson_qa.py
+    python benchmarks/bench_lesson_qa.py --lesson-file lesson.md --llm
+
+For each question it prints the lesson tokens that go into the prompt.
+"full" is the whole lesson (the old path). "retrieved" is lesson_context()
+under LESSON_CONTEXT_TOKENS. Context-building time is printed for both.
+With --llm each variant is also sent to the configured Ollama model and
+the generation time is printed. Without --lesson-file a synthetic lesson
+of --sections sections is used. The index goes to a temporary directory.
+Needs the app's dependencies and, for --llm, a running Ollama server.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.config import Config
+from app.utils.context_budget import count_tokens
+from app.services.lesson import content_index
+
+QUESTIONS = [
+    "What is the role of chlorophyll?",
+    "How does the water cycle affect rainfall?",
+    "Can you explain section 7 again?",
+    "What are the products of photosynthesis?",
+    "Why do leaves change colour in autumn?",
+]
+
+PROMPT = """You are a helpful teaching assistant. Answer the student's question based on the lesson content.
+
+Lesson Content: {content}
+
+Student Question: {question}"""
+
+
+def synthetic_lesson(sections: int) -> str:
+    topics = ["photosynthesis and chlorophyll", "the water cycle and rainfall", "plant cells",
+              "seasons and leaf colour", "energy transfer in food chains"]
+    parts = []
+    for i in range(sections):
+        topic = topics[i % len(topics)]
+        parts.append(f"## Section {i + 1}: {topic}\n\n"
+                     + f"This section explains {topic} with examples and key terms. " * 12)
+    return "\n\n".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--lesson-file', help='markdown or text file to use as the lesson')
+    parser.add_argument('--sections', type=int, default=60, help='sections in the synthetic lesson')
+    parser.add_argument('--llm', action='store_true', help='also time generation on Ollama')
+    args = parser.parse_args()
+
+    if args.lesson_file:
+        with open(args.lesson_file, encoding='utf-8') as f:
+            content = f.read()
+    else:
+        content = synthetic_lesson(args.sections)
+    lesson = {'id': 1, 'content': content}
+
+    llm = None
+    if args.llm:
+        from app.services.lesson.student_service import StudentLessonService
+        llm = StudentLessonService(groq_api_key='').llm
+
+    with tempfile.TemporaryDirectory() as tmp:
+        content_index.lesson_content_index_store.root = tmp
+        start = time.perf_counter()
+        content_index.build_content_index(lesson['id'], content)
+        print(f"lesson: {count_tokens(content)} tokens, index built in {time.perf_counter() - start:.2f} s, "
+              f"budget {Config.LESSON_CONTEXT_TOKENS} tokens")
+
+        results = {'full': [], 'retrieved': []}
+        for question in QUESTIONS:
+            for variant in results:
+                start = time.perf_counter()
+                if variant == 'full':
+                    context = content
+                else:
+                    context, _ = content_index.lesson_context(lesson, question)
+                prompt = PROMPT.format(content=context, question=question)
+                build = time.perf_counter() - start
+                generate = 0.0
+                if llm is not None:
+                    start = time.perf_counter()
+                    llm.invoke(prompt)
+                    generate = time.perf_counter() - start
+                results[variant].append((count_tokens(prompt), build, generate))
+
+        for variant, rows in results.items():
+            tokens = statistics.mean(row[0] for row in rows)
+            build = statistics.median(row[1] for row in rows) * 1000
+            line = f"{variant:<10} prompt {tokens:>8.0f} tokens  context p50 {build:8.2f} ms"
+            if llm is not None:
+                line += f"  generation p50 {statistics.median(row[2] for row in rows):6.2f} s"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Tests for the SQLite-backed shared token buckets.
+
+    python -m pytest tests/test_rate_limiter.py
+
+Each test gets its own bucket file under pytest's tmp_path and a fake
+clock, so refill is checked without sleeping.
+"""
+import pytest
+
+from app.utils import rate_limiter
+from app.utils.rate_limiter import LLMRateLimiter, RateLimitError, SharedTokenBucket
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.slept = None
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept = seconds
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', fake)
+    return fake
+
+
+def make_limiter(tmp_path, user_rate=60, user_burst=2, global_rate=6000, global_burst=100, max_wait=5):
+    return LLMRateLimiter(
+        backend=SharedTokenBucket(str(tmp_path / 'rate_limits.db')),
+        user_rate_per_min=user_rate,
+        user_burst=user_burst,
+        global_rate_per_min=global_rate,
+        global_burst=global_burst,
+        max_wait=max_wait
+    )
+
+
+def test_user_bucket_refills_over_time(tmp_path, clock):
+    limiter = make_limiter(tmp_path, user_rate=60, user_burst=2)
+    assert limiter.try_acquire(1) == 0.0
+    assert limiter.try_acquire(1) == 0.0
+    # Burst spent: one token a second
+    assert limiter.try_acquire(1) == pytest.approx(1.0)
+    clock.now += 0.25
+    assert limiter.try_acquire(1) == pytest.approx(0.75)
+    clock.now += 0.75
+    assert limiter.try_acquire(1) == 0.0
+
+
+def test_users_have_separate_buckets(tmp_path, clock):
+    limiter = make_limiter(tmp_path, user_burst=1)
+    assert limiter.try_acquire(1) == 0.0
+    assert limiter.try_acquire(1) > 0
+    assert limiter.try_acquire(2) == 0.0
+
+
+def test_refill_is_capped_at_burst(tmp_path, clock):
+    limiter = make_limiter(tmp_path, user_rate=60, user_burst=2)
+    assert limiter.try_acquire(1) == 0.0
+    clock.now += 3600
+    assert limiter.try_acquire(1) == 0.0
+    assert limiter.try_acquire(1) == 0.0
+    assert limiter.try_acquire(1) == pytest.approx(1.0)
+
+
+def test_global_bucket_is_shared_by_all_users(tmp_path, clock):
+    limiter = make_limiter(tmp_path, user_burst=10, global_rate=30, global_burst=3)
+    for user_id in (1, 2, 3):
+        assert limiter.try_acquire(user_id) == 0.0
+    # Half a token a second globally
+    assert limiter.try_acquire(4) == pytest.approx(2.0)
+    clock.now += 2
+    assert limiter.try_acquire(4) == 0.0
+
+
+def test_rejected_request_takes_no_tokens(tmp_path, clock):
+    limiter = make_limiter(tmp_path, user_burst=1, global_rate=60, global_burst=2)
+    assert limiter.try_acquire(1) == 0.0
+    # User 1 is out of tokens, so the global token must not be spent either
+    assert limiter.try_acquire(1) > 0
+    assert limiter.try_acquire(2) == 0.0
+    assert limiter.try_acquire(3) == pytest.approx(1.0)
+
+
+def test_buckets_are_shared_between_instances(tmp_path, clock):
+    first = make_limiter(tmp_path, user_burst=1)
+    second = make_limiter(tmp_path, user_burst=1)
+    assert first.try_acquire(1) == 0.0
+    assert second.try_acquire(1) == pytest.approx(1.0)
+
+
+def test_acquire_waits_out_a_short_wait(tmp_path, clock):
+    limiter = make_limiter(tmp_path, user_rate=60, user_burst=1, max_wait=5)
+    limiter.acquire(1)
+    limiter.acquire(1)
+    assert clock.slept == pytest.approx(1.0)
+
+
+def test_acquire_raises_when_wait_exceeds_max_wait(tmp_path, clock):
+    limiter = make_limiter(tmp_path, user_rate=6, user_burst=1, max_wait=5)
+    limiter.acquire(1)
+    with pytest.raises(RateLimitError) as excinfo:
+        limiter.acquire(1)
+    assert excinfo.value.retry_after == pytest.approx(10.0)
+    assert clock.slept is None
+
+
+def test_fails_open_when_database_is_unavailable(tmp_path, clock):
+    # A regular file where the bucket directory should be
+    blocker = tmp_path / 'not_a_dir'
+    blocker.write_text('')
+    backend = SharedTokenBucket(str(blocker / 'rate_limits.db'))
+    with pytest.raises(Exception):
+        backend.try_acquire([('global', 1.0, 1.0)])
+
+    limiter = LLMRateLimiter(backend, 1, 1, 1, 1, max_wait=0)
+    for _ in range(3):
+        assert limiter.try_acquire(1) == 0.0
+        limiter.acquire(1)